@@ -0,0 +1,308 @@
+"""Computation of geometric metrics by workers that read conformers from the store."""
+
+import logging
+import os
+from typing import Any
+
+from openff.toolkit import Molecule
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from yammbs._db import (
+    DBMetricRecord,
+    DBMMConformerRecord,
+    DBMoleculeRecord,
+    DBQMConformerRecord,
+    _is_current,
+)
+from yammbs._molecule import _MoleculeCache
+
+LOGGER = logging.getLogger(__name__)
+
+# One read-only engine per store and process; keyed by process id too so that forked
+# workers do not reuse connections inherited from their parent
+_ENGINES: dict[tuple[int, str], Engine] = dict()
+
+# Molecules, keyed by mapped SMILES, so that workers handling several batches of a
+# molecule's conformers, or several stores, create it once per process
+_MOLECULES = _MoleculeCache()
+
+
+def _get_read_only_engine(database_path: str) -> Engine:
+    key = (os.getpid(), database_path)
+
+    if key not in _ENGINES:
+        _ENGINES[key] = create_engine(
+            f"sqlite:///file:{database_path}?mode=ro&uri=true",
+        )
+
+    return _ENGINES[key]
+
+
+def _get_molecule(mapped_smiles: str, molecule_cache_size: int) -> Molecule:
+    """Return the molecule with the given mapped SMILES from this process's cache."""
+    # the store's setting applies to the whole process, whichever store set it last
+    _MOLECULES.max_size = molecule_cache_size
+
+    return _MOLECULES.get(mapped_smiles)
+
+
+def _get_mapped_smiles(database_path: str, molecule_ids: list[int]) -> dict[int, str]:
+    """Read the mapped SMILES of the given molecules through a read-only connection."""
+    with Session(_get_read_only_engine(database_path)) as session:
+        return dict(
+            session.query(
+                DBMoleculeRecord.id,
+                DBMoleculeRecord.mapped_smiles,
+            ).filter(DBMoleculeRecord.id.in_(molecule_ids)),
+        )
+
+
+def _compute_molecule_metrics(
+    database_path: str,
+    force_field: str,
+    fingerprint: str | None,
+    metric: str,
+    molecule_ids: list[int],
+    molecule_cache_size: int = 1024,
+) -> list[tuple[int, int, Any]]:
+    """
+    Compute one metric ("rmsd", "tfd" or "icrmsd") for every conformer of the given
+    molecules, returning (molecule id, QCArchive ID, value) triples.
+
+    Mapped SMILES and coordinates are read here through a read-only connection to the
+    store, so only ids and results cross process boundaries. Only MM conformers of the
+    version of the force field given by `fingerprint` are used, paired with QM
+    conformers by QCArchive ID. Molecules for which TFD cannot be computed are logged,
+    and their values are NaN. At most `molecule_cache_size` molecules are kept in
+    memory for later calls in this process.
+    """
+    import numpy
+
+    from yammbs._internal_coordinates import _get_internal_coordinate_rmsds
+    from yammbs._tfd import _get_tfds
+    from yammbs.analysis import get_rmsds
+
+    # each computes a metric for all of a molecule's conformers in one batch
+    functions = {
+        "rmsd": get_rmsds,
+        "tfd": _get_tfds,
+        "icrmsd": _get_internal_coordinate_rmsds,
+    }
+
+    results = list()
+
+    with Session(_get_read_only_engine(database_path)) as session:
+        for molecule_id in molecule_ids:
+            inchi_key, mapped_smiles = (
+                session.query(
+                    DBMoleculeRecord.inchi_key,
+                    DBMoleculeRecord.mapped_smiles,
+                )
+                .filter_by(id=molecule_id)
+                .one()
+            )
+
+            qm_conformers = (
+                session.query(
+                    DBQMConformerRecord.qcarchive_id,
+                    DBQMConformerRecord.coordinates,
+                )
+                .filter_by(parent_id=molecule_id)
+                .order_by(DBQMConformerRecord.qcarchive_id)
+                .all()
+            )
+
+            mm_conformers = dict(
+                session.query(
+                    DBMMConformerRecord.qcarchive_id,
+                    DBMMConformerRecord.coordinates,
+                )
+                .filter_by(parent_id=molecule_id, force_field=force_field)
+                .filter(_is_current(DBMMConformerRecord.fingerprint, fingerprint)),
+            )
+
+            # QM conformers without an MM conformer, such as those whose minimization
+            # failed, are left out
+            pairs = [
+                (qcarchive_id, qm, mm_conformers[qcarchive_id])
+                for qcarchive_id, qm in qm_conformers
+                if qcarchive_id in mm_conformers
+            ]
+
+            if len(pairs) == 0:
+                continue
+
+            molecule = _get_molecule(mapped_smiles, molecule_cache_size)
+
+            try:
+                values = functions[metric](
+                    molecule,
+                    numpy.array([qm for _, qm, _ in pairs]),
+                    numpy.array([mm for _, _, mm in pairs]),
+                )
+            except Exception as error:
+                if metric != "tfd":
+                    raise
+
+                LOGGER.warning(f"Molecule {inchi_key} failed with {error}")
+
+                # reported so that the failure is stored and not tried again
+                values = [numpy.nan] * len(pairs)
+
+            results.extend(
+                (molecule_id, qcarchive_id, value)
+                for (qcarchive_id, _, _), value in zip(pairs, values)
+            )
+
+    return results
+
+
+def _compute_metric_rows(
+    database_path: str,
+    force_field: str,
+    fingerprint: str | None,
+    metrics: tuple[str, ...],
+    molecule_ids: list[int],
+    molecule_cache_size: int = 1024,
+) -> list[dict[str, Any]]:
+    """
+    Compute several metrics ("dde" and any of "rmsd", "tfd" and "icrmsd") for every
+    conformer of the given molecules in one pass, returning one row per conformer.
+
+    Each molecule and its conformers are loaded once through a read-only connection to
+    the store, and geometric metrics already stored with the MM conformers are reused.
+    As in `_compute_molecule_metrics`, only the current version of the force field is
+    used, conformers are paired by QCArchive ID and molecules are cached. Values that
+    cannot be computed, including DDEs of molecules with a single conformer or missing
+    MM conformers, are NaN.
+    """
+    import numpy
+
+    from yammbs.analysis import (
+        _compute_metrics,
+        _get_metric_columns,
+        _get_metric_version,
+    )
+
+    geometric = [metric for metric in metrics if metric != "dde"]
+    columns = _get_metric_columns(metrics)
+
+    rows = list()
+
+    with Session(_get_read_only_engine(database_path)) as session:
+        for molecule_id in molecule_ids:
+            (mapped_smiles,) = (
+                session.query(DBMoleculeRecord.mapped_smiles)
+                .filter_by(id=molecule_id)
+                .one()
+            )
+
+            qm_conformers = (
+                session.query(
+                    DBQMConformerRecord.qcarchive_id,
+                    DBQMConformerRecord.coordinates,
+                    DBQMConformerRecord.energy,
+                )
+                .filter_by(parent_id=molecule_id)
+                .order_by(DBQMConformerRecord.qcarchive_id)
+                .all()
+            )
+
+            mm_conformers = {
+                qcarchive_id: (coordinates, energy)
+                for (qcarchive_id, coordinates, energy) in session.query(
+                    DBMMConformerRecord.qcarchive_id,
+                    DBMMConformerRecord.coordinates,
+                    DBMMConformerRecord.energy,
+                )
+                .filter_by(parent_id=molecule_id, force_field=force_field)
+                .filter(_is_current(DBMMConformerRecord.fingerprint, fingerprint))
+            }
+
+            # values that could not be computed are stored as NULL
+            stored: dict[int, dict[str, float]] = dict()
+
+            for qcarchive_id, name, version, value in session.query(
+                DBMetricRecord.qcarchive_id,
+                DBMetricRecord.name,
+                DBMetricRecord.version,
+                DBMetricRecord.value,
+            ).filter(
+                DBMetricRecord.parent_id == molecule_id,
+                DBMetricRecord.force_field == force_field,
+                _is_current(DBMetricRecord.fingerprint, fingerprint),
+            ):
+                if name in columns and version == _get_metric_version(name):
+                    stored.setdefault(qcarchive_id, dict())[name] = (
+                        numpy.nan if value is None else value
+                    )
+
+            ddes: dict[int, float] = dict()
+
+            # as in MoleculeStore.get_dde, relative to the QM minimum
+            if "dde" in metrics and len(qm_conformers) > 1:
+                if all(id in mm_conformers for id, _, _ in qm_conformers):
+                    qm_energies = numpy.array(
+                        [energy for _, _, energy in qm_conformers],
+                    )
+                    mm_energies = numpy.array(
+                        [mm_conformers[id][1] for id, _, _ in qm_conformers],
+                    )
+
+                    minimum = qm_energies.argmin()
+
+                    differences = (mm_energies - mm_energies[minimum]) - (
+                        qm_energies - qm_energies[minimum]
+                    )
+                    differences[minimum] = numpy.nan
+
+                    ddes = {
+                        id: difference
+                        for (id, _, _), difference in zip(qm_conformers, differences)
+                    }
+
+            molecule = None
+
+            for qcarchive_id, qm, _ in qm_conformers:
+                if qcarchive_id not in mm_conformers:
+                    continue
+
+                row: dict[str, Any] = {
+                    "qcarchive_id": qcarchive_id,
+                    **dict.fromkeys(columns, numpy.nan),
+                }
+
+                if "dde" in metrics:
+                    row["dde"] = ddes.get(qcarchive_id, numpy.nan)
+
+                values = stored.get(qcarchive_id, dict())
+
+                missing = [
+                    metric
+                    for metric in geometric
+                    if not any(name in values for name in _get_metric_columns([metric]))
+                ]
+
+                if missing:
+                    if molecule is None:
+                        molecule = _get_molecule(mapped_smiles, molecule_cache_size)
+
+                    values = {
+                        **values,
+                        **_compute_metrics(
+                            molecule,
+                            qm,
+                            mm_conformers[qcarchive_id][0],
+                            missing,
+                        ),
+                    }
+
+                row.update(
+                    (name, value) for name, value in values.items() if name in columns
+                )
+
+                rows.append(row)
+
+    return rows
@@ -1,7 +1,22 @@
 import logging
-from typing import Dict, List
-
-from sqlalchemy import Column, Float, ForeignKey, Integer, PickleType, String
+from typing import Dict, List, Optional
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Float,
+    ForeignKey,
+    Integer,
+    LargeBinary,
+    PickleType,
+    String,
+    UniqueConstraint,
+    inspect,
+    or_,
+    text,
+    true,
+)
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base, relationship
 
 from yammbs.models import MMConformerRecord, QMConformerRecord
@@ -13,6 +28,46 @@ DB_VERSION = 1
 LOGGER = logging.getLogger(__name__)
 
 
+def _is_current(column: Column, fingerprint: Optional[str]):
+    """
+    Return a filter for rows whose force field `fingerprint` column matches the
+    current one. Rows stored without a fingerprint are taken to be current, as are all
+    rows if the force field could not be fingerprinted (`fingerprint` is None).
+    """
+    if fingerprint is None:
+        return true()
+
+    return or_(column == fingerprint, column.is_(None))
+
+
+def _add_missing_columns(engine: Engine):
+    """
+    Add nullable columns introduced since a database was created, which `create_all`
+    does not add to existing tables. Existing rows get NULL in them.
+    """
+    inspector = inspect(engine)
+
+    with engine.begin() as connection:
+        for table in DBBase.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+
+                LOGGER.info(f"Adding column {column.name} to table {table.name}")
+
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                        f"{column.type.compile(dialect=engine.dialect)}",
+                    ),
+                )
+
+
 class DBQMConformerRecord(DBBase):
     __tablename__ = "qm_conformers"
 
@@ -34,12 +89,214 @@ class DBMMConformerRecord(DBBase):
 
     qcarchive_id = Column(Integer, nullable=False)
     force_field = Column(String, nullable=False)
+    # the fingerprint of the force field, see `_get_force_field_fingerprint`; None for
+    # conformers stored without one, which are taken to be current
+    fingerprint = Column(String, nullable=True)
 
     mapped_smiles = Column(String, nullable=False)
     coordinates = Column(PickleType, nullable=False)
     energy = Column(Float, nullable=False)
 
 
+class DBMinimizationTiming(DBBase):
+    __tablename__ = "mm_timings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(Integer, ForeignKey("molecules.id"), nullable=False, index=True)
+
+    qcarchive_id = Column(Integer, nullable=False)
+    force_field = Column(String, nullable=False)
+
+    elapsed = Column(Float, nullable=False)
+
+
+class DBMetricRecord(DBBase):
+    __tablename__ = "metrics"
+    __table_args__ = (
+        UniqueConstraint(
+            "qcarchive_id",
+            "force_field",
+            "fingerprint",
+            "name",
+            "version",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(Integer, ForeignKey("molecules.id"), nullable=False, index=True)
+
+    qcarchive_id = Column(Integer, nullable=False, index=True)
+    force_field = Column(String, nullable=False, index=True)
+    # as for MM conformers
+    fingerprint = Column(String, nullable=True)
+
+    name = Column(String, nullable=False)
+    version = Column(Integer, nullable=False)
+    # None if the metric could not be computed, so that it is not tried again
+    value = Column(Float, nullable=True)
+
+
+class DBParameterLabelRun(DBBase):
+    """Records that a molecule has been labelled by a force field, even if it failed."""
+
+    __tablename__ = "parameter_label_runs"
+    __table_args__ = (UniqueConstraint("parent_id", "fingerprint"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(Integer, ForeignKey("molecules.id"), nullable=False, index=True)
+
+    # the fingerprint of the force field, see `_get_force_field_fingerprint`
+    fingerprint = Column(String, nullable=False, index=True)
+    success = Column(Boolean, nullable=False)
+
+
+class DBParameterLabel(DBBase):
+    __tablename__ = "parameter_labels"
+    __table_args__ = (
+        UniqueConstraint("parent_id", "fingerprint", "handler", "parameter_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(Integer, ForeignKey("molecules.id"), nullable=False, index=True)
+
+    fingerprint = Column(String, nullable=False, index=True)
+    handler = Column(String, nullable=False)
+    parameter_id = Column(String, nullable=False, index=True)
+    # the number of atom groups in the molecule the parameter is applied to
+    count = Column(Integer, nullable=False)
+
+
+class DBTuningRecord(DBBase):
+    __tablename__ = "tuning"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    host = Column(String, nullable=False, index=True)
+    n_cpus = Column(Integer, nullable=False)
+    memory_budget = Column(Integer, nullable=True)
+
+    n_processes = Column(Integer, nullable=False)
+    n_threads = Column(Integer, nullable=False)
+    chunksize = Column(Integer, nullable=False)
+    throughput = Column(Float, nullable=False)
+
+
+class DBWorkLease(DBBase):
+    __tablename__ = "work_leases"
+    __table_args__ = (UniqueConstraint("qm_conformer_id", "force_field"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    qm_conformer_id = Column(
+        Integer,
+        ForeignKey("qm_conformers.id"),
+        nullable=False,
+        index=True,
+    )
+
+    force_field = Column(String, nullable=False)
+
+    owner = Column(String, nullable=False, index=True)
+    expires = Column(Float, nullable=False)
+
+
+class DBMoleculeDescriptors(DBBase):
+    __tablename__ = "molecule_descriptors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(
+        Integer,
+        ForeignKey("molecules.id"),
+        nullable=False,
+        unique=True,
+        index=True,
+    )
+
+    n_atoms = Column(Integer, nullable=False, index=True)
+    n_heavy_atoms = Column(Integer, nullable=False, index=True)
+    n_rotatable_bonds = Column(Integer, nullable=False, index=True)
+    n_rings = Column(Integer, nullable=False, index=True)
+    formal_charge = Column(Integer, nullable=False, index=True)
+    molecular_weight = Column(Float, nullable=False, index=True)
+
+
+class DBMoleculeElement(DBBase):
+    __tablename__ = "molecule_elements"
+    __table_args__ = (UniqueConstraint("parent_id", "element"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(Integer, ForeignKey("molecules.id"), nullable=False, index=True)
+
+    element = Column(String, nullable=False, index=True)
+
+
+class DBFunctionalGroupAnalysis(DBBase):
+    """Records that a classifier has been run on a molecule, even if it failed."""
+
+    __tablename__ = "functional_group_analyses"
+    __table_args__ = (UniqueConstraint("parent_id", "classifier"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(Integer, ForeignKey("molecules.id"), nullable=False, index=True)
+
+    classifier = Column(String, nullable=False, index=True)
+    success = Column(Boolean, nullable=False)
+
+
+class DBFunctionalGroup(DBBase):
+    __tablename__ = "functional_groups"
+    __table_args__ = (UniqueConstraint("parent_id", "classifier", "environment"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(Integer, ForeignKey("molecules.id"), nullable=False, index=True)
+
+    classifier = Column(String, nullable=False, index=True)
+    # the value of a `ChemicalEnvironment`
+    environment = Column(String, nullable=False, index=True)
+    count = Column(Integer, nullable=False)
+
+
+class DBMoleculeFingerprint(DBBase):
+    __tablename__ = "molecule_fingerprints"
+    __table_args__ = (UniqueConstraint("parent_id", "kind"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(Integer, ForeignKey("molecules.id"), nullable=False, index=True)
+
+    kind = Column(String, nullable=False, index=True)
+    # packed bits, as from `numpy.packbits`
+    bits = Column(LargeBinary, nullable=False)
+
+
+class DBSmirksMatch(DBBase):
+    __tablename__ = "smirks_matches"
+    __table_args__ = (UniqueConstraint("parent_id", "smirks"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(Integer, ForeignKey("molecules.id"), nullable=False, index=True)
+
+    smirks = Column(String, nullable=False, index=True)
+    match = Column(Boolean, nullable=False)
+
+
+class DBSelectionIndex(DBBase):
+    """A compressed bitmap, indexed by molecule id, of the molecules matching a query."""
+
+    __tablename__ = "selection_index"
+    __table_args__ = (UniqueConstraint("kind", "key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # e.g. "smirks" or "functional_group:smarts", and the pattern or group
+    kind = Column(String, nullable=False, index=True)
+    key = Column(String, nullable=False, index=True)
+
+    # the number of molecules, and the largest molecule id, when the bitmap was made
+    n_molecules = Column(Integer, nullable=False)
+    max_molecule_id = Column(Integer, nullable=False)
+
+    bitmap = Column(LargeBinary, nullable=False)
+
+
 class DBMoleculeRecord(DBBase):
     __tablename__ = "molecules"
 
@@ -0,0 +1,53 @@
+"""Per-molecule descriptors, computed once when first needed and queried as SQL."""
+
+from typing import Any
+
+# Descriptor columns of the molecule_descriptors table, which `filter_by_descriptors`
+# accepts as keywords
+_DESCRIPTORS = (
+    "n_atoms",
+    "n_heavy_atoms",
+    "n_rotatable_bonds",
+    "n_rings",
+    "formal_charge",
+    "molecular_weight",
+)
+
+
+def _compute_descriptors(mapped_smiles: str) -> dict[str, Any]:
+    """
+    Compute the descriptors of one molecule, and the set of its elements (as symbols),
+    from its mapped SMILES.
+    """
+    from openff.toolkit import Molecule
+    from openff.units import unit
+
+    molecule = Molecule.from_mapped_smiles(mapped_smiles, allow_undefined_stereo=True)
+
+    return {
+        "n_atoms": molecule.n_atoms,
+        "n_heavy_atoms": sum(atom.atomic_number != 1 for atom in molecule.atoms),
+        "n_rotatable_bonds": len(molecule.find_rotatable_bonds()),
+        "n_rings": len(molecule.rings),
+        "formal_charge": round(molecule.total_charge.m_as(unit.elementary_charge)),
+        "molecular_weight": sum(atom.mass.m_as(unit.dalton) for atom in molecule.atoms),
+        "elements": sorted({atom.symbol for atom in molecule.atoms}),
+    }
+
+
+def _compute_molecule_descriptors(
+    database_path: str,
+    molecule_ids: list[int],
+) -> list[tuple[int, dict[str, Any]]]:
+    """
+    Compute descriptors for the given molecules, returning (molecule id, descriptors)
+    pairs. Mapped SMILES are read here through a read-only connection to the store.
+    """
+    from yammbs._analyze import _get_mapped_smiles
+
+    mapped_smiles = _get_mapped_smiles(database_path, molecule_ids)
+
+    return [
+        (molecule_id, _compute_descriptors(mapped_smiles[molecule_id]))
+        for molecule_id in molecule_ids
+    ]
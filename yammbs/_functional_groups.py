@@ -0,0 +1,501 @@
+"""Functional groups of molecules, found once per molecule and stored for indexed queries."""
+
+import functools
+from typing import TYPE_CHECKING
+
+from yammbs.checkmol import ChemicalEnvironment as CE
+
+if TYPE_CHECKING:
+    from rdkit import Chem
+
+# Carbon of carboxylic acid derivatives, R-C(=X)-Y with R a carbon or hydrogen
+_ACYL = "[CX3;$(C[#6]),$([CH1])]"
+# Carbon of aldehydes, ketones and imines, with only carbon or hydrogen substituents
+_OXO = "[CX3;$(C([#6])[#6]),$([CH1][#6]),$([CH2])]"
+# Nitrogen of amines, bonded only to carbon and hydrogen and not to a carbon bearing
+# a heteroatom or multiple bond
+_AMINE = "NX3;!$(N~[!#6]);!$(N[#6]=[!#6]);!$(N[#6]#*);!$(N[CX3]=[CX3])"
+_HALOGEN = "[F,Cl,Br,I]"
+_HETERO = "[O,S,N,F,Cl,Br,I]"
+
+# SMARTS patterns of checkmol's functional groups (see
+# https://homepage.univie.ac.at/norbert.haider/cheminf/fgtable.pdf). The first atom
+# of each pattern is the center of the group, by which groups are counted. Groups
+# are also found from those of their subgroups in `_PARENTS`.
+_SMARTS: dict[CE, tuple[str, ...]] = {
+    CE.Cation: ("[+;!$([+]~[-]);!$([+]~*~[-])]",),
+    CE.Anion: ("[-;!$([-]~[+]);!$([-]~*~[+])]",),
+    CE.Aldehyde: ("[CX3H1](=[OX1])[#6]", "[CX3H2]=[OX1]"),
+    CE.Ketone: ("[CX3](=[OX1])([#6])[#6]",),
+    CE.Thioaldehyde: ("[CX3H1](=[SX1])[#6]", "[CX3H2]=[SX1]"),
+    CE.Thioketone: ("[CX3](=[SX1])([#6])[#6]",),
+    CE.Imine: (f"{_OXO}=[NX2;$(N[#6]),$([NH1])]",),
+    CE.Hydrazone: (f"{_OXO}=[NX2][NX3]",),
+    CE.Semicarbazone: (f"{_OXO}=[NX2][NX3][CX3](=[OX1])[NX3]",),
+    CE.Thiosemicarbazone: (f"{_OXO}=[NX2][NX3][CX3](=[SX1])[NX3]",),
+    CE.Oxime: (f"{_OXO}=[NX2][OX2H1]",),
+    CE.OximeEther: (f"{_OXO}=[NX2][OX2][#6]",),
+    CE.Ketene: ("[CX2](=[CX3])=[OX1]",),
+    CE.KeteneAcetalDeriv: ("[CX3](=[CX3])([OX2,NX3,SX2])[OX2,NX3,SX2]",),
+    CE.CarbonylHydrate: ("[CX4;z2]([OX2H1])[OX2H1]",),
+    CE.Hemiacetal: ("[CX4;z2]([OX2H1])[OX2][#6]",),
+    CE.Acetal: ("[CX4;z2]([OX2][#6])[OX2][#6]",),
+    CE.Hemiaminal: ("[CX4;z2]([OX2H1])[NX3]",),
+    CE.Aminal: ("[CX4;z2]([NX3])[NX3]",),
+    CE.Thiohemiaminal: ("[CX4;z2]([SX2])[NX3]",),
+    CE.Thioacetal: ("[CX4;z2]([SX2][#6])[SX2,OX2][#6]",),
+    CE.Enamine: ("[NX3;!$(N~[!#6]);!$(N[#6]=[!#6])][CX3]=[CX3]",),
+    CE.Enol: ("[OX2H1][CX3]=[CX3]",),
+    CE.Enolether: ("[OX2]([#6;!$([#6]=[!#6])])[CX3]=[CX3]",),
+    CE.PrimaryAlcohol: ("[OX2H1][CX4;z1;H2,H3]",),
+    CE.SecondaryAlcohol: ("[OX2H1][CX4;z1;H1]",),
+    CE.TertiaryAlcohol: ("[OX2H1][CX4;z1;H0]",),
+    CE.Diol_1_2: ("[OX2H1][CX4;z1][CX4;z1][OX2H1]",),
+    CE.Aminoalcohol_1_2: (f"[OX2H1][CX4;z1][CX4;z1][{_AMINE}]",),
+    CE.Phenol: ("[OX2H1]c",),
+    CE.Diphenol_1_2: ("[OX2H1]c:c[OX2H1]",),
+    CE.Enediol: ("[OX2H1][CX3]=[CX3][OX2H1]",),
+    CE.Dialkylether: ("[OX2]([CX4;z1])[CX4;z1]",),
+    CE.Alkylarylether: ("[OX2]([CX4;z1])c",),
+    CE.Diarylether: ("[OX2](c)c",),
+    CE.Thioether: ("[SX2]([#6;!$([#6]=[!#6])])[#6;!$([#6]=[!#6])]",),
+    CE.Disulfide: ("[SX2]([#6])[SX2][#6]",),
+    CE.Peroxide: ("[OX2]([#6])[OX2][#6]",),
+    CE.Hydroperoxide: ("[OX2H1][OX2]",),
+    CE.Hydrazine: ("[NX3;!$(N[#6]=[!#6])][NX3;!$(N[#6]=[!#6])]",),
+    CE.Hydroxylamine: ("[NX3;!$(N[#6]=[!#6])][OX2;!$(O[#6]=[!#6])]",),
+    CE.PrimaryAliphAmine: (f"[{_AMINE};H2][CX4]",),
+    CE.PrimaryAromAmine: (f"[{_AMINE};H2]c",),
+    CE.SecondaryAliphAmine: (f"[{_AMINE};H1]([CX4])[CX4]",),
+    CE.SecondaryMixedAmine: (f"[{_AMINE};H1]([CX4])c",),
+    CE.SecondaryAromAmine: (f"[{_AMINE};H1](c)c",),
+    CE.TertiaryAliphAmine: (f"[{_AMINE};H0]([CX4])([CX4])[CX4]",),
+    CE.TertiaryMixedAmine: (f"[{_AMINE};H0;$(N[CX4]);$(Nc)]",),
+    CE.TertiaryAromAmine: (f"[{_AMINE};H0](c)(c)c",),
+    CE.QuartAmmonium: ("[NX4+;H0;!$(N~[!#6])]",),
+    CE.NOxide: ("[#7+;!$([#7+]=O)][OX1-]",),
+    CE.HalogenDeriv: ("[F,Cl,Br,I][#6;!$([#6]=[!#6])]",),
+    CE.AlkylFluoride: ("[F][CX4]",),
+    CE.AlkylChloride: ("[Cl][CX4]",),
+    CE.AlkylBromide: ("[Br][CX4]",),
+    CE.AlkylIodide: ("[I][CX4]",),
+    CE.ArylFluoride: ("[F]c",),
+    CE.ArylChloride: ("[Cl]c",),
+    CE.ArylBromide: ("[Br]c",),
+    CE.ArylIodide: ("[I]c",),
+    CE.Organometallic: (
+        "[Na,K,Be,Ca,Al,Ti,Cr,Mn,Fe,Co,Ni,Cu,Zn,Pd,Ag,Cd,Sn,Pt,Hg,Pb]~[#6]",
+    ),
+    CE.Organolithium: ("[Li]~[#6]",),
+    CE.Organomagnesium: ("[Mg]~[#6]",),
+    CE.CarboxylicAcid: (f"{_ACYL}(=[OX1])[OX2H1]",),
+    CE.CarboxylicAcidSalt: (f"{_ACYL}(=[OX1])[OX1-]",),
+    CE.CarboxylicAcidEster: (f"{_ACYL}(=[OX1])[OX2][#6]",),
+    CE.Lactone: (f"{_ACYL.replace('CX3', 'CX3;R')}(=[OX1])@[OX2;R][#6]",),
+    CE.CarboxylicAcidPrimaryAmide: (f"{_ACYL}(=[OX1])[NX3H2]",),
+    CE.CarboxylicAcidSecondaryAmide: (f"{_ACYL}(=[OX1])[NX3H1][#6]",),
+    CE.CarboxylicAcidTertiaryAmide: (f"{_ACYL}(=[OX1])[NX3H0]([#6])[#6]",),
+    CE.Lactam: (f"{_ACYL.replace('CX3', 'CX3;R')}(=[OX1])@[NX3;R]",),
+    CE.CarboxylicAcidHydrazide: (f"{_ACYL}(=[OX1])[NX3][NX3]",),
+    CE.CarboxylicAcidAzide: (f"{_ACYL}(=[OX1])[NX2]=[NX2+]=[NX1-]",),
+    CE.HydroxamicAcid: (f"{_ACYL}(=[OX1])[NX3][OX2H1]",),
+    CE.CarboxylicAcidAmidine: (f"{_ACYL}(=[NX2;!$(N[!#6])])[NX3;!$(N[!#6])]",),
+    CE.CarboxylicAcidAmidrazone: (
+        f"{_ACYL}(=[NX2])[NX3][NX3]",
+        f"{_ACYL}(=[NX2][NX3])[NX3]",
+    ),
+    CE.Nitrile: ("[CX2;$(C[#6]),$([CH1])]#[NX1]",),
+    CE.AcylFluoride: (f"{_ACYL}(=[OX1])F",),
+    CE.AcylChloride: (f"{_ACYL}(=[OX1])Cl",),
+    CE.AcylBromide: (f"{_ACYL}(=[OX1])Br",),
+    CE.AcylIodide: (f"{_ACYL}(=[OX1])I",),
+    CE.AcylCyanide: (f"{_ACYL}(=[OX1])C#N",),
+    CE.ImidoEster: (f"{_ACYL}(=[NX2])[OX2][#6]",),
+    CE.ImidoylHalide: (f"{_ACYL}(=[NX2]){_HALOGEN}",),
+    CE.ThiocarboxylicAcid: (
+        f"{_ACYL}(=[SX1])[OX2H1,SX2H1]",
+        f"{_ACYL}(=[OX1])[SX2H1]",
+    ),
+    CE.ThiocarboxylicAcidEster: (
+        f"{_ACYL}(=[SX1])[OX2,SX2][#6]",
+        f"{_ACYL}(=[OX1])[SX2][#6]",
+    ),
+    CE.Thiolactone: (
+        f"{_ACYL.replace('CX3', 'CX3;R')}(=[SX1])@[OX2,SX2;R]",
+        f"{_ACYL.replace('CX3', 'CX3;R')}(=[OX1])@[SX2;R]",
+    ),
+    CE.ThiocarboxylicAcidAmide: (f"{_ACYL}(=[SX1])[NX3]",),
+    CE.Thiolactam: (f"{_ACYL.replace('CX3', 'CX3;R')}(=[SX1])@[NX3;R]",),
+    CE.ImidoThioester: (f"{_ACYL}(=[NX2])[SX2][#6]",),
+    CE.Oxohetarene: ("[#6;a]=[OX1]",),
+    CE.Thioxohetarene: ("[#6;a]=[SX1]",),
+    CE.Iminohetarene: ("[#6;a]=[NX2]",),
+    CE.CarboxylicAcidOrthoester: (
+        "[CX4;$(C[#6]),$([CH1])]([OX2][#6])([OX2][#6])[OX2][#6]",
+    ),
+    CE.CarboxylicAcidAmideAcetal: (
+        "[CX4;$(C[#6]),$([CH1])]([OX2][#6])([OX2][#6])[NX3]",
+    ),
+    CE.CarboxylicAcidAnhydride: ("[OX2]([CX3]=[OX1])[CX3]=[OX1]",),
+    CE.CarboxylicAcidUnsubstImide: ("[NX3H1]([CX3]=[OX1])[CX3]=[OX1]",),
+    CE.CarboxylicAcidSubstImide: ("[NX3H0]([CX3]=[OX1])([CX3]=[OX1])[#6]",),
+    CE.Co2Deriv: ("[CX3;z3]", "[CX2](=[OX1])=[OX1]"),
+    CE.CarbonicAcidMonoester: ("[CX3](=[OX1])([OX2H1,OX1-])[OX2][#6]",),
+    CE.CarbonicAcidDiester: ("[CX3](=[OX1])([OX2][#6])[OX2][#6]",),
+    CE.CarbonicAcidEsterHalide: (f"[CX3](=[OX1])([OX2][#6]){_HALOGEN}",),
+    CE.CarbonicAcidDeriv: ("[CX3](=[OX1])([OX2,F,Cl,Br,I])[OX2,F,Cl,Br,I]",),
+    CE.ThiocarbonicAcidMonoester: (
+        "[CX3;$(C~[#16])](=[OX1,SX1])([OX2H1,SX2H1,OX1-,SX1-])[OX2,SX2][#6]",
+    ),
+    CE.ThiocarbonicAcidDiester: (
+        "[CX3;$(C~[#16])](=[OX1,SX1])([OX2,SX2][#6])[OX2,SX2][#6]",
+    ),
+    CE.ThiocarbonicAcidEsterHalide: (
+        f"[CX3;$(C~[#16])](=[OX1,SX1])([OX2,SX2][#6]){_HALOGEN}",
+    ),
+    CE.ThiocarbonicAcidDeriv: (
+        "[CX3;$(C~[#16])](=[OX1,SX1])([OX2,SX2,F,Cl,Br,I])[OX2,SX2,F,Cl,Br,I]",
+    ),
+    CE.CarbamicAcid: ("[CX3](=[OX1])([NX3])[OX2H1,OX1-]",),
+    CE.CarbamicAcidEster: ("[CX3](=[OX1])([NX3])[OX2][#6]",),
+    CE.CarbamicAcidHalide: (f"[CX3](=[OX1])([NX3]){_HALOGEN}",),
+    CE.ThiocarbamicAcid: (
+        "[CX3;$(C~[#16])](=[OX1,SX1])([NX3])[OX2H1,SX2H1,OX1-,SX1-]",
+    ),
+    CE.ThiocarbamicAcidEster: ("[CX3;$(C~[#16])](=[OX1,SX1])([NX3])[OX2,SX2][#6]",),
+    CE.ThiocarbamicAcidHalide: (f"[CX3;$(C~[#16])](=[OX1,SX1])([NX3]){_HALOGEN}",),
+    CE.Urea: ("[CX3](=[OX1])([NX3])[NX3]",),
+    CE.Isourea: ("[CX3](=[NX2])([NX3])[OX2]",),
+    CE.Thiourea: ("[CX3](=[SX1])([NX3])[NX3]",),
+    CE.Isothiourea: ("[CX3](=[NX2])([NX3])[SX2]",),
+    CE.Guanidine: ("[CX3](=[NX2])([NX3])[NX3]",),
+    CE.Semicarbazide: ("[CX3](=[OX1])([NX3])[NX3][NX3]",),
+    CE.Thiosemicarbazide: ("[CX3](=[SX1])([NX3])[NX3][NX3]",),
+    CE.Azide: ("[NX2]=[NX2+]=[NX1-]",),
+    CE.AzoCompound: ("[NX2]([#6])=[NX2][#6]",),
+    CE.DiazoniumSalt: ("[NX2+](#[NX1])[#6]",),
+    CE.Isonitrile: ("[NX2+]#[CX1-]",),
+    CE.Cyanate: ("[CX2](#[NX1])[OX2]",),
+    CE.Isocyanate: ("[NX2]=[CX2]=[OX1]",),
+    CE.Thiocyanate: ("[CX2](#[NX1])[SX2]",),
+    CE.Isothiocyanate: ("[NX2]=[CX2]=[SX1]",),
+    CE.Carbodiimide: ("[CX2](=[NX2])=[NX2]",),
+    CE.NitrosoCompound: ("[NX2](=[OX1])[#6]",),
+    CE.NitroCompound: ("[NX3+](=[OX1])([OX1-])[#6]", "[NX3](=[OX1])(=[OX1])[#6]"),
+    CE.Nitrite: ("[NX2](=[OX1])[OX2][#6]",),
+    CE.Nitrate: ("[NX3+](=[OX1])([OX1-])[OX2]", "[NX3](=[OX1])(=[OX1])[OX2]"),
+    CE.SulfuricAcid: ("[SX4](=[OX1])(=[OX1])([OX2H1,OX1-])[OX2H1,OX1-]",),
+    CE.SulfuricAcidMonoester: ("[SX4](=[OX1])(=[OX1])([OX2H1,OX1-])[OX2][#6]",),
+    CE.SulfuricAcidDiester: ("[SX4](=[OX1])(=[OX1])([OX2][#6])[OX2][#6]",),
+    CE.SulfuricAcidAmideEster: ("[SX4](=[OX1])(=[OX1])([NX3])[OX2][#6]",),
+    CE.SulfuricAcidAmide: ("[SX4](=[OX1])(=[OX1])([NX3])[OX2H1,OX1-]",),
+    CE.SulfuricAcidDiamide: ("[SX4](=[OX1])(=[OX1])([NX3])[NX3]",),
+    CE.SulfurylHalide: (f"[SX4](=[OX1])(=[OX1])({_HALOGEN})[OX2,OX1-,NX3,F,Cl,Br,I]",),
+    CE.SulfonicAcid: ("[SX4](=[OX1])(=[OX1])([#6])[OX2H1,OX1-]",),
+    CE.SulfonicAcidEster: ("[SX4](=[OX1])(=[OX1])([#6])[OX2][#6]",),
+    CE.Sulfonamide: ("[SX4](=[OX1])(=[OX1])([#6])[NX3]",),
+    CE.SulfonylHalide: (f"[SX4](=[OX1])(=[OX1])([#6]){_HALOGEN}",),
+    CE.Sulfone: ("[SX4](=[OX1])(=[OX1])([#6])[#6]",),
+    CE.Sulfoxide: ("[SX3](=[OX1])([#6])[#6]", "[SX3+]([OX1-])([#6])[#6]"),
+    CE.SulfinicAcid: ("[SX3](=[OX1])([#6])[OX2H1,OX1-]",),
+    CE.SulfinicAcidEster: ("[SX3](=[OX1])([#6])[OX2][#6]",),
+    CE.SulfinicAcidHalide: (f"[SX3](=[OX1])([#6]){_HALOGEN}",),
+    CE.SulfinicAcidAmide: ("[SX3](=[OX1])([#6])[NX3]",),
+    CE.SulfenicAcid: ("[SX2]([#6])[OX2H1]",),
+    CE.SulfenicAcidEster: ("[SX2]([#6])[OX2][#6]",),
+    CE.SulfenicAcidHalide: (f"[SX2]([#6]){_HALOGEN}",),
+    CE.SulfenicAcidAmide: ("[SX2]([#6])[NX3]",),
+    CE.Alkylthiol: ("[SX2H1][#6;!a;!$([#6]=[!#6])]",),
+    CE.Arylthiol: ("[SX2H1]c",),
+    CE.PhosphoricAcid: ("[PX4](=[OX1])([OX2H1,OX1-])([OX2H1,OX1-])[OX2H1,OX1-]",),
+    CE.PhosphoricAcidEster: ("[PX4](=[OX1])([OX2,OX1-])([OX2,OX1-])[OX2][#6]",),
+    CE.PhosphoricAcidHalide: (f"[PX4](=[OX1])({_HETERO})({_HETERO}){_HALOGEN}",),
+    CE.PhosphoricAcidAmide: (f"[PX4](=[OX1])({_HETERO})({_HETERO})[NX3]",),
+    CE.ThiophosphoricAcid: (
+        "[PX4;$(P~[#16])](=[OX1,SX1])([OX2H1,SX2H1,OX1-,SX1-])([OX2H1,SX2H1,OX1-,SX1-])"
+        "[OX2H1,SX2H1,OX1-,SX1-]",
+    ),
+    CE.ThiophosphoricAcidEster: (
+        f"[PX4;$(P~[#16])](=[OX1,SX1])({_HETERO})({_HETERO})[OX2,SX2][#6]",
+    ),
+    CE.ThiophosphoricAcidHalide: (
+        f"[PX4;$(P~[#16])](=[OX1,SX1])({_HETERO})({_HETERO}){_HALOGEN}",
+    ),
+    CE.ThiophosphoricAcidAmide: (
+        f"[PX4;$(P~[#16])](=[OX1,SX1])({_HETERO})({_HETERO})[NX3]",
+    ),
+    CE.PhosphonicAcid: ("[PX4](=[OX1])([#6])([OX2H1,OX1-])[OX2H1,OX1-]",),
+    CE.PhosphonicAcidEster: ("[PX4](=[OX1])([#6])([OX2,OX1-])[OX2][#6]",),
+    CE.Phosphine: ("[PX3;!$(P~[!#6])]",),
+    CE.Phosphinoxide: ("[PX4](=[OX1])([#6])([#6])[#6]",),
+    CE.BoronicAcid: ("[BX3]([#6])([OX2H1])[OX2H1]",),
+    CE.BoronicAcidEster: ("[BX3]([#6])([OX2])[OX2][#6]",),
+    CE.Alkene: ("[CX3]=[CX3]",),
+    CE.Alkyne: ("[CX2]#[CX2]",),
+    CE.AlphaAminoacid: ("[CX4]([NX3,NX4+])[CX3](=[OX1])[OX2H1,OX1-]",),
+    CE.AlphaHydroxyacid: ("[CX4]([OX2H1])[CX3](=[OX1])[OX2H1,OX1-]",),
+}
+
+# Groups checkmol reports along with each of their subgroups
+_PARENTS: dict[CE, CE] = {
+    CE.Aldehyde: CE.Carbonyl,
+    CE.Ketone: CE.Carbonyl,
+    CE.Thioaldehyde: CE.Thiocarbonyl,
+    CE.Thioketone: CE.Thiocarbonyl,
+    CE.Alcohol: CE.Hydroxy,
+    CE.Phenol: CE.Hydroxy,
+    CE.PrimaryAlcohol: CE.Alcohol,
+    CE.SecondaryAlcohol: CE.Alcohol,
+    CE.TertiaryAlcohol: CE.Alcohol,
+    CE.Dialkylether: CE.Ether,
+    CE.Alkylarylether: CE.Ether,
+    CE.Diarylether: CE.Ether,
+    CE.PrimaryAmine: CE.Amine,
+    CE.SecondaryAmine: CE.Amine,
+    CE.TertiaryAmine: CE.Amine,
+    CE.PrimaryAliphAmine: CE.PrimaryAmine,
+    CE.PrimaryAromAmine: CE.PrimaryAmine,
+    CE.SecondaryAliphAmine: CE.SecondaryAmine,
+    CE.SecondaryMixedAmine: CE.SecondaryAmine,
+    CE.SecondaryAromAmine: CE.SecondaryAmine,
+    CE.TertiaryAliphAmine: CE.TertiaryAmine,
+    CE.TertiaryMixedAmine: CE.TertiaryAmine,
+    CE.TertiaryAromAmine: CE.TertiaryAmine,
+    CE.AlkylHalide: CE.HalogenDeriv,
+    CE.ArylHalide: CE.HalogenDeriv,
+    CE.AlkylFluoride: CE.AlkylHalide,
+    CE.AlkylChloride: CE.AlkylHalide,
+    CE.AlkylBromide: CE.AlkylHalide,
+    CE.AlkylIodide: CE.AlkylHalide,
+    CE.ArylFluoride: CE.ArylHalide,
+    CE.ArylChloride: CE.ArylHalide,
+    CE.ArylBromide: CE.ArylHalide,
+    CE.ArylIodide: CE.ArylHalide,
+    CE.Organolithium: CE.Organometallic,
+    CE.Organomagnesium: CE.Organometallic,
+    CE.CarboxylicAcid: CE.CarboxylicAcidDeriv,
+    CE.CarboxylicAcidSalt: CE.CarboxylicAcidDeriv,
+    CE.CarboxylicAcidEster: CE.CarboxylicAcidDeriv,
+    CE.Lactone: CE.CarboxylicAcidEster,
+    CE.CarboxylicAcidAmide: CE.CarboxylicAcidDeriv,
+    CE.CarboxylicAcidPrimaryAmide: CE.CarboxylicAcidAmide,
+    CE.CarboxylicAcidSecondaryAmide: CE.CarboxylicAcidAmide,
+    CE.CarboxylicAcidTertiaryAmide: CE.CarboxylicAcidAmide,
+    CE.Lactam: CE.CarboxylicAcidAmide,
+    CE.CarboxylicAcidHydrazide: CE.CarboxylicAcidDeriv,
+    CE.CarboxylicAcidAzide: CE.CarboxylicAcidDeriv,
+    CE.HydroxamicAcid: CE.CarboxylicAcidDeriv,
+    CE.CarboxylicAcidAmidine: CE.CarboxylicAcidDeriv,
+    CE.CarboxylicAcidAmidrazone: CE.CarboxylicAcidDeriv,
+    CE.Nitrile: CE.CarboxylicAcidDeriv,
+    CE.AcylHalide: CE.CarboxylicAcidDeriv,
+    CE.AcylFluoride: CE.AcylHalide,
+    CE.AcylChloride: CE.AcylHalide,
+    CE.AcylBromide: CE.AcylHalide,
+    CE.AcylIodide: CE.AcylHalide,
+    CE.AcylCyanide: CE.CarboxylicAcidDeriv,
+    CE.ImidoEster: CE.CarboxylicAcidDeriv,
+    CE.ImidoylHalide: CE.CarboxylicAcidDeriv,
+    CE.ThiocarboxylicAcid: CE.ThiocarboxylicAcidDeriv,
+    CE.ThiocarboxylicAcidEster: CE.ThiocarboxylicAcidDeriv,
+    CE.Thiolactone: CE.ThiocarboxylicAcidEster,
+    CE.ThiocarboxylicAcidAmide: CE.ThiocarboxylicAcidDeriv,
+    CE.Thiolactam: CE.ThiocarboxylicAcidAmide,
+    CE.ImidoThioester: CE.ThiocarboxylicAcidDeriv,
+    CE.CarboxylicAcidOrthoester: CE.OrthocarboxylicAcidDeriv,
+    CE.CarboxylicAcidAmideAcetal: CE.OrthocarboxylicAcidDeriv,
+    CE.CarboxylicAcidUnsubstImide: CE.CarboxylicAcidImide,
+    CE.CarboxylicAcidSubstImide: CE.CarboxylicAcidImide,
+    CE.CarbonicAcidDeriv: CE.Co2Deriv,
+    CE.CarbonicAcidMonoester: CE.CarbonicAcidDeriv,
+    CE.CarbonicAcidDiester: CE.CarbonicAcidDeriv,
+    CE.CarbonicAcidEsterHalide: CE.CarbonicAcidDeriv,
+    CE.ThiocarbonicAcidDeriv: CE.Co2Deriv,
+    CE.ThiocarbonicAcidMonoester: CE.ThiocarbonicAcidDeriv,
+    CE.ThiocarbonicAcidDiester: CE.ThiocarbonicAcidDeriv,
+    CE.ThiocarbonicAcidEsterHalide: CE.ThiocarbonicAcidDeriv,
+    CE.CarbamicAcidDeriv: CE.Co2Deriv,
+    CE.CarbamicAcid: CE.CarbamicAcidDeriv,
+    CE.CarbamicAcidEster: CE.CarbamicAcidDeriv,
+    CE.CarbamicAcidHalide: CE.CarbamicAcidDeriv,
+    CE.ThiocarbamicAcidDeriv: CE.Co2Deriv,
+    CE.ThiocarbamicAcid: CE.ThiocarbamicAcidDeriv,
+    CE.ThiocarbamicAcidEster: CE.ThiocarbamicAcidDeriv,
+    CE.ThiocarbamicAcidHalide: CE.ThiocarbamicAcidDeriv,
+    CE.Urea: CE.Co2Deriv,
+    CE.Isourea: CE.Co2Deriv,
+    CE.Thiourea: CE.Co2Deriv,
+    CE.Isothiourea: CE.Co2Deriv,
+    CE.Guanidine: CE.Co2Deriv,
+    CE.Semicarbazide: CE.Co2Deriv,
+    CE.Thiosemicarbazide: CE.Co2Deriv,
+    CE.SulfuricAcid: CE.SulfuricAcidDeriv,
+    CE.SulfuricAcidMonoester: CE.SulfuricAcidDeriv,
+    CE.SulfuricAcidDiester: CE.SulfuricAcidDeriv,
+    CE.SulfuricAcidAmideEster: CE.SulfuricAcidDeriv,
+    CE.SulfuricAcidAmide: CE.SulfuricAcidDeriv,
+    CE.SulfuricAcidDiamide: CE.SulfuricAcidDeriv,
+    CE.SulfurylHalide: CE.SulfuricAcidDeriv,
+    CE.SulfonicAcid: CE.SulfonicAcidDeriv,
+    CE.SulfonicAcidEster: CE.SulfonicAcidDeriv,
+    CE.Sulfonamide: CE.SulfonicAcidDeriv,
+    CE.SulfonylHalide: CE.SulfonicAcidDeriv,
+    CE.SulfinicAcid: CE.SulfinicAcidDeriv,
+    CE.SulfinicAcidEster: CE.SulfinicAcidDeriv,
+    CE.SulfinicAcidHalide: CE.SulfinicAcidDeriv,
+    CE.SulfinicAcidAmide: CE.SulfinicAcidDeriv,
+    CE.SulfenicAcid: CE.SulfenicAcidDeriv,
+    CE.SulfenicAcidEster: CE.SulfenicAcidDeriv,
+    CE.SulfenicAcidHalide: CE.SulfenicAcidDeriv,
+    CE.SulfenicAcidAmide: CE.SulfenicAcidDeriv,
+    CE.Alkylthiol: CE.Thiol,
+    CE.Arylthiol: CE.Thiol,
+    CE.PhosphoricAcid: CE.PhosphoricAcidDeriv,
+    CE.PhosphoricAcidEster: CE.PhosphoricAcidDeriv,
+    CE.PhosphoricAcidHalide: CE.PhosphoricAcidDeriv,
+    CE.PhosphoricAcidAmide: CE.PhosphoricAcidDeriv,
+    CE.ThiophosphoricAcid: CE.ThiophosphoricAcidDeriv,
+    CE.ThiophosphoricAcidEster: CE.ThiophosphoricAcidDeriv,
+    CE.ThiophosphoricAcidHalide: CE.ThiophosphoricAcidDeriv,
+    CE.ThiophosphoricAcidAmide: CE.ThiophosphoricAcidDeriv,
+    CE.PhosphonicAcid: CE.PhosphonicAcidDeriv,
+    CE.PhosphonicAcidEster: CE.PhosphonicAcidDeriv,
+    CE.BoronicAcid: CE.BoronicAcidDeriv,
+    CE.BoronicAcidEster: CE.BoronicAcidDeriv,
+}
+
+
+def _compute_molecule_checkmol_groups(
+    database_path: str,
+    molecule_ids: list[int],
+) -> list[tuple[int, dict[CE, int] | None]]:
+    """
+    Run checkmol once over the given molecules, returning (molecule id, groups) pairs.
+    Groups are None where checkmol failed. Mapped SMILES are read here through a
+    read-only connection to the store.
+    """
+    from yammbs._analyze import _get_mapped_smiles
+    from yammbs.checkmol import analyze_functional_groups_batch
+
+    mapped_smiles = _get_mapped_smiles(database_path, molecule_ids)
+
+    return list(
+        zip(
+            molecule_ids,
+            analyze_functional_groups_batch(
+                [mapped_smiles[molecule_id] for molecule_id in molecule_ids],
+            ),
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _get_patterns() -> list[tuple[CE, "Chem.Mol"]]:
+    """Compile the SMARTS patterns of all groups once per process."""
+    from rdkit import Chem
+
+    return [
+        (environment, Chem.MolFromSmarts(smarts))
+        for environment, patterns in _SMARTS.items()
+        for smarts in patterns
+    ]
+
+
+def _get_ancestors(environment: CE) -> list[CE]:
+    ancestors = list()
+
+    while environment in _PARENTS:
+        environment = _PARENTS[environment]
+        ancestors.append(environment)
+
+    return ancestors
+
+
+def _classify(rdmol: "Chem.Mol") -> dict[CE, int]:
+    """
+    Return the functional groups of an RDKit molecule, with implicit hydrogens, and the
+    number of instances of each, as checkmol would report them.
+    """
+    heavy_atoms = [atom for atom in rdmol.GetAtoms() if atom.GetAtomicNum() != 1]
+
+    # as in `analyze_functional_groups`, which does not run checkmol on these
+    if len(heavy_atoms) == 1 and heavy_atoms[0].GetFormalCharge() == 0:
+        if heavy_atoms[0].GetSymbol() == "O" and heavy_atoms[0].GetTotalNumHs() == 2:
+            return {CE.Aqueous: 1}
+        if heavy_atoms[0].GetSymbol() == "N" and heavy_atoms[0].GetTotalNumHs() == 3:
+            return {CE.Amine: 1}
+
+    centers: dict[CE, set[int]] = dict()
+
+    for environment, pattern in _get_patterns():
+        found = {
+            match[0] for match in rdmol.GetSubstructMatches(pattern, maxMatches=1000)
+        }
+
+        if len(found) == 0:
+            continue
+
+        for group in [environment, *_get_ancestors(environment)]:
+            centers.setdefault(group, set()).update(found)
+
+    ring_info = rdmol.GetRingInfo()
+
+    aromatic_rings = [
+        ring
+        for ring in ring_info.AtomRings()
+        if all(rdmol.GetAtomWithIdx(index).GetIsAromatic() for index in ring)
+    ]
+    heterocycles = [
+        ring
+        for ring in ring_info.AtomRings()
+        if any(rdmol.GetAtomWithIdx(index).GetAtomicNum() != 6 for index in ring)
+    ]
+
+    groups = {environment: len(atoms) for environment, atoms in centers.items()}
+
+    if len(aromatic_rings) > 0:
+        groups[CE.Aromatic] = len(aromatic_rings)
+
+    if len(heterocycles) > 0:
+        groups[CE.Heterocycle] = len(heterocycles)
+
+    if len(groups) == 0:
+        return {CE.Alkane: 1}
+
+    return groups
+
+
+def _classify_smiles(smiles: list[str]) -> list[dict[CE, int] | None]:
+    """Classify molecules given by (mapped) SMILES, with None for unparsable ones."""
+    from rdkit import Chem
+
+    results: list[dict[CE, int] | None] = list()
+
+    for pattern in smiles:
+        rdmol = Chem.MolFromSmiles(pattern)
+
+        results.append(None if rdmol is None else _classify(rdmol))
+
+    return results
+
+
+def _compute_molecule_smarts_groups(
+    database_path: str,
+    molecule_ids: list[int],
+) -> list[tuple[int, dict[CE, int] | None]]:
+    """
+    Classify the given molecules in this process, returning (molecule id, groups)
+    pairs. Mapped SMILES are read here through a read-only connection to the store.
+    """
+    from yammbs._analyze import _get_mapped_smiles
+
+    mapped_smiles = _get_mapped_smiles(database_path, molecule_ids)
+
+    return list(
+        zip(
+            molecule_ids,
+            _classify_smiles(
+                [mapped_smiles[molecule_id] for molecule_id in molecule_ids],
+            ),
+        ),
+    )
@@ -0,0 +1,337 @@
+"""Vectorized internal coordinates, chosen as geomeTRIC chooses its primitives."""
+
+import copy
+import functools
+import itertools
+from typing import NamedTuple
+
+import numpy
+from openff.toolkit import Molecule
+
+from yammbs._forcebalance import periodic_diff
+
+# geomeTRIC treats angles with |cos| above this, about 162 degrees, as linear
+_LINEAR_THRESHOLD = 0.95
+
+
+class _Topology(NamedTuple):
+    """Candidate internal coordinates of a molecule, derived from its graph."""
+
+    neighbors: tuple[tuple[int, ...], ...]
+    bonds: numpy.ndarray
+    # (a, b, c) with b the central atom
+    angles: numpy.ndarray
+    # (b, i, j, k) for the six orderings of each triple of neighbors of b, and the
+    # index in `angles` of the angle i-b-j an out-of-plane coordinate replaces
+    out_of_planes: numpy.ndarray
+    replaced_angles: numpy.ndarray
+    # (a, b, c, d) around each bond b-c
+    dihedrals: numpy.ndarray
+
+
+@functools.lru_cache(maxsize=4096)
+def _get_topology(n_atoms: int, bonds: tuple[tuple[int, int], ...]) -> _Topology:
+    neighbors: list[list[int]] = [list() for _ in range(n_atoms)]
+
+    for atom1, atom2 in bonds:
+        neighbors[atom1].append(atom2)
+        neighbors[atom2].append(atom1)
+
+    angles = list()
+    angle_indices = dict()
+
+    for b in range(n_atoms):
+        for a, c in itertools.combinations(sorted(neighbors[b]), 2):
+            angle_indices[(a, b, c)] = angle_indices[(c, b, a)] = len(angles)
+            angles.append((a, b, c))
+
+    out_of_planes = list()
+    replaced_angles = list()
+
+    for b in range(n_atoms):
+        for triple in itertools.combinations(sorted(neighbors[b]), 3):
+            permutations = sorted(itertools.permutations(triple, 3))
+
+            out_of_planes.append([(b, i, j, k) for i, j, k in permutations])
+            replaced_angles.append(
+                [angle_indices[(i, b, j)] for i, j, _ in permutations],
+            )
+
+    dihedrals = [
+        (a, b, c, d)
+        for b, c in sorted(tuple(sorted(bond)) for bond in bonds)
+        for a in neighbors[b]
+        for d in neighbors[c]
+        if c != a != d != b
+    ]
+
+    return _Topology(
+        neighbors=tuple(tuple(atoms) for atoms in neighbors),
+        bonds=numpy.array(bonds, dtype=int).reshape(-1, 2),
+        angles=numpy.array(angles, dtype=int).reshape(-1, 3),
+        out_of_planes=numpy.array(out_of_planes, dtype=int).reshape(-1, 6, 4),
+        replaced_angles=numpy.array(replaced_angles, dtype=int).reshape(-1, 6),
+        dihedrals=numpy.array(dihedrals, dtype=int).reshape(-1, 4),
+    )
+
+
+def _take(coordinates: numpy.ndarray, atoms: numpy.ndarray) -> numpy.ndarray:
+    """
+    Gather positions from coordinates of shape (n_conformers, n_atoms, 3) by atom
+    indices shared by all conformers, of shape (n,), or per conformer, of shape
+    (n_conformers, n).
+    """
+    if atoms.ndim == 1:
+        return coordinates[:, atoms]
+
+    return coordinates[numpy.arange(len(coordinates))[:, None], atoms]
+
+
+def _get_distances(coordinates, a, b) -> numpy.ndarray:
+    return numpy.linalg.norm(_take(coordinates, a) - _take(coordinates, b), axis=-1)
+
+
+def _get_cosines(coordinates, a, b, c) -> numpy.ndarray:
+    """Return the cosines of the angles a-b-c."""
+    vector1 = _take(coordinates, a) - _take(coordinates, b)
+    vector2 = _take(coordinates, c) - _take(coordinates, b)
+
+    return numpy.sum(vector1 * vector2, axis=-1) / (
+        numpy.linalg.norm(vector1, axis=-1) * numpy.linalg.norm(vector2, axis=-1)
+    )
+
+
+def _get_normals(coordinates, a, b, c) -> numpy.ndarray:
+    """Return unit vectors normal to the planes of the angles a-b-c."""
+    normals = numpy.cross(
+        _take(coordinates, a) - _take(coordinates, b),
+        _take(coordinates, c) - _take(coordinates, b),
+    )
+
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        return normals / numpy.linalg.norm(normals, axis=-1, keepdims=True)
+
+
+def _get_dihedrals(coordinates, a, b, c, d) -> numpy.ndarray:
+    """Return the dihedral angles a-b-c-d [rad], as `geometric.internal.Dihedral`."""
+    vector1 = _take(coordinates, b) - _take(coordinates, a)
+    vector2 = _take(coordinates, c) - _take(coordinates, b)
+    vector3 = _take(coordinates, d) - _take(coordinates, c)
+
+    cross1 = numpy.cross(vector2, vector3)
+    cross2 = numpy.cross(vector1, vector2)
+
+    return numpy.arctan2(
+        numpy.sum(vector1 * cross1, axis=-1) * numpy.linalg.norm(vector2, axis=-1),
+        numpy.sum(cross1 * cross2, axis=-1),
+    )
+
+
+def _is_linear(cosines: numpy.ndarray) -> numpy.ndarray:
+    return numpy.abs(cosines) > _LINEAR_THRESHOLD
+
+
+def _get_line_dihedrals(
+    topology: _Topology,
+    coordinates: numpy.ndarray,
+) -> list[tuple[int, int, int, int]]:
+    """
+    Return the dihedrals geomeTRIC adds between non-bonded ends of lines of (nearly)
+    linear atoms in one conformer, beyond those around bonds.
+
+    This follows `PrimitiveInternalCoordinates.makePrimitives`, including the order
+    in which lines are extended; it is only needed for conformers with linear angles.
+    """
+    neighbors = topology.neighbors
+
+    def linear(a: int, b: int, c: int) -> bool:
+        vector1 = coordinates[a] - coordinates[b]
+        vector2 = coordinates[c] - coordinates[b]
+
+        norms = numpy.linalg.norm(vector1) * numpy.linalg.norm(vector2)
+
+        return bool(_is_linear(numpy.dot(vector1, vector2) / norms))
+
+    lines = [list(bond) for bond in topology.bonds.tolist()]
+
+    while True:
+        previous = copy.deepcopy(lines)
+
+        for line in lines:
+            first, last = line[0], line[-1]
+
+            for atom in neighbors[first]:
+                if atom not in line and all(
+                    linear(atom, first, other) for other in line[1:] if other != first
+                ):
+                    line.insert(0, atom)
+
+            for atom in neighbors[last]:
+                if atom not in line and all(
+                    linear(other, last, atom) for other in line[:-1] if other != last
+                ):
+                    line.append(atom)
+
+        if lines == previous:
+            break
+
+    dihedrals = set()
+
+    for line in dict.fromkeys(tuple(line) for line in lines if len(line) > 2):
+        for b, c in itertools.combinations(line, 2):
+            b, c = min(b, c), max(b, c)
+
+            if c in neighbors[b]:
+                continue
+
+            for a in neighbors[b]:
+                for d in neighbors[c]:
+                    if a in line or d in line or a == d:
+                        continue
+
+                    if linear(a, b, c) or linear(b, c, d):
+                        continue
+
+                    if (d, c, b, a) not in dihedrals:
+                        dihedrals.add((a, b, c, d))
+
+    return sorted(dihedrals)
+
+
+def _get_internal_coordinate_rmsds(
+    molecule: Molecule,
+    references: numpy.ndarray,
+    targets: numpy.ndarray,
+    types: tuple[str, ...] = ("Bond", "Angle", "Dihedral", "Improper"),
+) -> list[dict[str, float]]:
+    """
+    Return the internal coordinate RMSDs between each pair of conformers of shape
+    (n_pairs, n_atoms, 3) [Angstrom], in Angstrom for bonds and degrees otherwise.
+
+    Coordinates are chosen from the molecule's bonds, and from each target conformer's
+    geometry, as `geometric.internal.PrimitiveInternalCoordinates` chooses distances,
+    angles, dihedrals and out-of-plane angles, and differences of angular coordinates
+    are periodic as in `yammbs._forcebalance.compute_rmsd`. Types without coordinates
+    are left out of a pair's result.
+    """
+    references = numpy.asarray(references, dtype=float)
+    targets = numpy.asarray(targets, dtype=float)
+
+    topology = _get_topology(
+        molecule.n_atoms,
+        tuple((bond.atom1_index, bond.atom2_index) for bond in molecule.bonds),
+    )
+
+    n_pairs = len(targets)
+
+    # (values in reference, values in target, mask of coordinates present), per type
+    coordinates: dict[str, tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]] = dict()
+
+    bonds = tuple(topology.bonds.T)
+
+    coordinates["Bond"] = (
+        _get_distances(references, *bonds),
+        _get_distances(targets, *bonds),
+        numpy.ones((n_pairs, len(topology.bonds)), dtype=bool),
+    )
+
+    angles = tuple(topology.angles.T)
+
+    reference_cosines = _get_cosines(references, *angles)
+    target_cosines = _get_cosines(targets, *angles)
+
+    angle_mask = ~_is_linear(target_cosines)
+
+    # out-of-plane coordinates replace one angle at planar centers with three neighbors
+    out_of_planes = numpy.moveaxis(topology.out_of_planes, -1, 0)
+    b, i, j, k = (atoms.ravel() for atoms in out_of_planes)
+
+    with numpy.errstate(invalid="ignore"):
+        planarity = numpy.sum(
+            _get_normals(targets, b, i, j) * _get_normals(targets, i, j, k),
+            axis=-1,
+        )
+
+    planar = numpy.all(
+        [
+            ~_is_linear(_get_cosines(targets, b, i, j)),
+            ~_is_linear(_get_cosines(targets, i, j, k)),
+            _is_linear(planarity),
+        ],
+        axis=0,
+    ).reshape(n_pairs, len(topology.out_of_planes), 6)
+
+    chosen = planar.argmax(axis=-1)
+    improper_mask = planar.any(axis=-1)
+
+    impropers = tuple(
+        atoms[numpy.arange(len(topology.out_of_planes)), chosen]
+        for atoms in out_of_planes
+    )
+
+    pairs, centers = numpy.nonzero(improper_mask)
+    replaced = topology.replaced_angles[centers, chosen[pairs, centers]]
+
+    angle_mask[pairs, replaced] = False
+
+    coordinates["Angle"] = (
+        numpy.degrees(numpy.arccos(numpy.clip(reference_cosines, -1.0, 1.0))),
+        numpy.degrees(numpy.arccos(numpy.clip(target_cosines, -1.0, 1.0))),
+        angle_mask,
+    )
+
+    coordinates["Improper"] = (
+        numpy.degrees(_get_dihedrals(references, *impropers)),
+        numpy.degrees(_get_dihedrals(targets, *impropers)),
+        improper_mask,
+    )
+
+    dihedrals = tuple(topology.dihedrals.T)
+
+    coordinates["Dihedral"] = (
+        numpy.degrees(_get_dihedrals(references, *dihedrals)),
+        numpy.degrees(_get_dihedrals(targets, *dihedrals)),
+        numpy.all(
+            [
+                ~_is_linear(_get_cosines(targets, *dihedrals[:3])),
+                ~_is_linear(_get_cosines(targets, *dihedrals[1:])),
+            ],
+            axis=0,
+        ),
+    )
+
+    totals = dict()
+
+    for _type, (reference_values, target_values, mask) in coordinates.items():
+        if _type == "Bond":
+            differences = reference_values - target_values
+        else:
+            differences = periodic_diff(reference_values, target_values, 360)
+
+        totals[_type] = numpy.sum(numpy.where(mask, differences, 0.0) ** 2, axis=-1)
+
+    counts = {_type: mask.sum(axis=-1) for _type, (_, _, mask) in coordinates.items()}
+
+    # conformers with linear angles can have dihedrals across lines of atoms
+    for pair in numpy.nonzero(_is_linear(target_cosines).any(axis=-1))[0]:
+        for dihedral in _get_line_dihedrals(topology, targets[pair]):
+            reference_value, target_value = numpy.degrees(
+                _get_dihedrals(
+                    numpy.stack([references[pair], targets[pair]]),
+                    *numpy.array(dihedral)[:, None],
+                ),
+            )[:, 0]
+
+            difference = periodic_diff(reference_value, target_value, 360)
+
+            totals["Dihedral"][pair] += difference**2
+            counts["Dihedral"][pair] += 1
+
+    return [
+        {
+            _type: float(numpy.sqrt(totals[_type][pair] / counts[_type][pair]))
+            for _type in types
+            if counts[_type][pair] > 0
+        }
+        for pair in range(n_pairs)
+    ]
@@ -0,0 +1,64 @@
+"""Labels of molecules with the SMIRNOFF parameters a force field assigns them."""
+
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _label_molecule(
+    mapped_smiles: str,
+    force_field: str,
+) -> dict[tuple[str, str], int]:
+    """
+    Return how many times each (parameter handler, parameter id) is applied to a
+    molecule, as assigned by `ForceField.label_molecules`.
+    """
+    from openff.toolkit import Molecule
+
+    from yammbs._minimize import _lazy_load_force_field
+
+    molecule = Molecule.from_mapped_smiles(mapped_smiles, allow_undefined_stereo=True)
+
+    labels = _lazy_load_force_field(force_field).label_molecules(
+        molecule.to_topology(),
+    )[0]
+
+    counts: dict[tuple[str, str], int] = dict()
+
+    for handler, assignments in labels.items():
+        for parameter in assignments.values():
+            key = (handler, parameter.id)
+
+            counts[key] = counts.get(key, 0) + 1
+
+    return counts
+
+
+def _compute_molecule_labels(
+    database_path: str,
+    force_field: str,
+    molecule_ids: list[int],
+) -> list[tuple[int, dict[tuple[str, str], int] | None]]:
+    """
+    Label the given molecules with parameters of a SMIRNOFF force field, returning
+    (molecule id, labels) pairs, with None for molecules that could not be labelled.
+    Mapped SMILES are read here through a read-only connection to the store, and the
+    force field is loaded once per process.
+    """
+    from yammbs._analyze import _get_mapped_smiles
+
+    mapped_smiles = _get_mapped_smiles(database_path, molecule_ids)
+
+    results: list[tuple[int, dict[tuple[str, str], int] | None]] = list()
+
+    for molecule_id in molecule_ids:
+        try:
+            results.append(
+                (molecule_id, _label_molecule(mapped_smiles[molecule_id], force_field)),
+            )
+        except Exception as error:
+            LOGGER.warning(f"Molecule {molecule_id} could not be labelled: {error}")
+
+            results.append((molecule_id, None))
+
+    return results
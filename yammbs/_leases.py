@@ -0,0 +1,44 @@
+"""Helpers for processes that share one store by leasing pending conformers."""
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _get_lease_owner() -> str:
+    """Return an identifier unique to this process, readable in the database."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+@contextmanager
+def _heartbeat(renew: Callable[[], None], interval: float) -> Iterator[None]:
+    """
+    Call `renew` every `interval` seconds in a background thread while the context is
+    open, so that leases held by a long-running batch do not expire.
+
+    Failures to renew are logged rather than raised; at worst another process takes
+    over the leases and repeats some work.
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            try:
+                renew()
+            except Exception as error:
+                LOGGER.warning(f"Failed to renew leases: {error}")
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
@@ -1,7 +1,10 @@
 import functools
+import hashlib
 import re
+import time
+from concurrent.futures import Executor
 from multiprocessing import Pool
-from typing import Union
+from typing import Iterable, Iterator, Optional, Union
 
 import numpy
 import openmm
@@ -56,37 +59,185 @@ def _lazy_load_force_field(force_field_name: str) -> ForceField:
     )
 
 
+@functools.lru_cache
+def _get_force_field_fingerprint(force_field_name: str) -> str:
+    """
+    Return a hash identifying the parameters a force field name resolves to.
+
+    SMIRNOFF force fields are hashed by their contents, so editing a local .offxml file
+    changes its fingerprint. Force fields built by other packages (GAFF, Espaloma) are
+    identified by name and the version of the package that builds them.
+    """
+    if force_field_name.startswith("gaff"):
+        import openmmforcefields
+
+        content = f"{force_field_name}-{openmmforcefields.__version__}"
+
+    elif force_field_name.startswith("espaloma"):
+        import espaloma
+
+        content = f"{force_field_name}-{espaloma.__version__}"
+
+    else:
+        try:
+            force_field = _lazy_load_force_field(force_field_name)
+        except KeyError:
+            force_field = ForceField(
+                force_field_name,
+                allow_cosmetic_attributes=True,
+                load_plugins=True,
+            )
+
+        content = force_field.to_string()
+
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
 def _minimize_blob(
-    input: dict[str, dict[str, Union[str, numpy.ndarray]]],
+    input: Iterable[tuple[str, dict[str, Union[str, numpy.ndarray]]]],
     force_field: str,
     n_processes: int = 2,
     chunksize=32,
-) -> dict[str, list["MinimizationResult"]]:
-    inputs = list()
-
-    inputs = [
-        MinimizationInput(
-            inchi_key=inchi_key,
-            qcarchive_id=row["qcarchive_id"],
-            force_field=force_field,
-            mapped_smiles=row["mapped_smiles"],
-            coordinates=row["coordinates"],
+    n_tasks: Optional[int] = None,
+    n_threads: Optional[int] = None,
+    max_tasks_per_child: Optional[int] = None,
+    max_rss: Optional[int] = None,
+    shared_memory: bool = False,
+    executor: Union[Executor, str, None] = None,
+    metrics: tuple[str, ...] = (),
+) -> Iterator["MinimizationResult"]:
+    """
+    Minimize conformers, yielding results as they complete.
+
+    `input` is an iterable of (InChI key, QM conformer) pairs in the order they should
+    be dispatched, where each conformer is a dict with "qcarchive_id", "mapped_smiles"
+    and "coordinates". It is consumed lazily as workers free up, so it can be a
+    generator paging conformers out of a database; `n_tasks` is then needed to size
+    chunks and report progress. Chunks start at `chunksize` and shrink toward the end
+    of the run so that no worker is left holding a long tail of work.
+
+    If `n_threads` is given, OpenMM and numerical libraries in each worker are limited
+    to that many threads.
+
+    Workers are replaced after processing `max_tasks_per_child` chunks. If `max_rss`
+    (bytes) is given, a worker also retires after finishing a chunk while its resident
+    memory is above that threshold, and a worker that grows well past it mid-chunk is
+    terminated and its chunk requeued.
+
+    If `shared_memory` is True, input and output coordinates are exchanged through
+    shared memory blocks and only task indices cross the process boundary. This needs
+    all of `input` in memory at once.
+
+    If `executor` is given, chunks are dispatched through it (see `yammbs.executors`)
+    instead of a `multiprocessing.Pool`; worker recycling and shared memory are only
+    available with the built-in pools. Where `multiprocessing` does not fork by
+    default, and none of those are asked for, fresh worker interpreters are used so
+    that calling scripts need no `__main__` guard.
+
+    Any `metrics` (see `yammbs.analysis._METRIC_VERSIONS`) are computed in the workers
+    right after each minimization and returned with its result. This is not supported
+    with `shared_memory`.
+    """
+    from yammbs._pool import _RecyclingPool
+    from yammbs._scheduling import _guided_chunks
+    from yammbs._tuning import _limit_threads
+    from yammbs.executors import _default_executor, _ExecutorPool
+
+    built_in_only = bool(shared_memory or max_rss or max_tasks_per_child)
+
+    if executor is not None and built_in_only:
+        raise ValueError(
+            "shared_memory, max_rss and max_tasks_per_child cannot be combined with "
+            "an executor",
         )
-        for inchi_key in input
-        for row in input[inchi_key]
-    ]
-
-    with Pool(processes=n_processes) as pool:
-        yield from tqdm(
-            pool.imap(
-                _run_openmm,
-                inputs,
-                chunksize=chunksize,
-            ),
-            desc=f"Building and minimizing systems with {force_field}",
-            total=len(inputs),
+
+    if shared_memory and metrics:
+        raise ValueError("metrics cannot be computed with shared_memory")
+
+    if executor is None and not built_in_only:
+        executor = _default_executor()
+
+    if shared_memory:
+        from yammbs._transport import (
+            _attach_shared_coordinates,
+            _run_openmm_shared,
+            _SharedCoordinates,
         )
 
+        rows = list(input)
+        n_tasks = len(rows)
+
+        transport = _SharedCoordinates(rows, force_field=force_field)
+
+        func = _run_openmm_shared
+        tasks = range(n_tasks)
+        initializer, initargs = _attach_shared_coordinates, transport.initargs
+    else:
+        if n_tasks is None:
+            input = list(input)
+            n_tasks = len(input)
+
+        transport = None
+
+        func = _run_openmm_chunk
+        tasks = (
+            MinimizationInput(
+                inchi_key=inchi_key,
+                qcarchive_id=row["qcarchive_id"],
+                force_field=force_field,
+                mapped_smiles=row["mapped_smiles"],
+                coordinates=row["coordinates"],
+                metrics=metrics,
+            )
+            for inchi_key, row in input
+        )
+        initializer, initargs = None, ()
+
+    try:
+        # workers (including any respawned during the run) inherit thread limits
+        with _limit_threads(n_threads):
+            if executor is not None:
+                pool = _ExecutorPool(executor, n_processes=n_processes)
+            elif max_rss is None:
+                pool = Pool(
+                    processes=n_processes,
+                    initializer=initializer,
+                    initargs=initargs,
+                    maxtasksperchild=max_tasks_per_child,
+                )
+            else:
+                pool = _RecyclingPool(
+                    processes=n_processes,
+                    initializer=initializer,
+                    initargs=initargs,
+                    max_tasks_per_child=max_tasks_per_child,
+                    max_rss=max_rss,
+                )
+
+            with pool, tqdm(
+                desc=f"Building and minimizing systems with {force_field}",
+                total=n_tasks,
+            ) as progress:
+                for results in pool.imap_unordered(
+                    func,
+                    _guided_chunks(
+                        tasks,
+                        n_processes,
+                        max_chunksize=chunksize,
+                        n_tasks=n_tasks,
+                    ),
+                ):
+                    progress.update(len(results))
+
+                    if transport is None:
+                        yield from results
+                    else:
+                        yield from (transport.result(index) for index in results)
+
+    finally:
+        if transport is not None:
+            transport.close()
+
 
 class MinimizationInput(ImmutableModel):
     inchi_key: str = Field(..., description="The InChI key of the molecule")
@@ -106,6 +257,10 @@ class MinimizationInput(ImmutableModel):
         ...,
         description="The coordinates [Angstrom] of this conformer with shape=(n_atoms, 3).",
     )
+    metrics: tuple[str, ...] = Field(
+        (),
+        description="Metrics to compute between this conformer and its minimized form",
+    )
 
 
 class MinimizationResult(ImmutableModel):
@@ -116,44 +271,113 @@ class MinimizationResult(ImmutableModel):
     mapped_smiles: str
     coordinates: Array
     energy: float = Field(..., description="Minimized energy in kcal/mol")
+    elapsed: float = Field(
+        0.0,
+        description="Wall time [s] spent building and minimizing this system",
+    )
+    metrics: dict[str, float] = Field(
+        dict(),
+        description="Metrics computed between the QM conformer and this one",
+    )
+
+
+def _run_openmm_chunk(
+    inputs: list[MinimizationInput],
+) -> list[MinimizationResult]:
+    return [_run_openmm(input) for input in inputs]
 
 
 def _run_openmm(
     input: MinimizationInput,
 ) -> MinimizationResult:
-    inchi_key: str = input.inchi_key
-    qcarchive_id: str = input.qcarchive_id
-    positions: numpy.ndarray = input.coordinates
+    start = time.perf_counter()
 
     molecule = Molecule.from_mapped_smiles(
         input.mapped_smiles,
         allow_undefined_stereo=True,
     )
 
-    if input.force_field.startswith("gaff"):
+    coordinates, energy = _minimize_molecule(
+        molecule=molecule,
+        force_field_name=input.force_field,
+        positions=input.coordinates,
+    )
+
+    elapsed = time.perf_counter() - start
+
+    if input.metrics:
+        from yammbs.analysis import _compute_metrics
+
+        # while the molecule and both geometries are still at hand
+        metrics = _compute_metrics(
+            molecule,
+            input.coordinates,
+            coordinates,
+            input.metrics,
+        )
+    else:
+        metrics = dict()
+
+    return MinimizationResult(
+        inchi_key=input.inchi_key,
+        qcarchive_id=input.qcarchive_id,
+        force_field=input.force_field,
+        mapped_smiles=input.mapped_smiles,
+        coordinates=coordinates,
+        energy=energy,
+        elapsed=elapsed,
+        metrics=metrics,
+    )
+
+
+def _minimize(
+    mapped_smiles: str,
+    force_field_name: str,
+    positions: numpy.ndarray,
+) -> tuple[numpy.ndarray, float]:
+    """
+    Minimize one conformer, returning the minimized coordinates [Angstrom] and energy
+    [kcal/mol].
+    """
+    return _minimize_molecule(
+        molecule=Molecule.from_mapped_smiles(
+            mapped_smiles,
+            allow_undefined_stereo=True,
+        ),
+        force_field_name=force_field_name,
+        positions=positions,
+    )
+
+
+def _minimize_molecule(
+    molecule: Molecule,
+    force_field_name: str,
+    positions: numpy.ndarray,
+) -> tuple[numpy.ndarray, float]:
+    if force_field_name.startswith("gaff"):
         from yammbs._forcefields import _gaff
 
         system = _gaff(
             molecule=molecule,
-            force_field_name=input.force_field,
+            force_field_name=force_field_name,
         )
 
-    elif input.force_field.startswith("espaloma"):
+    elif force_field_name.startswith("espaloma"):
         from yammbs._forcefields import _espaloma
 
         system = _espaloma(
             molecule=molecule,
-            force_field_name=input.force_field,
+            force_field_name=force_field_name,
         )
 
     else:
         try:
-            force_field = _lazy_load_force_field(input.force_field)
+            force_field = _lazy_load_force_field(force_field_name)
         except KeyError:
             # Attempt to load from local path
             try:
                 force_field = ForceField(
-                    input.force_field,
+                    force_field_name,
                     allow_cosmetic_attributes=True,
                     load_plugins=True,
                 )
@@ -162,7 +386,7 @@ def _run_openmm(
                 # argument being a file that does not exist and a file that it should
                 # try to parse (polymorphic input), so just have to clobber whatever
                 raise NotImplementedError(
-                    f"Could not find or parse force field {input.force_field}",
+                    f"Could not find or parse force field {force_field_name}",
                 ) from error
 
         system = force_field.create_interchange(molecule.to_topology()).to_openmm(
@@ -184,19 +408,9 @@ def _run_openmm(
         maxIterations=0,
     )
 
-    return MinimizationResult(
-        inchi_key=inchi_key,
-        qcarchive_id=qcarchive_id,
-        force_field=input.force_field,
-        mapped_smiles=input.mapped_smiles,
-        coordinates=context.getState(getPositions=True)
-        .getPositions()
-        .value_in_unit(openmm.unit.angstrom),
-        energy=context.getState(
-            getEnergy=True,
-        )
-        .getPotentialEnergy()
-        .value_in_unit(
-            openmm.unit.kilocalorie_per_mole,
-        ),
+    state = context.getState(getPositions=True, getEnergy=True)
+
+    return (
+        state.getPositions(asNumpy=True).value_in_unit(openmm.unit.angstrom),
+        state.getPotentialEnergy().value_in_unit(openmm.unit.kilocalorie_per_mole),
     )
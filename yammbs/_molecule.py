@@ -1,5 +1,7 @@
 """Molecule conversion utilities"""
 
+import threading
+from collections import OrderedDict
 from typing import TYPE_CHECKING
 
 from openff.toolkit import Molecule
@@ -28,3 +30,48 @@ def _to_geometric_molecule(
     }
 
     return geometric_molecule
+
+
+class _MoleculeCache:
+    """
+    A least-recently-used cache of molecules, keyed by mapped SMILES.
+
+    At most `max_size` molecules are kept; a size of zero disables caching. Molecules
+    are shared by everything reading the cache and must not be modified. The cache can
+    be shared between threads.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+
+        self._molecules: OrderedDict[str, Molecule] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._molecules)
+
+    def get(self, mapped_smiles: str) -> Molecule:
+        """Return the molecule with the given mapped SMILES, creating it if not cached."""
+        with self._lock:
+            if mapped_smiles in self._molecules:
+                self._molecules.move_to_end(mapped_smiles)
+
+                return self._molecules[mapped_smiles]
+
+        molecule = Molecule.from_mapped_smiles(
+            mapped_smiles,
+            allow_undefined_stereo=True,
+        )
+
+        with self._lock:
+            # another thread may have created it meanwhile; either copy is fine
+            self._molecules[mapped_smiles] = molecule
+
+            while len(self._molecules) > self.max_size:
+                self._molecules.popitem(last=False)
+
+        return molecule
+
+    def clear(self):
+        with self._lock:
+            self._molecules.clear()
@@ -0,0 +1,294 @@
+"""A process pool that recycles workers and watches their memory use."""
+
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+_POLL_INTERVAL = 1.0
+
+
+def _get_rss(pid: Optional[int] = None) -> int:
+    """
+    Return the current resident set size of a process in bytes.
+
+    Only Linux exposes this cheaply for arbitrary processes; elsewhere 0 is returned,
+    which disables memory checks.
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _worker(
+    worker_id: int,
+    func: Callable,
+    inbox: multiprocessing.Queue,
+    results: Connection,
+    max_tasks: Optional[int],
+    max_rss: Optional[int],
+    initializer: Optional[Callable],
+    initargs: tuple,
+):
+    if initializer is not None:
+        initializer(*initargs)
+
+    completed = 0
+
+    while True:
+        task = inbox.get()
+
+        if task is None:
+            return
+
+        index, argument = task
+
+        try:
+            kind, payload = "done", func(argument)
+        except Exception as error:
+            kind, payload = "error", error
+
+        completed += 1
+
+        retiring = (max_tasks is not None and completed >= max_tasks) or (
+            max_rss is not None and _get_rss() > max_rss
+        )
+
+        results.send((kind, worker_id, index, payload, retiring))
+
+        if retiring:
+            return
+
+
+class _RecyclingPool:
+    """
+    A minimal process pool whose workers are replaced as they age or grow.
+
+    Each worker exits after `max_tasks_per_child` tasks, or after finishing a task while
+    its resident memory is above `max_rss` bytes, and is replaced by a fresh process.
+    A watchdog in the parent also terminates any worker whose memory grows past
+    `hard_rss` (defaults to 1.5 times `max_rss`) in the middle of a task, or that dies
+    unexpectedly, and requeues the task it was running. A task that brings down a
+    worker more than `max_retries` times is dropped with an error logged.
+
+    Each worker has its own task queue and result pipe, so terminating one in the
+    middle of sending a result cannot corrupt, or hold the lock of, a channel other
+    workers share.
+
+    As with `multiprocessing.Pool`, `initializer(*initargs)` is called in each worker
+    when it starts.
+    """
+
+    def __init__(
+        self,
+        processes: int,
+        max_tasks_per_child: Optional[int] = None,
+        max_rss: Optional[int] = None,
+        hard_rss: Optional[int] = None,
+        max_retries: int = 2,
+        context: Optional[Any] = None,
+        initializer: Optional[Callable] = None,
+        initargs: tuple = (),
+    ):
+        self.processes = max(1, processes)
+        self.max_tasks_per_child = max_tasks_per_child
+        self.max_rss = max_rss
+        self.hard_rss = hard_rss or (int(1.5 * max_rss) if max_rss else None)
+        self.max_retries = max_retries
+        self.context = context or multiprocessing.get_context()
+        self.initializer = initializer
+        self.initargs = initargs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def imap_unordered(self, func: Callable, iterable: Iterable) -> Iterator:
+        workers: dict[int, tuple] = dict()
+        in_flight: dict[int, Optional[int]] = dict()
+
+        arguments: dict[int, Any] = dict()
+        retries: dict[int, int] = dict()
+        requeued: deque[int] = deque()
+
+        tasks = enumerate(iterable)
+        exhausted = False
+        next_worker_id = 0
+        last_check = time.monotonic()
+
+        def start_worker():
+            nonlocal next_worker_id
+
+            worker_id, next_worker_id = next_worker_id, next_worker_id + 1
+
+            inbox = self.context.Queue()
+            receiver, sender = self.context.Pipe(duplex=False)
+
+            process = self.context.Process(
+                target=_worker,
+                args=(
+                    worker_id,
+                    func,
+                    inbox,
+                    sender,
+                    self.max_tasks_per_child,
+                    self.max_rss,
+                    self.initializer,
+                    self.initargs,
+                ),
+                daemon=True,
+            )
+            process.start()
+
+            # the worker holds the only other end, so the pipe reads EOF once it exits
+            sender.close()
+
+            workers[worker_id] = (process, inbox, receiver)
+            in_flight[worker_id] = None
+
+        def stop_worker(worker_id: int, terminate: bool = False):
+            process, inbox, receiver = workers.pop(worker_id)
+            in_flight.pop(worker_id)
+
+            if terminate:
+                process.terminate()
+
+            process.join()
+
+            # anything left unread in the inbox would otherwise block interpreter exit
+            inbox.cancel_join_thread()
+            inbox.close()
+            receiver.close()
+
+        def requeue(worker_id: int, reason: str):
+            index = in_flight[worker_id]
+
+            stop_worker(worker_id, terminate=True)
+            start_worker()
+
+            if index is None:
+                return
+
+            retries[index] = retries.get(index, 0) + 1
+
+            if retries[index] > self.max_retries:
+                LOGGER.error(
+                    f"Dropping task {index} after {self.max_retries} retries ({reason})",
+                )
+                arguments.pop(index)
+            else:
+                LOGGER.warning(f"Requeueing task {index} ({reason})")
+                requeued.append(index)
+
+        def check_workers():
+            for worker_id, (process, _, _) in list(workers.items()):
+                if not process.is_alive():
+                    requeue(worker_id, "worker died")
+                    continue
+
+                if self.hard_rss is None or in_flight[worker_id] is None:
+                    continue
+
+                if _get_rss(process.pid) > self.hard_rss:
+                    requeue(worker_id, "worker exceeded hard RSS limit")
+
+        def next_task() -> Optional[int]:
+            nonlocal exhausted
+
+            while requeued:
+                index = requeued.popleft()
+
+                # skip tasks whose result arrived after they were requeued
+                if index in arguments:
+                    return index
+
+            if exhausted:
+                return None
+
+            try:
+                index, argument = next(tasks)
+            except StopIteration:
+                exhausted = True
+                return None
+
+            arguments[index] = argument
+
+            return index
+
+        try:
+            for _ in range(self.processes):
+                start_worker()
+
+            while True:
+                for worker_id, index in list(in_flight.items()):
+                    if index is not None:
+                        continue
+
+                    index = next_task()
+
+                    if index is None:
+                        break
+
+                    in_flight[worker_id] = index
+                    workers[worker_id][1].put((index, arguments[index]))
+
+                if exhausted and not arguments:
+                    return
+
+                if time.monotonic() - last_check > _POLL_INTERVAL:
+                    check_workers()
+                    last_check = time.monotonic()
+
+                owners = {
+                    receiver: worker_id
+                    for worker_id, (_, _, receiver) in workers.items()
+                }
+
+                for receiver in wait(list(owners), timeout=_POLL_INTERVAL):
+                    worker_id = owners[receiver]
+
+                    # the worker was replaced while handling an earlier result
+                    if worker_id not in workers:
+                        continue
+
+                    try:
+                        kind, _, index, payload, retiring = receiver.recv()
+                    except (EOFError, OSError):
+                        # the worker exited, possibly in the middle of a result
+                        requeue(worker_id, "worker died")
+                        continue
+
+                    in_flight[worker_id] = None
+
+                    if retiring:
+                        LOGGER.debug(f"Recycling worker {worker_id}")
+                        stop_worker(worker_id)
+                        start_worker()
+
+                    if index not in arguments:
+                        # a task that was requeued and has already completed elsewhere
+                        continue
+
+                    arguments.pop(index)
+
+                    if kind == "error":
+                        raise payload
+
+                    yield payload
+
+        finally:
+            for _, inbox, _ in workers.values():
+                inbox.put(None)
+
+            for worker_id, (process, _, _) in list(workers.items()):
+                process.join(timeout=_POLL_INTERVAL)
+                stop_worker(worker_id, terminate=process.is_alive())
@@ -0,0 +1,168 @@
+"""Native RMSD with optimal superposition over symmetry-equivalent atom mappings."""
+
+import functools
+import itertools
+import logging
+
+import numpy
+from openff.toolkit import Molecule
+
+LOGGER = logging.getLogger(__name__)
+
+# Highly symmetric molecules can have a combinatorial number of automorphisms; beyond
+# this many, the RMSD is minimized over only the first ones found
+_MAX_AUTOMORPHISMS = 10_000
+
+# Bound on the (pairs x automorphisms) evaluated in one batch, to bound memory use
+_BATCH_SIZE = 4096
+
+
+def _get_graph_key(molecule: Molecule) -> tuple:
+    """Return a hashable description of a molecule's graph, used as a cache key."""
+    return (
+        tuple(
+            (atom.atomic_number, atom.formal_charge.m, atom.is_aromatic)
+            for atom in molecule.atoms
+        ),
+        tuple(
+            sorted(
+                (bond.atom1_index, bond.atom2_index, bond.bond_order, bond.is_aromatic)
+                for bond in molecule.bonds
+            ),
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _get_heavy_atom_automorphisms(
+    graph_key: tuple,
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Return the indices of the heavy atoms of a molecule and its automorphisms, as an
+    array of shape (n_automorphisms, n_heavy_atoms) of positions in the heavy atoms.
+
+    Atoms are matched by element, formal charge, aromaticity and number of attached
+    hydrogens, and bonds by order, with aromatic bonds matched by aromaticity alone
+    so that Kekule structures do not break ring symmetry.
+    """
+    from networkx import Graph
+    from networkx.algorithms.isomorphism import GraphMatcher
+
+    atoms, bonds = graph_key
+
+    heavy = [
+        index for index, (atomic_number, _, _) in enumerate(atoms) if atomic_number != 1
+    ]
+
+    n_hydrogens = dict.fromkeys(heavy, 0)
+
+    graph = Graph()
+
+    for index in heavy:
+        graph.add_node(index)
+
+    for atom1, atom2, bond_order, is_aromatic in bonds:
+        if atom1 in n_hydrogens and atom2 in n_hydrogens:
+            graph.add_edge(
+                atom1,
+                atom2,
+                order="aromatic" if is_aromatic else bond_order,
+            )
+        elif atom1 in n_hydrogens:
+            n_hydrogens[atom1] += 1
+        elif atom2 in n_hydrogens:
+            n_hydrogens[atom2] += 1
+
+    for index in heavy:
+        graph.nodes[index]["label"] = (*atoms[index], n_hydrogens[index])
+
+    matcher = GraphMatcher(
+        graph,
+        graph,
+        node_match=lambda a, b: a["label"] == b["label"],
+        edge_match=lambda a, b: a["order"] == b["order"],
+    )
+
+    positions = {index: position for position, index in enumerate(heavy)}
+
+    automorphisms = [
+        [positions[mapping[index]] for index in heavy]
+        for mapping in itertools.islice(
+            matcher.isomorphisms_iter(),
+            _MAX_AUTOMORPHISMS,
+        )
+    ]
+
+    if len(automorphisms) == _MAX_AUTOMORPHISMS:
+        LOGGER.warning(
+            f"Only using the first {_MAX_AUTOMORPHISMS} automorphisms of a molecule "
+            f"with {len(heavy)} heavy atoms",
+        )
+
+    return numpy.array(heavy, dtype=int), numpy.array(automorphisms, dtype=int).reshape(
+        -1,
+        len(heavy),
+    )
+
+
+def _get_kabsch_rmsds(reference: numpy.ndarray, target: numpy.ndarray) -> numpy.ndarray:
+    """
+    Return the RMSDs between batches of conformers of shape (..., n_atoms, 3) after
+    superimposing each target onto its reference with the Kabsch algorithm.
+    """
+    reference = reference - reference.mean(axis=-2, keepdims=True)
+    target = target - target.mean(axis=-2, keepdims=True)
+
+    u, _, vt = numpy.linalg.svd(numpy.einsum("...ni,...nj->...ij", target, reference))
+
+    # flip the last singular vector where needed so that rotations are proper
+    u[..., :, -1] *= numpy.sign(numpy.linalg.det(u @ vt))[..., None]
+
+    rotated = target @ (u @ vt)
+
+    return numpy.sqrt(
+        numpy.sum((rotated - reference) ** 2, axis=(-2, -1)) / reference.shape[-2],
+    )
+
+
+def _get_symmetric_rmsds(
+    molecule: Molecule,
+    references: numpy.ndarray,
+    targets: numpy.ndarray,
+) -> numpy.ndarray:
+    """
+    Return the heavy atom RMSD [Angstrom] between each pair of conformers of shape
+    (n_pairs, n_atoms, 3), after optimal superposition and minimized over the
+    molecule's automorphisms.
+
+    This matches `oechem.OERMSD(reference, target, True, True, True)` (automorph,
+    heavy atoms only, overlay). Automorphisms are enumerated once per molecular graph
+    and cached.
+    """
+    references = numpy.asarray(references, dtype=float)
+    targets = numpy.asarray(targets, dtype=float)
+
+    heavy, automorphisms = _get_heavy_atom_automorphisms(_get_graph_key(molecule))
+
+    rmsds = numpy.zeros(len(references))
+
+    if len(heavy) < 2:
+        return rmsds
+
+    references = references[:, heavy]
+    targets = targets[:, heavy]
+
+    batch = max(1, _BATCH_SIZE // len(automorphisms))
+
+    for start in range(0, len(references), batch):
+        pairs = slice(start, start + batch)
+
+        rmsds[pairs] = _get_kabsch_rmsds(
+            references[pairs, None],
+            targets[pairs][:, automorphisms],
+        ).min(axis=1)
+
+    # exactly zero, rather than rounding error, for identical conformers
+    rmsds[numpy.all(references == targets, axis=(1, 2))] = 0.0
+
+    return rmsds
@@ -0,0 +1,106 @@
+"""Cost-aware ordering and chunking of minimization tasks."""
+
+import itertools
+import math
+from typing import Iterable, Iterator, Optional, TypeVar
+
+import numpy
+
+T = TypeVar("T")
+
+
+def _estimate_cost(n_atoms: int, n_rotatable_bonds: int) -> float:
+    """
+    Estimate the relative cost of building and minimizing one conformer.
+
+    Pairwise non-bonded interactions make each energy evaluation scale roughly
+    quadratically with the number of atoms, and flexible molecules tend to need more
+    minimizer iterations. The result is in arbitrary units and is only meaningful
+    relative to other estimates.
+    """
+    return float(n_atoms**2 * (1 + 0.5 * n_rotatable_bonds))
+
+
+def _estimate_cost_from_smiles(mapped_smiles: str) -> float:
+    from openff.toolkit import Molecule
+
+    molecule = Molecule.from_mapped_smiles(mapped_smiles, allow_undefined_stereo=True)
+
+    return _estimate_cost(
+        n_atoms=molecule.n_atoms,
+        n_rotatable_bonds=len(molecule.find_rotatable_bonds()),
+    )
+
+
+def _calibrate_costs(
+    estimates: dict[str, float],
+    timings: Optional[dict[str, float]] = None,
+) -> dict[str, float]:
+    """
+    Combine heuristic cost estimates with measured timings, keyed by InChI key.
+
+    Keys with a measured timing use it directly. The remaining estimates are put on
+    the same scale (seconds) using the median ratio of measured to estimated cost,
+    so that the two kinds of values can be sorted together.
+    """
+    if not timings:
+        return dict(estimates)
+
+    ratios = [
+        timings[key] / estimates[key]
+        for key in estimates
+        if key in timings and estimates[key] > 0
+    ]
+
+    scale = float(numpy.median(ratios)) if ratios else 1.0
+
+    return {
+        key: timings[key] if key in timings else estimate * scale
+        for key, estimate in estimates.items()
+    }
+
+
+def _sort_by_cost(tasks: list[T], costs: list[float]) -> list[T]:
+    """Sort tasks so that the most expensive ones are dispatched first."""
+    return [
+        task
+        for _, _, task in sorted(
+            zip(costs, range(len(tasks)), tasks),
+            key=lambda item: (-item[0], item[1]),
+        )
+    ]
+
+
+def _guided_chunks(
+    tasks: Iterable[T],
+    n_processes: int,
+    max_chunksize: int = 32,
+    n_tasks: Optional[int] = None,
+) -> Iterator[list[T]]:
+    """
+    Split tasks into chunks that shrink as the run progresses.
+
+    Each chunk holds a fraction of the remaining work (guided self-scheduling),
+    capped at `max_chunksize`, so that early chunks amortize dispatch overhead and the
+    last few chunks are single tasks that keep every worker busy until the end.
+
+    `tasks` is consumed lazily; if it has no length, `n_tasks` must be given.
+    """
+    remaining = len(tasks) if n_tasks is None else n_tasks
+
+    iterator = iter(tasks)
+
+    while remaining > 0:
+        size = max(
+            1,
+            min(max_chunksize, math.ceil(remaining / (2 * max(1, n_processes)))),
+        )
+
+        chunk = list(itertools.islice(iterator, size))
+
+        if len(chunk) == 0:
+            return
+
+        yield chunk
+
+        remaining -= len(chunk)
@@ -1,16 +1,27 @@
 """A module for managing the database session."""
 
+import logging
+import math
+import random
+import time
 from collections import defaultdict
-from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional, TypeVar
+
+from sqlalchemy import delete, insert, literal, select, update
+from sqlalchemy.exc import OperationalError
 
 from yammbs._db import (
     DB_VERSION,
     DBGeneralProvenance,
     DBInformation,
+    DBMetricRecord,
+    DBMinimizationTiming,
     DBMMConformerRecord,
     DBMoleculeRecord,
     DBQMConformerRecord,
     DBSoftwareProvenance,
+    DBWorkLease,
+    _is_current,
 )
 
 if TYPE_CHECKING:
@@ -18,6 +29,38 @@ if TYPE_CHECKING:
 
     from yammbs.models import MMConformerRecord, MoleculeRecord, QMConformerRecord
 
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _retry_if_locked(
+    func: Callable[[], T],
+    max_attempts: int = 10,
+    delay: float = 0.05,
+) -> T:
+    """
+    Call `func`, retrying with jittered exponential backoff while SQLite reports that
+    the database is locked by another process.
+
+    `func` should open, use and commit its own session so that each attempt is a
+    short, complete transaction.
+    """
+    attempt = 0
+
+    while True:
+        try:
+            return func()
+        except OperationalError as error:
+            attempt += 1
+
+            if "locked" not in str(error) or attempt >= max_attempts:
+                raise
+
+            LOGGER.debug(f"Database locked, retrying (attempt {attempt})")
+
+            time.sleep(delay * 2 ** (attempt - 1) * (1 + random.random()))
+
 
 class DBQueryResult(NamedTuple):
     """A named tuple representing a single row of a database query."""
@@ -201,18 +244,149 @@ class DBSessionManager:
     def store_mm_conformer_record(
         self,
         record: "MMConformerRecord",
+        fingerprint: Optional[str] = None,
     ):
         self.db.add(
             DBMMConformerRecord(
                 parent_id=record.molecule_id,
                 qcarchive_id=record.qcarchive_id,
                 force_field=record.force_field,
+                fingerprint=fingerprint,
                 mapped_smiles=record.mapped_smiles,
                 coordinates=record.coordinates,
                 energy=record.energy,
             ),
         )
 
+    def store_minimization_timing(
+        self,
+        molecule_id: int,
+        qcarchive_id: int,
+        force_field: str,
+        elapsed: float,
+    ):
+        self.db.add(
+            DBMinimizationTiming(
+                parent_id=molecule_id,
+                qcarchive_id=qcarchive_id,
+                force_field=force_field,
+                elapsed=elapsed,
+            ),
+        )
+
+    def store_metric(
+        self,
+        molecule_id: int,
+        qcarchive_id: int,
+        force_field: str,
+        name: str,
+        version: int,
+        value: float,
+        fingerprint: Optional[str] = None,
+    ):
+        """Store a metric value, unless one is already stored for the same conformer,
+        force field (and fingerprint), metric and version. NaN, which marks a value that
+        could not be computed, is stored as NULL."""
+        self.db.execute(
+            insert(DBMetricRecord)
+            .prefix_with("OR IGNORE")
+            .values(
+                parent_id=molecule_id,
+                qcarchive_id=qcarchive_id,
+                force_field=force_field,
+                fingerprint=fingerprint,
+                name=name,
+                version=version,
+                value=None if math.isnan(value) else value,
+            ),
+        )
+
+    def claim_qm_conformers(
+        self,
+        qm_conformer_ids: List[int],
+        force_field: str,
+        owner: str,
+        expires: float,
+        now: float,
+        fingerprint: Optional[str] = None,
+    ) -> List[int]:
+        """Lease the given QM conformers to `owner` until `expires`, returning the ids
+        actually claimed.
+
+        Conformers already minimized with the version of this force field given by
+        `fingerprint`, or leased to another owner until after `now`, are not claimed.
+        """
+        self.db.execute(
+            insert(DBWorkLease)
+            .prefix_with("OR IGNORE")
+            .from_select(
+                ["qm_conformer_id", "force_field", "owner", "expires"],
+                select(
+                    DBQMConformerRecord.id,
+                    literal(force_field),
+                    literal(owner),
+                    literal(expires),
+                )
+                .where(DBQMConformerRecord.id.in_(qm_conformer_ids))
+                .where(
+                    DBQMConformerRecord.qcarchive_id.not_in(
+                        select(DBMMConformerRecord.qcarchive_id)
+                        .filter_by(force_field=force_field)
+                        .filter(
+                            _is_current(DBMMConformerRecord.fingerprint, fingerprint),
+                        ),
+                    ),
+                ),
+            ),
+        )
+
+        # take over leases whose owner has stopped renewing them
+        self.db.execute(
+            update(DBWorkLease)
+            .where(DBWorkLease.qm_conformer_id.in_(qm_conformer_ids))
+            .where(DBWorkLease.force_field == force_field)
+            .where(DBWorkLease.expires < now)
+            .values(owner=owner, expires=expires),
+        )
+
+        return [
+            id
+            for (id,) in self.db.execute(
+                select(DBWorkLease.qm_conformer_id)
+                .where(DBWorkLease.qm_conformer_id.in_(qm_conformer_ids))
+                .where(DBWorkLease.force_field == force_field)
+                .where(DBWorkLease.owner == owner),
+            )
+        ]
+
+    def get_leased_qm_conformer_ids(
+        self,
+        force_field: str,
+        now: float,
+        exclude_owner: Optional[str] = None,
+    ) -> set[int]:
+        """Return the ids of QM conformers with a lease that has not expired."""
+        query = (
+            select(DBWorkLease.qm_conformer_id)
+            .where(DBWorkLease.force_field == force_field)
+            .where(DBWorkLease.expires >= now)
+        )
+
+        if exclude_owner is not None:
+            query = query.where(DBWorkLease.owner != exclude_owner)
+
+        return {id for (id,) in self.db.execute(query)}
+
+    def renew_leases(self, owner: str, expires: float):
+        self.db.execute(
+            update(DBWorkLease)
+            .where(DBWorkLease.owner == owner)
+            .values(expires=expires),
+        )
+
+    def release_leases(self, owner: str):
+        self.db.execute(delete(DBWorkLease).where(DBWorkLease.owner == owner))
+
     def _mm_conformer_already_exists(
         self,
         qcarchive_id: int,
@@ -0,0 +1,113 @@
+"""Nearest neighbours of molecules by Tanimoto similarity of Morgan fingerprints."""
+
+from typing import TYPE_CHECKING
+
+import numpy
+
+if TYPE_CHECKING:
+    from rdkit import Chem
+
+_MORGAN = "morgan"
+_MORGAN_RADIUS = 2
+_MORGAN_SIZE = 2048
+
+# the number of bits set in each byte, for numpy without bitwise_count
+_POPCOUNT = numpy.array(
+    [bin(byte).count("1") for byte in range(256)],
+    dtype=numpy.uint8,
+)
+
+
+def _get_morgan_fingerprint(rdmol: "Chem.Mol") -> numpy.ndarray:
+    from rdkit import DataStructs
+    from rdkit.Chem import rdFingerprintGenerator
+
+    generator = rdFingerprintGenerator.GetMorganGenerator(
+        radius=_MORGAN_RADIUS,
+        fpSize=_MORGAN_SIZE,
+    )
+
+    bits = numpy.zeros(_MORGAN_SIZE, dtype=numpy.uint8)
+
+    DataStructs.ConvertToNumpyArray(generator.GetFingerprint(rdmol), bits)
+
+    return bits.astype(bool)
+
+
+def _popcount(packed: numpy.ndarray) -> numpy.ndarray:
+    """Count the bits set in each row of packed fingerprints."""
+    if hasattr(numpy, "bitwise_count"):
+        words = packed.view(numpy.uint64)
+
+        return numpy.bitwise_count(words).sum(axis=-1, dtype=numpy.int64)
+
+    return _POPCOUNT[packed].sum(axis=-1, dtype=numpy.int64)
+
+
+class _SimilarityIndex:
+    """
+    Packed fingerprints of all molecules in a store, one row of `_MORGAN_SIZE // 8`
+    bytes each, with their bit counts, searched exhaustively. A query is one AND and
+    popcount per molecule, so stores of 100k molecules are searched in milliseconds.
+    """
+
+    def __init__(self, molecule_ids: numpy.ndarray, fingerprints: numpy.ndarray):
+        self.molecule_ids = numpy.asarray(molecule_ids, dtype=int)
+        self.fingerprints = numpy.ascontiguousarray(fingerprints, dtype=numpy.uint8)
+        self.counts = _popcount(self.fingerprints)
+
+        self._rows = {id: row for row, id in enumerate(self.molecule_ids.tolist())}
+
+    @classmethod
+    def from_fingerprints(
+        cls,
+        fingerprints: dict[int, numpy.ndarray],
+    ) -> "_SimilarityIndex":
+        molecule_ids = numpy.array(sorted(fingerprints), dtype=int)
+
+        return cls(
+            molecule_ids,
+            numpy.array(
+                [fingerprints[id] for id in molecule_ids.tolist()],
+                dtype=numpy.uint8,
+            ).reshape(-1, _MORGAN_SIZE // 8),
+        )
+
+    def __contains__(self, molecule_id: int) -> bool:
+        return molecule_id in self._rows
+
+    def tanimoto(self, molecule_id: int) -> numpy.ndarray:
+        """Return the similarity of every molecule in the index to one of them."""
+        row = self._rows[molecule_id]
+
+        common = _popcount(self.fingerprints & self.fingerprints[row])
+        union = self.counts + self.counts[row] - common
+
+        # molecules without any bits set are only similar to themselves
+        return numpy.divide(
+            common,
+            union,
+            out=numpy.zeros(len(common)),
+            where=union > 0,
+        )
+
+    def nearest(self, molecule_id: int, k: int) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Return the ids and similarities of the `k` molecules most similar to one of
+        them, excluding itself, most similar first.
+        """
+        similarities = self.tanimoto(molecule_id)
+        similarities[self._rows[molecule_id]] = -1
+
+        k = min(k, len(similarities) - 1)
+
+        if k <= 0:
+            return numpy.empty(0, dtype=int), numpy.empty(0)
+
+        # argpartition to find the k largest in linear time, then sort only those
+        nearest = numpy.argpartition(-similarities, k - 1)[:k]
+        nearest = nearest[
+            numpy.lexsort((self.molecule_ids[nearest], -similarities[nearest]))
+        ]
+
+        return self.molecule_ids[nearest], similarities[nearest]
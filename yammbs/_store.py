@@ -1,40 +1,67 @@
+import functools
+import hashlib
 import logging
 import pathlib
-from collections import defaultdict
+import time
+from concurrent.futures import Executor
 from contextlib import contextmanager
-from typing import ContextManager, Iterable, TypeVar
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ContextManager,
+    Iterable,
+    Iterator,
+    TypeVar,
+)
 
 import numpy
+import pandas
 from openff.qcsubmit.results import OptimizationResultCollection
-from openff.toolkit import Molecule
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, select
 from sqlalchemy.orm import Session, sessionmaker
 
 from yammbs._db import (
     DBBase,
+    DBFunctionalGroup,
+    DBFunctionalGroupAnalysis,
+    DBMetricRecord,
+    DBMinimizationTiming,
     DBMMConformerRecord,
+    DBMoleculeDescriptors,
+    DBMoleculeElement,
+    DBMoleculeFingerprint,
     DBMoleculeRecord,
+    DBParameterLabel,
+    DBParameterLabelRun,
     DBQMConformerRecord,
+    DBSelectionIndex,
+    DBSmirksMatch,
+    DBTuningRecord,
+    _add_missing_columns,
+    _is_current,
 )
-from yammbs._session import DBSessionManager
+from yammbs._session import DBSessionManager, _retry_if_locked
 from yammbs._types import Pathlike
 from yammbs.analysis import (
-    DDE,
-    ICRMSD,
-    RMSD,
-    TFD,
+    _ICRMSD_NAMES,
+    _METRIC_VERSIONS,
     DDECollection,
     ICRMSDCollection,
     RMSDCollection,
     TFDCollection,
-    get_internal_coordinate_rmsds,
-    get_rmsd,
-    get_tfd,
+    _get_metric_columns,
+    _get_metric_version,
 )
 from yammbs.cached_result import CachedResultCollection
 from yammbs.checkmol import ChemicalEnvironment
 from yammbs.exceptions import DatabaseExistsError
 from yammbs.models import MMConformerRecord, MoleculeRecord, QMConformerRecord
+from yammbs.selection import MoleculeSelection
+
+if TYPE_CHECKING:
+    from yammbs._minimize import MinimizationResult
+    from yammbs._similarity import _SimilarityIndex
 
 LOGGER = logging.getLogger(__name__)
 
@@ -46,7 +73,22 @@ class MoleculeStore:
         with self._get_session() as db:
             return db.db.query(DBMoleculeRecord.mapped_smiles).count()
 
-    def __init__(self, database_path: Pathlike = "molecule-store.sqlite"):
+    def __init__(
+        self,
+        database_path: Pathlike = "molecule-store.sqlite",
+        molecule_cache_size: int = 1024,
+    ):
+        """
+        Open, or create, a store.
+
+        Parameters
+        ----------
+        database_path
+            The path to the SQLite database, ending in .sqlite.
+        molecule_cache_size
+            The number of molecules kept in memory, per process, by workers computing
+            metrics. Molecules are cached by mapped SMILES. Zero disables the cache.
+        """
         database_path = pathlib.Path(database_path)
 
         if not database_path.suffix.lower() == ".sqlite":
@@ -55,9 +97,11 @@ class MoleculeStore:
                 f"are supported. Given: {database_path}",
             )
 
-        self.database_url = f"sqlite:///{database_path.resolve()}"
+        self.database_path = database_path.resolve()
+        self.database_url = f"sqlite:///{self.database_path}"
         self.engine = create_engine(self.database_url)
         DBBase.metadata.create_all(self.engine)
+        _add_missing_columns(self.engine)
 
         self._sessionmaker = sessionmaker(
             autocommit=False,
@@ -65,6 +109,19 @@ class MoleculeStore:
             bind=self.engine,
         )
 
+        self.molecule_cache_size = molecule_cache_size
+
+        # bitmaps of selections, keyed by (kind, key), with the state of the store
+        # they were made in
+        self._selections: dict[
+            tuple[str, str],
+            tuple[tuple[int, int], numpy.ndarray],
+        ] = dict()
+
+        # fingerprints of all molecules for similarity searches, with the state of the
+        # store they were loaded in
+        self._similarity: tuple[tuple[int, int], "_SimilarityIndex"] | None = None
+
         with self._get_session() as db:
             self.db_version = db.check_version()
             self.general_provenance = db.get_general_provenance()
@@ -233,18 +290,6 @@ class MoleculeStore:
                 .all()
             ]
 
-    def _get_molecule_by_inchi_key(self, inchi_key: str) -> Molecule:
-        """
-        Create a new `Molecule` object from the given inchi key, using atom mapping from the
-        **mapped** SMILES associated with the molecule id associated with the inchi key.
-        """
-        return Molecule.from_mapped_smiles(
-            mapped_smiles=self.get_smiles_by_molecule_id(
-                id=self.get_molecule_id_by_inchi_key(inchi_key),
-            ),
-            allow_undefined_stereo=True,
-        )
-
     # TODO: if this can take a list of ids, should it sort by QCArchive ID
     def get_molecule_id_by_qcarchive_id(self, id: str) -> int:
         with self._get_session() as db:
@@ -288,6 +333,7 @@ class MoleculeStore:
                 for (conformer,) in db.db.query(DBMMConformerRecord.coordinates)
                 .filter_by(parent_id=id)
                 .filter_by(force_field=force_field)
+                .filter(_is_current_mm_conformer(force_field))
                 .order_by(DBMMConformerRecord.qcarchive_id)
                 .all()
             ]
@@ -308,6 +354,7 @@ class MoleculeStore:
                 for (conformer,) in db.db.query(DBMMConformerRecord.coordinates)
                 .filter_by(qcarchive_id=id)
                 .filter_by(force_field=force_field)
+                .filter(_is_current_mm_conformer(force_field))
                 .all()
             ][0]
 
@@ -336,6 +383,7 @@ class MoleculeStore:
                 for (energy,) in db.db.query(DBMMConformerRecord.energy)
                 .filter_by(parent_id=id)
                 .filter_by(force_field=force_field)
+                .filter(_is_current_mm_conformer(force_field))
                 .order_by(DBMMConformerRecord.qcarchive_id)
                 .all()
             ]
@@ -379,6 +427,7 @@ class MoleculeStore:
                 for x in db.db.query(DBMMConformerRecord)
                 .filter_by(parent_id=molecule_id)
                 .filter_by(force_field=force_field)
+                .filter(_is_current_mm_conformer(force_field))
                 .order_by(DBMMConformerRecord.qcarchive_id)
                 .all()
             ]
@@ -489,356 +538,2332 @@ class MoleculeStore:
 
         return store
 
-    def _map_inchi_keys_to_qm_conformers(self, force_field: str) -> dict[str, list]:
-        inchi_keys = self.get_inchi_keys()
-
-        mapping = defaultdict(list)
-
-        for inchi_key in inchi_keys:
-            molecule_id = self.get_molecule_id_by_inchi_key(inchi_key)
-
-            # TODO: Should the session be inside or outside of the inchi loop?
-            with self._get_session() as db:
-                qm_conformers = [
-                    {
-                        "qcarchive_id": record.qcarchive_id,
-                        "mapped_smiles": record.mapped_smiles,
-                        "coordinates": record.coordinates,
-                    }
-                    for record in db.db.query(
-                        DBQMConformerRecord,
-                    )
-                    .filter_by(parent_id=molecule_id)
-                    .all()
-                ]
-
-                for qm_conformer in qm_conformers:
-                    if not db._mm_conformer_already_exists(
-                        qcarchive_id=qm_conformer["qcarchive_id"],
-                        force_field=force_field,
-                    ):
-                        mapping[inchi_key].append(qm_conformer)
-                    else:
-                        pass
-
-        return mapping
-
-    def optimize_mm(
+    def _get_pending_qm_conformers(
         self,
         force_field: str,
-        n_processes: int = 2,
-        chunksize=32,
-    ):
-        from yammbs._minimize import _minimize_blob
+        shard_index: int | None = None,
+        n_shards: int | None = None,
+    ) -> list[tuple[int, str]]:
+        """
+        Return the database id and InChI key of each QM conformer that does not yet have
+        an MM conformer from the current version of this force field, most expensive to
+        minimize first.
 
-        inchi_key_qm_conformer_mapping = self._map_inchi_keys_to_qm_conformers(
-            force_field=force_field,
+        Only ids and keys are loaded, not coordinates. As elsewhere, conformers are
+        taken from the first molecule stored with each InChI key. If `n_shards` is
+        given, only conformers of molecules in shard `shard_index` are returned.
+        """
+        from yammbs._scheduling import (
+            _calibrate_costs,
+            _estimate_cost,
+            _estimate_cost_from_smiles,
+            _sort_by_cost,
         )
 
-        if len(inchi_key_qm_conformer_mapping) == 0:
-            return
-
-        _minimized_blob = _minimize_blob(
-            input=inchi_key_qm_conformer_mapping,
-            force_field=force_field,
-            n_processes=n_processes,
-            chunksize=chunksize,
+        first_molecule_ids = select(func.min(DBMoleculeRecord.id)).group_by(
+            DBMoleculeRecord.inchi_key,
         )
 
         with self._get_session() as db:
-            inchi_to_id: dict[str, int] = {
-                inchi_key: id
-                for (id, inchi_key) in reversed(
-                    db.db.query(
-                        DBMoleculeRecord.id,
-                        DBMoleculeRecord.inchi_key,
-                    ).all(),
+            pending = [
+                (id, inchi_key)
+                for (id, inchi_key) in db.db.query(
+                    DBQMConformerRecord.id,
+                    DBMoleculeRecord.inchi_key,
                 )
-            }
+                .join(
+                    DBMoleculeRecord,
+                    DBMoleculeRecord.id == DBQMConformerRecord.parent_id,
+                )
+                .filter(DBMoleculeRecord.id.in_(first_molecule_ids))
+                .filter(
+                    DBQMConformerRecord.qcarchive_id.not_in(
+                        select(DBMMConformerRecord.qcarchive_id)
+                        .filter_by(force_field=force_field)
+                        .filter(_is_current_mm_conformer(force_field)),
+                    ),
+                )
+                .order_by(DBQMConformerRecord.id)
+            ]
 
-        with self._get_session() as db:
-            # from _mm_conformer_already_exists
-            seen = set(
-                db.db.query(
-                    DBMMConformerRecord.qcarchive_id,
-                ).filter_by(
-                    force_field=force_field,
-                ),
-            )
-            for result in _minimized_blob:
-                if result.qcarchive_id in seen:
-                    continue
+            if n_shards is not None:
+                pending = [
+                    (id, inchi_key)
+                    for (id, inchi_key) in pending
+                    if _get_shard(inchi_key, n_shards) == shard_index
+                ]
 
-                molecule_id = inchi_to_id[result.inchi_key]
+            pending_inchi_keys = {inchi_key for _, inchi_key in pending}
 
-                record = MMConformerRecord(
-                    molecule_id=molecule_id,
-                    qcarchive_id=result.qcarchive_id,
-                    force_field=result.force_field,
-                    mapped_smiles=result.mapped_smiles,
-                    energy=result.energy,
-                    coordinates=result.coordinates,
+            estimates = {
+                inchi_key: _estimate_cost(n_atoms, n_rotatable_bonds)
+                for (inchi_key, n_atoms, n_rotatable_bonds) in db.db.query(
+                    DBMoleculeRecord.inchi_key,
+                    DBMoleculeDescriptors.n_atoms,
+                    DBMoleculeDescriptors.n_rotatable_bonds,
                 )
+                .join(
+                    DBMoleculeDescriptors,
+                    DBMoleculeDescriptors.parent_id == DBMoleculeRecord.id,
+                )
+                .filter(DBMoleculeRecord.id.in_(first_molecule_ids))
+                if inchi_key in pending_inchi_keys
+            }
+
+            # molecules stored without descriptors are parsed instead
+            mapped_smiles = {
+                inchi_key: smiles
+                for (inchi_key, smiles) in db.db.query(
+                    DBMoleculeRecord.inchi_key,
+                    DBMoleculeRecord.mapped_smiles,
+                ).filter(DBMoleculeRecord.id.in_(first_molecule_ids))
+                if inchi_key in pending_inchi_keys and inchi_key not in estimates
+            }
 
-                # inlined from MoleculeStore.store_conformer
-                seen.add(record.qcarchive_id)
+        estimates.update(
+            (inchi_key, _estimate_cost_from_smiles(smiles))
+            for inchi_key, smiles in mapped_smiles.items()
+        )
+
+        costs = _calibrate_costs(
+            estimates=estimates,
+            timings=self._get_minimization_timings(),
+        )
 
-                db.store_mm_conformer_record(record)
+        return _sort_by_cost(pending, [costs[inchi_key] for _, inchi_key in pending])
 
-    def get_dde(
+    def _iter_qm_conformers(
+        self,
+        pending: list[tuple[int, str]],
+        page_size: int = 500,
+    ) -> Iterator[tuple[str, dict]]:
+        """
+        Lazily load QM conformers, given as (database id, InChI key) pairs, in pages of
+        `page_size`, yielding (InChI key, conformer) pairs in the given order.
+        """
+        for start in range(0, len(pending), page_size):
+            page = pending[start : start + page_size]
+
+            with self._get_session() as db:
+                records = {
+                    id: {
+                        "qcarchive_id": qcarchive_id,
+                        "mapped_smiles": mapped_smiles,
+                        "coordinates": coordinates,
+                    }
+                    for (
+                        id,
+                        qcarchive_id,
+                        mapped_smiles,
+                        coordinates,
+                    ) in db.db.query(
+                        DBQMConformerRecord.id,
+                        DBQMConformerRecord.qcarchive_id,
+                        DBQMConformerRecord.mapped_smiles,
+                        DBQMConformerRecord.coordinates,
+                    ).filter(DBQMConformerRecord.id.in_([id for id, _ in page]))
+                }
+
+            for id, inchi_key in page:
+                yield inchi_key, records[id]
+
+    def _get_minimization_timings(self) -> dict[str, float]:
+        """
+        Return the mean wall time [s] of past minimizations of each molecule, keyed by
+        InChI key and averaged over all force fields.
+        """
+        with self._get_session() as db:
+            return {
+                inchi_key: elapsed
+                for (inchi_key, elapsed) in db.db.query(
+                    DBMoleculeRecord.inchi_key,
+                    func.avg(DBMinimizationTiming.elapsed),
+                )
+                .join(
+                    DBMinimizationTiming,
+                    DBMinimizationTiming.parent_id == DBMoleculeRecord.id,
+                )
+                .group_by(DBMoleculeRecord.inchi_key)
+            }
+
+    def _autotune(
         self,
         force_field: str,
-        molecule_ids: list[int] | None = None,
-        skip_check: bool = False,
-    ) -> DDECollection:
-        if not molecule_ids:
-            molecule_ids = self.get_molecule_ids()
+        pending: list[tuple[int, str]],
+        memory_budget: int | None = None,
+    ) -> tuple[int, int, int]:
+        """
+        Return the number of processes, threads per process and chunk size to use for
+        minimizations on this machine.
 
-        if not skip_check:
-            self.optimize_mm(force_field=force_field)
+        A configuration previously calibrated on this host with the same
+        `memory_budget` is reused if one is stored.
+        Otherwise a sample of the pending conformers is minimized with a range of
+        configurations and the one with the highest throughput is stored and returned.
+        """
+        from yammbs._minimize import MinimizationInput
+        from yammbs._tuning import _calibrate, _get_host, _get_n_cpus
 
-        ddes = DDECollection()
+        host, n_cpus = _get_host(), _get_n_cpus()
 
-        for inchi_key in self.get_inchi_keys():
-            molecule_id = self.get_molecule_id_by_inchi_key(inchi_key)
+        with self._get_session() as db:
+            existing = (
+                db.db.query(DBTuningRecord)
+                .filter_by(host=host, n_cpus=n_cpus, memory_budget=memory_budget)
+                .order_by(DBTuningRecord.id.desc())
+                .first()
+            )
 
-            if molecule_id not in molecule_ids:
-                continue
+            if existing is not None:
+                return existing.n_processes, existing.n_threads, existing.chunksize
+
+        # evenly spaced, so that the sample spans the range of molecule sizes
+        sample = [
+            MinimizationInput(
+                inchi_key=inchi_key,
+                qcarchive_id=row["qcarchive_id"],
+                force_field=force_field,
+                mapped_smiles=row["mapped_smiles"],
+                coordinates=row["coordinates"],
+            )
+            for inchi_key, row in self._iter_qm_conformers(
+                pending[:: max(1, len(pending) // (2 * n_cpus))],
+            )
+        ]
 
-            qcarchive_ids = self.get_qcarchive_ids_by_molecule_id(molecule_id)
+        result = _calibrate(sample, memory_budget=memory_budget, n_cpus=n_cpus)
 
-            if len(qcarchive_ids) == 1:
-                # There's only one conformer for this molecule
-                # TODO: Quicker way of short-circuiting here
-                continue
+        LOGGER.info(f"Calibrated minimization settings: {result}")
 
-            # these functions should each return list[float],
-            # implicitly both in kcal/mol
-            qm_energies = numpy.array(
-                self.get_qm_energies_by_molecule_id(
-                    molecule_id,
+        with self._get_session() as db:
+            db.db.add(
+                DBTuningRecord(
+                    host=host,
+                    n_cpus=n_cpus,
+                    memory_budget=memory_budget,
+                    n_processes=result.n_processes,
+                    n_threads=result.n_threads,
+                    chunksize=result.chunksize,
+                    throughput=result.throughput,
                 ),
             )
 
-            mm_energies = numpy.array(
-                self.get_mm_energies_by_molecule_id(
-                    molecule_id,
-                    force_field,
-                ),
-            )
+        return result.n_processes, result.n_threads, result.chunksize
 
-            if len(mm_energies) != len(qm_energies):
-                continue
+    def optimize_mm(
+        self,
+        force_field: str,
+        n_processes: int | str = 2,
+        chunksize=32,
+        memory_budget: int | None = None,
+        max_tasks_per_child: int | None = None,
+        max_rss: int | None = None,
+        shared_memory: bool = False,
+        shard_index: int | None = None,
+        n_shards: int | None = None,
+        output: Pathlike | None = None,
+        lease_size: int | None = None,
+        lease_duration: float = 600.0,
+        executor: Executor | str | None = None,
+        metrics: Iterable[str] = (),
+    ):
+        """
+        Minimize all QM conformers that do not yet have an MM conformer with this force
+        field and store the results.
 
-            qm_minimum_index = qm_energies.argmin()
+        MM conformers are stored with a fingerprint of the parameters the force field
+        resolves to. Those minimized with an earlier version of it are kept, but not
+        used by analyses, and their QM conformers are minimized again.
 
-            mm_energies -= mm_energies[qm_minimum_index]
-            qm_energies -= qm_energies[qm_minimum_index]
+        Parameters
+        ----------
+        force_field
+            The force field to minimize with.
+        n_processes
+            The number of worker processes, or "auto" to calibrate the number of
+            processes, threads per process and chunk size on a sample of the pending
+            conformers. Calibrated settings are stored and reused on the same host.
+        chunksize
+            The largest number of conformers sent to a worker at once. Ignored if
+            `n_processes` is "auto".
+        memory_budget
+            The total memory [bytes] workers may use when `n_processes` is "auto".
+            Defaults to 80% of physical memory.
+        max_tasks_per_child
+            The number of chunks a worker process minimizes before it is replaced with a
+            fresh one, releasing memory held by caches in the old worker.
+        max_rss
+            A resident memory threshold [bytes] per worker. Workers that cross it retire
+            after their current chunk; workers that grow well past it are terminated and
+            their chunk is requeued.
+        shared_memory
+            Exchange coordinates with workers through shared memory instead of
+            pickling them with each task, which reduces dispatch overhead for large
+            datasets. Unlike the default, this loads all pending coordinates at once
+            rather than paging them out of the database as workers need them.
+        shard_index
+            With `n_shards`, minimize only the molecules in this shard (0-indexed).
+            Molecules are assigned to shards by a hash of their InChI key, so separate
+            processes or machines given the same `n_shards` and different indices
+            split the work between them without overlap.
+        n_shards
+            The number of shards the pending work is split into.
+        output
+            The path of a store to write results to instead of this one, such as a
+            small per-shard store that is later combined with `MoleculeStore.merge`.
+            It is created if needed, and conformers already minimized in it are skipped.
+        lease_size
+            If given, claim pending conformers in batches of this size through leases
+            recorded in the store, so that several processes can call `optimize_mm` on
+            the same store at once without repeating each other's work. Cannot be
+            combined with `output`.
+        lease_duration
+            How long [s] a claimed batch is reserved for this process. Leases are
+            renewed while the batch is running; a batch whose process dies becomes
+            available to others once its lease expires.
+        executor
+            A `concurrent.futures.Executor`, or the name of one, to dispatch
+            minimizations through instead of the built-in process pool; see
+            `yammbs.executors`. Cannot be combined with `max_tasks_per_child`,
+            `max_rss` or `shared_memory`.
+        metrics
+            Names of metrics ("rmsd", "tfd" and/or "icrmsd") to compute in the workers
+            right after each minimization, while both geometries are in memory. They
+            are stored with the MM conformers and used by `get_rmsd`, `get_tfd` and
+            `get_internal_coordinate_rmsd` instead of recomputing them. Cannot be
+            combined with `shared_memory`.
+        """
+        from yammbs._minimize import _minimize_blob
 
-            mm_energies[qm_minimum_index] = numpy.nan
-            qm_energies[qm_minimum_index] = numpy.nan
+        metrics = tuple(metrics)
 
-            for qm, mm, id in zip(
-                qm_energies,
-                mm_energies,
-                qcarchive_ids,
-            ):
-                ddes.append(
-                    DDE(
-                        qcarchive_id=id,
-                        difference=mm - qm,
-                        force_field=force_field,
-                    ),
+        for metric in metrics:
+            if metric not in _METRIC_VERSIONS:
+                raise ValueError(
+                    f"Unknown metric {metric}, expected one of {[*_METRIC_VERSIONS]}",
                 )
 
-        return ddes
+        if (shard_index is None) != (n_shards is None):
+            raise ValueError("shard_index and n_shards must be given together")
 
-    def get_rmsd(
-        self,
-        force_field: str,
-        molecule_ids: list[int] | None = None,
-        skip_check: bool = False,
-    ) -> RMSDCollection:
-        if not molecule_ids:
-            molecule_ids = self.get_molecule_ids()
+        if n_shards is not None and not 0 <= shard_index < n_shards:
+            raise ValueError(
+                f"shard_index must be in [0, {n_shards}), got {shard_index}",
+            )
 
-        if not skip_check:
-            self.optimize_mm(force_field=force_field)
+        if lease_size is not None and output is not None:
+            raise ValueError("lease_size cannot be combined with output")
 
-        rmsds = RMSDCollection()
+        target = self if output is None else type(self)(output)
 
-        for inchi_key in self.get_inchi_keys():
-            molecule_id = self.get_molecule_id_by_inchi_key(inchi_key)
+        pending = self._get_pending_qm_conformers(
+            force_field=force_field,
+            shard_index=shard_index,
+            n_shards=n_shards,
+        )
 
-            if molecule_id not in molecule_ids:
-                continue
+        if target is not self:
+            pending = target._copy_pending_molecules(
+                source=self,
+                pending=pending,
+                force_field=force_field,
+            )
 
-            qcarchive_ids = self.get_qcarchive_ids_by_molecule_id(molecule_id)
+        if len(pending) == 0:
+            return
 
-            qm_conformers = self.get_qm_conformers_by_molecule_id(molecule_id)
-            mm_conformers = self.get_mm_conformers_by_molecule_id(
-                molecule_id,
-                force_field,
+        n_threads = None
+
+        if n_processes == "auto":
+            n_processes, n_threads, chunksize = self._autotune(
+                force_field=force_field,
+                pending=pending,
+                memory_budget=memory_budget,
             )
 
-            molecule = self._get_molecule_by_inchi_key(inchi_key)
+        minimize = functools.partial(
+            _minimize_blob,
+            force_field=force_field,
+            n_processes=n_processes,
+            chunksize=chunksize,
+            n_threads=n_threads,
+            max_tasks_per_child=max_tasks_per_child,
+            max_rss=max_rss,
+            shared_memory=shared_memory,
+            executor=executor,
+            metrics=metrics,
+        )
 
-            for qm, mm, id in zip(
-                qm_conformers,
-                mm_conformers,
-                qcarchive_ids,
-            ):
-                rmsds.append(
-                    RMSD(
-                        qcarchive_id=id,
-                        rmsd=get_rmsd(molecule, qm, mm),
-                        force_field=force_field,
-                    ),
-                )
+        if lease_size is not None:
+            self._optimize_mm_with_leases(
+                minimize=minimize,
+                pending=pending,
+                force_field=force_field,
+                shard_index=shard_index,
+                n_shards=n_shards,
+                lease_size=lease_size,
+                lease_duration=lease_duration,
+            )
+            return
 
-        return rmsds
+        target._store_minimization_results(
+            minimize(input=self._iter_qm_conformers(pending), n_tasks=len(pending)),
+            force_field=force_field,
+        )
 
-    def get_internal_coordinate_rmsd(
+    def _optimize_mm_with_leases(
         self,
+        minimize: Callable[..., Iterable["MinimizationResult"]],
+        pending: list[tuple[int, str]],
         force_field: str,
-        molecule_ids: list[int] | None = None,
-        skip_check: bool = False,
-    ) -> ICRMSDCollection:
-        if not molecule_ids:
-            molecule_ids = self.get_molecule_ids()
+        shard_index: int | None,
+        n_shards: int | None,
+        lease_size: int,
+        lease_duration: float,
+    ):
+        """
+        Minimize `pending` conformers in leased batches, sharing the work with any other
+        processes doing the same on this store.
 
-        if not skip_check:
-            self.optimize_mm(force_field=force_field)
+        Each batch is claimed in a short transaction, renewed by a heartbeat while it is
+        minimized, and released once its results are stored. When a pass over the
+        pending conformers is finished, the pending list is refreshed to pick up work
+        abandoned by processes whose leases have expired.
+        """
+        from yammbs._leases import _get_lease_owner, _heartbeat
 
-        icrmsds = ICRMSDCollection()
+        owner = _get_lease_owner()
 
-        for inchi_key in self.get_inchi_keys():
-            molecule_id = self.get_molecule_id_by_inchi_key(inchi_key)
+        def renew():
+            def _renew():
+                with self._get_session() as db:
+                    db.renew_leases(owner=owner, expires=time.time() + lease_duration)
 
-            if molecule_id not in molecule_ids:
-                continue
+            _retry_if_locked(_renew)
 
-            qcarchive_ids = self.get_qcarchive_ids_by_molecule_id(molecule_id)
+        def release():
+            def _release():
+                with self._get_session() as db:
+                    db.release_leases(owner=owner)
 
-            qm_conformers = self.get_qm_conformers_by_molecule_id(molecule_id)
-            mm_conformers = self.get_mm_conformers_by_molecule_id(
-                molecule_id,
-                force_field,
-            )
+            _retry_if_locked(_release)
 
-            molecule = self._get_molecule_by_inchi_key(inchi_key)
+        def claim(ids: list[int]) -> set[int]:
+            def _claim():
+                now = time.time()
 
-            for qm, mm, id in zip(
-                qm_conformers,
-                mm_conformers,
-                qcarchive_ids,
-            ):
-                icrmsds.append(
-                    ICRMSD(
-                        qcarchive_id=id,
-                        icrmsd=get_internal_coordinate_rmsds(molecule, qm, mm),
+                with self._get_session() as db:
+                    return db.claim_qm_conformers(
+                        ids,
                         force_field=force_field,
-                    ),
-                )
+                        owner=owner,
+                        expires=now + lease_duration,
+                        now=now,
+                        fingerprint=_get_current_fingerprint(force_field),
+                    )
 
-        return icrmsds
+            return set(_retry_if_locked(_claim))
 
-    def get_tfd(
-        self,
-        force_field: str,
-        molecule_ids: list[int] | None = None,
-        skip_check: bool = False,
-    ) -> TFDCollection:
-        if not molecule_ids:
-            molecule_ids = self.get_molecule_ids()
+        # conformers this process has already tried, so that one which fails to
+        # minimize is not claimed again and again
+        attempted: set[int] = set()
 
-        if not skip_check:
-            self.optimize_mm(force_field=force_field)
+        while True:
+            with self._get_session() as db:
+                leased = db.get_leased_qm_conformer_ids(
+                    force_field=force_field,
+                    now=time.time(),
+                    exclude_owner=owner,
+                )
 
-        tfds = TFDCollection()
+            pending = [
+                (id, inchi_key)
+                for (id, inchi_key) in pending
+                if id not in leased and id not in attempted
+            ]
 
-        for inchi_key in self.get_inchi_keys():
-            molecule_id = self.get_molecule_id_by_inchi_key(inchi_key)
+            if len(pending) == 0:
+                return
 
-            if molecule_id not in molecule_ids:
-                continue
+            for start in range(0, len(pending), lease_size):
+                window = pending[start : start + lease_size]
 
-            qcarchive_ids = self.get_qcarchive_ids_by_molecule_id(molecule_id)
+                claimed = claim([id for id, _ in window])
 
-            qm_conformers = self.get_qm_conformers_by_molecule_id(molecule_id)
-            mm_conformers = self.get_mm_conformers_by_molecule_id(
-                molecule_id,
-                force_field,
-            )
+                batch = [(id, inchi_key) for (id, inchi_key) in window if id in claimed]
 
-            molecule = self._get_molecule_by_inchi_key(inchi_key)
+                if len(batch) == 0:
+                    continue
+
+                attempted.update(id for id, _ in batch)
+
+                LOGGER.info(f"Claimed {len(batch)} conformers as {owner}")
 
-            for qm, mm, id in zip(
-                qm_conformers,
-                mm_conformers,
-                qcarchive_ids,
-            ):
                 try:
-                    tfds.append(
-                        TFD(
-                            qcarchive_id=id,
-                            tfd=get_tfd(molecule, qm, mm),
+                    with _heartbeat(renew, interval=lease_duration / 3):
+                        self._store_minimization_results(
+                            minimize(
+                                input=self._iter_qm_conformers(batch),
+                                n_tasks=len(batch),
+                            ),
                             force_field=force_field,
-                        ),
-                    )
-                except Exception as e:
-                    logging.warning(f"Molecule {inchi_key} failed with {str(e)}")
-
-        return tfds
+                        )
+                finally:
+                    release()
+
+            pending = self._get_pending_qm_conformers(
+                force_field=force_field,
+                shard_index=shard_index,
+                n_shards=n_shards,
+            )
 
-    def filter_by_checkmol(
+    def _copy_pending_molecules(
         self,
-        functional_group: ChemicalEnvironment,
-    ) -> list[int]:
+        source: "MoleculeStore",
+        pending: list[tuple[int, str]],
+        force_field: str,
+    ) -> list[tuple[int, str]]:
         """
-        Use Checkmol to filter the store by the presence of certain chemical functional groups.
-
-        Parameters
-        ----------
-        functional_group
-            A ChemicalEnvironment enum objects to filter by.
+        Prepare this store to receive results of minimizing `pending` conformers of
+        `source`, returning those not already minimized here.
 
-        Returns
-        -------
-        ids
-            A list of ids of molecules that contain the functional group.
+        Molecule records are copied from `source` so that MM conformers stored here
+        have a parent molecule.
         """
-        from yammbs.checkmol import analyze_functional_groups
+        inchi_keys = {inchi_key for _, inchi_key in pending}
 
-        return [
-            id
-            for id in self.get_molecule_ids()
-            if functional_group
-            in analyze_functional_groups(
-                smiles=self.get_smiles_by_molecule_id(id),
-            )
-        ]
+        with source._get_session() as db:
+            qcarchive_ids = {
+                id: qcarchive_id
+                for (id, qcarchive_id) in db.db.query(
+                    DBQMConformerRecord.id,
+                    DBQMConformerRecord.qcarchive_id,
+                ).filter(DBQMConformerRecord.id.in_([id for id, _ in pending]))
+            }
 
-    def filter_by_smirks(
-        self,
-        smirks: str,
-    ) -> list[int]:
+            molecules = [
+                (inchi_key, mapped_smiles)
+                for (inchi_key, mapped_smiles) in db.db.query(
+                    DBMoleculeRecord.inchi_key,
+                    DBMoleculeRecord.mapped_smiles,
+                ).order_by(DBMoleculeRecord.id)
+                if inchi_key in inchi_keys
+            ]
+
+        with self._get_session() as db:
+            existing = {
+                inchi_key for (inchi_key,) in db.db.query(DBMoleculeRecord.inchi_key)
+            }
+
+            for inchi_key, mapped_smiles in molecules:
+                if inchi_key in existing:
+                    continue
+
+                existing.add(inchi_key)
 
-        def smirks_in_smiles(smirks, smiles):
-            molecule = Molecule.from_mapped_smiles(smiles)
-            matches = molecule.chemical_environment_matches(smirks)
+                db.db.add(
+                    DBMoleculeRecord(inchi_key=inchi_key, mapped_smiles=mapped_smiles),
+                )
 
-            return len(matches) > 0
+            done = {
+                qcarchive_id
+                for (qcarchive_id,) in db.db.query(DBMMConformerRecord.qcarchive_id)
+                .filter_by(force_field=force_field)
+                .filter(_is_current_mm_conformer(force_field))
+            }
 
         return [
-            id
-            for id in self.get_molecule_ids()
-            if smirks_in_smiles(
-                smirks=smirks,
-                smiles=self.get_smiles_by_molecule_id(id),
-            )
+            (id, inchi_key)
+            for (id, inchi_key) in pending
+            if qcarchive_ids[id] not in done
         ]
 
+    def _store_minimization_results(
+        self,
+        results: Iterable["MinimizationResult"],
+        force_field: str,
+        batch_size: int = 100,
+    ):
+        with self._get_session() as db:
+            inchi_to_id: dict[str, int] = {
+                inchi_key: id
+                for (id, inchi_key) in reversed(
+                    db.db.query(
+                        DBMoleculeRecord.id,
+                        DBMoleculeRecord.inchi_key,
+                    ).all(),
+                )
+            }
+
+        with self._get_session() as db:
+            # from _mm_conformer_already_exists, ignoring conformers minimized with an
+            # earlier version of the force field
+            seen = {
+                qcarchive_id
+                for (qcarchive_id,) in db.db.query(DBMMConformerRecord.qcarchive_id)
+                .filter_by(force_field=force_field)
+                .filter(_is_current_mm_conformer(force_field))
+            }
+
+        batch: list[tuple[MMConformerRecord, "MinimizationResult"]] = list()
+
+        for result in results:
+            record = MMConformerRecord(
+                molecule_id=inchi_to_id[result.inchi_key],
+                qcarchive_id=result.qcarchive_id,
+                force_field=result.force_field,
+                mapped_smiles=result.mapped_smiles,
+                energy=result.energy,
+                coordinates=result.coordinates,
+            )
+
+            if record.qcarchive_id in seen:
+                continue
+
+            seen.add(record.qcarchive_id)
+
+            batch.append((record, result))
+
+            # write as results arrive so they are not all held in memory, in short
+            # transactions so that other processes sharing the store are not blocked
+            if len(batch) == batch_size:
+                self._write_mm_conformers(batch)
+                batch = list()
+
+        if len(batch) > 0:
+            self._write_mm_conformers(batch)
+
+    def _write_mm_conformers(
+        self,
+        batch: list[tuple[MMConformerRecord, "MinimizationResult"]],
+    ):
+        """
+        Store MM conformers, with their minimization times and any metrics computed
+        alongside them, in one transaction.
+        """
+
+        def write():
+            with self._get_session() as db:
+                for record, result in batch:
+                    fingerprint = _get_current_fingerprint(record.force_field)
+
+                    # inlined from MoleculeStore.store_conformer
+                    db.store_mm_conformer_record(record, fingerprint=fingerprint)
+
+                    db.store_minimization_timing(
+                        molecule_id=record.molecule_id,
+                        qcarchive_id=record.qcarchive_id,
+                        force_field=record.force_field,
+                        elapsed=result.elapsed,
+                    )
+
+                    for name, value in result.metrics.items():
+                        db.store_metric(
+                            molecule_id=record.molecule_id,
+                            qcarchive_id=record.qcarchive_id,
+                            force_field=record.force_field,
+                            fingerprint=fingerprint,
+                            name=name,
+                            version=_get_metric_version(name),
+                            value=value,
+                        )
+
+        _retry_if_locked(write)
+
+    def merge(self, shard_paths: Iterable[Pathlike]) -> int:
+        """
+        Import MM conformers, with their timings and metrics, from other stores, such as
+        those written by `optimize_mm(..., output=...)` on other machines, into this
+        store.
+
+        Conformers are matched to molecules in this store by their QCArchive ID. Any
+        (force field, QCArchive ID) pair already in this store with the same force
+        field fingerprint, or without one, is skipped.
+
+        Parameters
+        ----------
+        shard_paths
+            Paths to the stores to import from.
+
+        Returns
+        -------
+        n_imported
+            The number of MM conformers imported.
+
+        Raises
+        ------
+        FileNotFoundError
+            If any of the shards does not exist, before anything is imported.
+        """
+        shard_paths = [pathlib.Path(shard_path) for shard_path in shard_paths]
+
+        for shard_path in shard_paths:
+            if not shard_path.exists():
+                raise FileNotFoundError(f"Shard {shard_path} does not exist")
+
+        with self._get_session() as db:
+            parent_ids = {
+                qcarchive_id: parent_id
+                for (qcarchive_id, parent_id) in db.db.query(
+                    DBQMConformerRecord.qcarchive_id,
+                    DBQMConformerRecord.parent_id,
+                )
+            }
+
+            # the fingerprints of the conformers of each (force field, QCArchive ID)
+            seen: dict[tuple[str, int], set[str | None]] = dict()
+
+            for force_field, qcarchive_id, fingerprint in db.db.query(
+                DBMMConformerRecord.force_field,
+                DBMMConformerRecord.qcarchive_id,
+                DBMMConformerRecord.fingerprint,
+            ):
+                seen.setdefault((force_field, qcarchive_id), set()).add(fingerprint)
+
+        n_imported = 0
+
+        for shard_path in shard_paths:
+            shard = type(self)(shard_path)
+
+            with shard._get_session() as shard_db:
+                conformers = shard_db.db.query(
+                    DBMMConformerRecord.qcarchive_id,
+                    DBMMConformerRecord.force_field,
+                    DBMMConformerRecord.fingerprint,
+                    DBMMConformerRecord.mapped_smiles,
+                    DBMMConformerRecord.coordinates,
+                    DBMMConformerRecord.energy,
+                ).all()
+
+                timings = shard_db.db.query(
+                    DBMinimizationTiming.qcarchive_id,
+                    DBMinimizationTiming.force_field,
+                    DBMinimizationTiming.elapsed,
+                ).all()
+
+                metrics = shard_db.db.query(
+                    DBMetricRecord.qcarchive_id,
+                    DBMetricRecord.force_field,
+                    DBMetricRecord.fingerprint,
+                    DBMetricRecord.name,
+                    DBMetricRecord.version,
+                    DBMetricRecord.value,
+                ).all()
+
+            rows = list()
+
+            for (
+                qcarchive_id,
+                force_field,
+                fingerprint,
+                mapped_smiles,
+                coordinates,
+                energy,
+            ) in conformers:
+                fingerprints = seen.get((force_field, qcarchive_id), set())
+
+                # conformers without a fingerprint are taken to be current whatever the
+                # fingerprint, so are never stored alongside others
+                if len(fingerprints) > 0 and (
+                    len({fingerprint, None} & fingerprints) > 0 or fingerprint is None
+                ):
+                    continue
+
+                if qcarchive_id not in parent_ids:
+                    LOGGER.warning(
+                        f"Skipping conformer with QCArchive ID {qcarchive_id} from "
+                        f"{shard_path}, which is not in this store",
+                    )
+                    continue
+
+                seen.setdefault((force_field, qcarchive_id), set()).add(fingerprint)
+
+                rows.append(
+                    {
+                        "parent_id": parent_ids[qcarchive_id],
+                        "qcarchive_id": qcarchive_id,
+                        "force_field": force_field,
+                        "fingerprint": fingerprint,
+                        "mapped_smiles": mapped_smiles,
+                        "coordinates": coordinates,
+                        "energy": energy,
+                    },
+                )
+
+            imported = {
+                (row["force_field"], row["fingerprint"], row["qcarchive_id"])
+                for row in rows
+            }
+            timed = {(row["force_field"], row["qcarchive_id"]) for row in rows}
+
+            with self._get_session() as db:
+                if len(rows) > 0:
+                    db.db.execute(DBMMConformerRecord.__table__.insert(), rows)
+
+                timing_rows = [
+                    {
+                        "parent_id": parent_ids[qcarchive_id],
+                        "qcarchive_id": qcarchive_id,
+                        "force_field": force_field,
+                        "elapsed": elapsed,
+                    }
+                    for qcarchive_id, force_field, elapsed in timings
+                    if (force_field, qcarchive_id) in timed
+                ]
+
+                if len(timing_rows) > 0:
+                    db.db.execute(DBMinimizationTiming.__table__.insert(), timing_rows)
+
+                metric_rows = [
+                    {
+                        "parent_id": parent_ids[qcarchive_id],
+                        "qcarchive_id": qcarchive_id,
+                        "force_field": force_field,
+                        "fingerprint": fingerprint,
+                        "name": name,
+                        "version": version,
+                        "value": value,
+                    }
+                    for (
+                        qcarchive_id,
+                        force_field,
+                        fingerprint,
+                        name,
+                        version,
+                        value,
+                    ) in metrics
+                    if (force_field, fingerprint, qcarchive_id) in imported
+                ]
+
+                if len(metric_rows) > 0:
+                    db.db.execute(
+                        DBMetricRecord.__table__.insert().prefix_with("OR IGNORE"),
+                        metric_rows,
+                    )
+
+            LOGGER.info(f"Imported {len(rows)} MM conformers from {shard_path}")
+
+            n_imported += len(rows)
+
+        return n_imported
+
+    def _store_metrics(self, force_field: str, values: dict[int, dict[str, float]]):
+        """
+        Store metric values, keyed by QCArchive ID and then metric name, in one short
+        transaction, with the current fingerprint of the force field. NaNs, which mark
+        values that could not be computed, are stored too, so that they are not tried
+        again. Values already stored for the current implementation of a metric are
+        skipped.
+        """
+        fingerprint = _get_current_fingerprint(force_field)
+
+        def write():
+            with self._get_session() as db:
+                parent_ids = {
+                    qcarchive_id: parent_id
+                    for (qcarchive_id, parent_id) in db.db.query(
+                        DBQMConformerRecord.qcarchive_id,
+                        DBQMConformerRecord.parent_id,
+                    ).filter(DBQMConformerRecord.qcarchive_id.in_(list(values)))
+                }
+
+                existing = set(
+                    db.db.query(
+                        DBMetricRecord.qcarchive_id,
+                        DBMetricRecord.name,
+                        DBMetricRecord.version,
+                    ).filter(
+                        DBMetricRecord.force_field == force_field,
+                        _is_current(DBMetricRecord.fingerprint, fingerprint),
+                        DBMetricRecord.qcarchive_id.in_(list(values)),
+                    ),
+                )
+
+                for qcarchive_id, named in values.items():
+                    for name, value in named.items():
+                        if (qcarchive_id, name, _get_metric_version(name)) in existing:
+                            continue
+
+                        db.store_metric(
+                            molecule_id=parent_ids[qcarchive_id],
+                            qcarchive_id=qcarchive_id,
+                            force_field=force_field,
+                            fingerprint=fingerprint,
+                            name=name,
+                            version=_get_metric_version(name),
+                            value=value,
+                        )
+
+        if len(values) > 0:
+            _retry_if_locked(write)
+
+    def _get_stored_metrics(
+        self,
+        force_field: str,
+        names: Iterable[str],
+    ) -> dict[int, dict[str, float]]:
+        """
+        Return metrics stored with this force field's MM conformers, keyed by QCArchive
+        ID and then metric name. Values from outdated implementations, or earlier
+        versions of the force field, are left out, and those that could not be computed
+        are NaN.
+        """
+        names = list(names)
+
+        stored: dict[int, dict[str, float]] = dict()
+
+        with self._get_session() as db:
+            for qcarchive_id, name, version, value in db.db.query(
+                DBMetricRecord.qcarchive_id,
+                DBMetricRecord.name,
+                DBMetricRecord.version,
+                DBMetricRecord.value,
+            ).filter(
+                DBMetricRecord.force_field == force_field,
+                _is_current(
+                    DBMetricRecord.fingerprint,
+                    _get_current_fingerprint(force_field),
+                ),
+                DBMetricRecord.name.in_(names),
+            ):
+                if version == _get_metric_version(name):
+                    stored.setdefault(qcarchive_id, dict())[name] = (
+                        numpy.nan if value is None else value
+                    )
+
+        return stored
+
+    def _get_analysis_targets(self, molecule_ids: list[int]) -> list[int]:
+        """
+        Return the ids of the molecules analyses cover, in the order they report them;
+        as elsewhere, the first molecule stored with each InChI key.
+        """
+        return [
+            molecule_id
+            for molecule_id in map(
+                self.get_molecule_id_by_inchi_key,
+                self.get_inchi_keys(),
+            )
+            if molecule_id in molecule_ids
+        ]
+
+    def _map_molecules(
+        self,
+        func: Callable[[list[int]], list],
+        molecule_ids: list[int],
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> Iterator[list]:
+        """
+        Call `func` on chunks of `molecule_ids`, yielding its results as they complete.
+
+        This runs in this process if `n_processes` is 1 and no `executor` is given,
+        otherwise in workers (see `yammbs.executors`).
+        """
+        from yammbs._scheduling import _guided_chunks
+        from yammbs.executors import _default_executor, _ExecutorPool
+
+        if len(molecule_ids) == 0:
+            return
+
+        if executor is None:
+            executor = "serial" if n_processes == 1 else _default_executor()
+
+        with _ExecutorPool(executor or "fork", n_processes=n_processes) as pool:
+            yield from pool.imap_unordered(
+                func,
+                _guided_chunks(molecule_ids, n_processes, max_chunksize=16),
+            )
+
+    def _get_geometric_metric(
+        self,
+        force_field: str,
+        metric: str,
+        molecule_ids: list[int],
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> list[tuple[int, Any]]:
+        """
+        Return (QCArchive ID, value) pairs of one metric ("rmsd", "tfd" or "icrmsd")
+        for the conformers of the given molecules.
+
+        Molecules with a stored value for every conformer are served from the store.
+        The rest are computed in chunks by `_compute_molecule_metrics`, in this process
+        if `n_processes` is 1 and no `executor` is given, and their values are stored
+        for later calls. Results are returned in the same order either way. Conformers
+        whose value could not be computed, such as those of molecules TFD fails for,
+        are stored as NaN so they are not tried again, and left out.
+        """
+        from yammbs._analyze import _compute_molecule_metrics
+
+        stored = self._get_stored_metrics(force_field, _get_metric_columns([metric]))
+
+        def from_stored(values: dict[str, float]) -> Any:
+            if metric != "icrmsd":
+                return values[metric]
+
+            return {
+                _type: values[name]
+                for _type, name in _ICRMSD_NAMES.items()
+                if name in values
+            }
+
+        targets = self._get_analysis_targets(molecule_ids)
+
+        qcarchive_ids = {
+            molecule_id: self.get_qcarchive_ids_by_molecule_id(molecule_id)
+            for molecule_id in targets
+        }
+
+        computed: dict[int, list[tuple[int, Any]]] = {
+            molecule_id: list()
+            for molecule_id in targets
+            if not all(id in stored for id in qcarchive_ids[molecule_id])
+        }
+
+        for results in self._map_molecules(
+            functools.partial(
+                _compute_molecule_metrics,
+                self.database_path.as_posix(),
+                force_field,
+                _get_current_fingerprint(force_field),
+                metric,
+                molecule_cache_size=self.molecule_cache_size,
+            ),
+            list(computed),
+            n_processes=n_processes,
+            executor=executor,
+        ):
+            for molecule_id, id, value in results:
+                computed[molecule_id].append((id, value))
+
+            # so that later calls only compute what is still missing
+            self._store_metrics(
+                force_field,
+                {
+                    id: (
+                        {_ICRMSD_NAMES[_type]: v for _type, v in value.items()}
+                        if metric == "icrmsd"
+                        else {metric: value}
+                    )
+                    for _, id, value in results
+                    if id not in stored
+                },
+            )
+
+        pairs: list[tuple[int, Any]] = list()
+
+        for molecule_id in targets:
+            if molecule_id in computed:
+                pairs.extend(computed[molecule_id])
+            else:
+                pairs.extend(
+                    (id, from_stored(stored[id])) for id in qcarchive_ids[molecule_id]
+                )
+
+        if metric == "icrmsd":
+            return pairs
+
+        return [(id, value) for id, value in pairs if not numpy.isnan(value)]
+
+    def get_dde(
+        self,
+        force_field: str,
+        molecule_ids: list[int] | None = None,
+        skip_check: bool = False,
+        executor: Executor | str | None = None,
+    ) -> DDECollection:
+        if molecule_ids is None:
+            molecule_ids = self.get_molecule_ids()
+
+        if not skip_check:
+            self.optimize_mm(force_field=force_field, executor=executor)
+
+        qcarchive_ids: list[int] = list()
+        differences: list[float] = list()
+
+        for inchi_key in self.get_inchi_keys():
+            molecule_id = self.get_molecule_id_by_inchi_key(inchi_key)
+
+            if molecule_id not in molecule_ids:
+                continue
+
+            molecule_qcarchive_ids = self.get_qcarchive_ids_by_molecule_id(molecule_id)
+
+            if len(molecule_qcarchive_ids) == 1:
+                # There's only one conformer for this molecule
+                # TODO: Quicker way of short-circuiting here
+                continue
+
+            # these functions should each return list[float],
+            # implicitly both in kcal/mol
+            qm_energies = numpy.array(
+                self.get_qm_energies_by_molecule_id(
+                    molecule_id,
+                ),
+            )
+
+            mm_energies = numpy.array(
+                self.get_mm_energies_by_molecule_id(
+                    molecule_id,
+                    force_field,
+                ),
+            )
+
+            if len(mm_energies) != len(qm_energies):
+                continue
+
+            qm_minimum_index = qm_energies.argmin()
+
+            mm_energies -= mm_energies[qm_minimum_index]
+            qm_energies -= qm_energies[qm_minimum_index]
+
+            mm_energies[qm_minimum_index] = numpy.nan
+            qm_energies[qm_minimum_index] = numpy.nan
+
+            qcarchive_ids.extend(molecule_qcarchive_ids)
+            differences.extend(mm_energies - qm_energies)
+
+        return DDECollection.from_arrays(qcarchive_ids, differences, force_field)
+
+    def get_rmsd(
+        self,
+        force_field: str,
+        molecule_ids: list[int] | None = None,
+        skip_check: bool = False,
+        executor: Executor | str | None = None,
+        n_processes: int = 1,
+    ) -> RMSDCollection:
+        """
+        Compute the RMSD between each QM conformer and its MM conformer from
+        this force field, minimizing any QM conformers that have none yet.
+
+        Values computed alongside minimizations (see `optimize_mm`'s `metrics`) are
+        reused. The remaining molecules are split between `n_processes` workers, or
+        dispatched through `executor`, each reading conformers from the store itself.
+        """
+        if molecule_ids is None:
+            molecule_ids = self.get_molecule_ids()
+
+        if not skip_check:
+            self.optimize_mm(force_field=force_field, executor=executor)
+
+        rmsds = list(
+            self._get_geometric_metric(
+                force_field=force_field,
+                metric="rmsd",
+                molecule_ids=molecule_ids,
+                n_processes=n_processes,
+                executor=executor,
+            ),
+        )
+
+        return RMSDCollection.from_arrays(
+            [id for id, _ in rmsds],
+            [rmsd for _, rmsd in rmsds],
+            force_field,
+        )
+
+    def get_internal_coordinate_rmsd(
+        self,
+        force_field: str,
+        molecule_ids: list[int] | None = None,
+        skip_check: bool = False,
+        executor: Executor | str | None = None,
+        n_processes: int = 1,
+    ) -> ICRMSDCollection:
+        """
+        Compute the internal coordinate RMSDs between each QM conformer and its MM conformer from
+        this force field, minimizing any QM conformers that have none yet.
+
+        Values computed alongside minimizations (see `optimize_mm`'s `metrics`) are
+        reused. The remaining molecules are split between `n_processes` workers, or
+        dispatched through `executor`, each reading conformers from the store itself.
+        """
+        if molecule_ids is None:
+            molecule_ids = self.get_molecule_ids()
+
+        if not skip_check:
+            self.optimize_mm(force_field=force_field, executor=executor)
+
+        icrmsds = list(
+            self._get_geometric_metric(
+                force_field=force_field,
+                metric="icrmsd",
+                molecule_ids=molecule_ids,
+                n_processes=n_processes,
+                executor=executor,
+            ),
+        )
+
+        return ICRMSDCollection.from_arrays(
+            [id for id, _ in icrmsds],
+            [
+                [icrmsd.get(name, numpy.nan) for name in _ICRMSD_NAMES]
+                for _, icrmsd in icrmsds
+            ],
+            force_field,
+        )
+
+    def get_tfd(
+        self,
+        force_field: str,
+        molecule_ids: list[int] | None = None,
+        skip_check: bool = False,
+        executor: Executor | str | None = None,
+        n_processes: int = 1,
+    ) -> TFDCollection:
+        """
+        Compute the torsion fingerprint deviation between each QM conformer and its MM conformer from
+        this force field, minimizing any QM conformers that have none yet.
+
+        Values computed alongside minimizations (see `optimize_mm`'s `metrics`) are
+        reused. The remaining molecules are split between `n_processes` workers, or
+        dispatched through `executor`, each reading conformers from the store itself.
+        """
+        if molecule_ids is None:
+            molecule_ids = self.get_molecule_ids()
+
+        if not skip_check:
+            self.optimize_mm(force_field=force_field, executor=executor)
+
+        tfds = list(
+            self._get_geometric_metric(
+                force_field=force_field,
+                metric="tfd",
+                molecule_ids=molecule_ids,
+                n_processes=n_processes,
+                executor=executor,
+            ),
+        )
+
+        return TFDCollection.from_arrays(
+            [id for id, _ in tfds],
+            [tfd for _, tfd in tfds],
+            force_field,
+        )
+
+    def iter_metrics(
+        self,
+        force_field: str,
+        metrics: Iterable[str] = ("dde", "rmsd", "tfd", "icrmsd"),
+        molecule_ids: list[int] | None = None,
+        skip_check: bool = False,
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Compute several metrics for each conformer in a single pass over the store,
+        yielding one row per conformer as soon as its molecule is done.
+
+        Parameters
+        ----------
+        force_field
+            The force field whose MM conformers are compared to the QM conformers.
+        metrics
+            Any of "dde", "rmsd", "tfd" and "icrmsd".
+        molecule_ids
+            The molecules to analyze, by default all of them. An empty list or selection
+            analyzes none.
+        skip_check
+            Do not minimize QM conformers that have no MM conformer yet.
+        n_processes
+            The number of worker processes molecules are split between.
+        executor
+            An executor, or the name of one, to dispatch minimizations and analyses
+            through; see `yammbs.executors`.
+
+        Returns
+        -------
+        rows
+            Dicts with a "qcarchive_id" and one value per metric; internal coordinate
+            RMSDs are split into "icrmsd_bond", "icrmsd_angle", "icrmsd_dihedral" and
+            "icrmsd_improper". Values that could not be computed are NaN. Rows of one
+            molecule are yielded together, but molecules arrive in the order they
+            finish when run in parallel.
+
+        Geometric metrics computed here are stored, so later calls with the same force
+        field only compute values that are still missing. DDEs are cheap to compute
+        from stored energies and are not stored.
+        """
+        from yammbs._analyze import _compute_metric_rows
+
+        metrics = tuple(metrics)
+
+        for metric in metrics:
+            if metric != "dde" and metric not in _METRIC_VERSIONS:
+                raise ValueError(f"Unknown metric {metric}")
+
+        if molecule_ids is None:
+            molecule_ids = self.get_molecule_ids()
+
+        if not skip_check:
+            self.optimize_mm(force_field=force_field, executor=executor)
+
+        geometric = _get_metric_columns(
+            [metric for metric in metrics if metric != "dde"],
+        )
+
+        stored = self._get_stored_metrics(force_field, geometric)
+
+        for rows in self._map_molecules(
+            functools.partial(
+                _compute_metric_rows,
+                self.database_path.as_posix(),
+                force_field,
+                _get_current_fingerprint(force_field),
+                metrics,
+                molecule_cache_size=self.molecule_cache_size,
+            ),
+            self._get_analysis_targets(molecule_ids),
+            n_processes=n_processes,
+            executor=executor,
+        ):
+            self._store_metrics(
+                force_field,
+                {
+                    row["qcarchive_id"]: {
+                        name: row[name]
+                        for name in geometric
+                        if name not in stored.get(row["qcarchive_id"], dict())
+                    }
+                    for row in rows
+                },
+            )
+
+            yield from rows
+
+    def get_metrics(
+        self,
+        force_field: str,
+        metrics: Iterable[str] = ("dde", "rmsd", "tfd", "icrmsd"),
+        molecule_ids: list[int] | None = None,
+        skip_check: bool = False,
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> pandas.DataFrame:
+        """
+        Compute several metrics for each conformer in a single pass over the store.
+
+        Takes the same arguments as `iter_metrics`, and returns its rows as one table
+        indexed by QCArchive ID.
+        """
+        metrics = tuple(metrics)
+
+        dataframe = pandas.DataFrame.from_records(
+            self.iter_metrics(
+                force_field=force_field,
+                metrics=metrics,
+                molecule_ids=molecule_ids,
+                skip_check=skip_check,
+                n_processes=n_processes,
+                executor=executor,
+            ),
+            columns=["qcarchive_id", *_get_metric_columns(metrics)],
+        )
+
+        return dataframe.set_index("qcarchive_id").sort_index()
+
+    def _update_parameter_labels(
+        self,
+        force_field: str,
+        molecule_ids: list[int] | None = None,
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> str:
+        """
+        Label every molecule, or only those in `molecule_ids`, not yet labelled by the
+        parameters `force_field` resolves to, in this process if `n_processes` is 1 and
+        no `executor` is given, otherwise in workers, and store the labels. Returns the
+        force field's fingerprint, which keys its labels.
+        """
+        from yammbs._labels import _compute_molecule_labels
+        from yammbs._minimize import _get_force_field_fingerprint
+
+        if force_field.startswith(("gaff", "espaloma")):
+            raise ValueError(
+                f"Only SMIRNOFF force fields can be labelled, not {force_field}",
+            )
+
+        fingerprint = _get_force_field_fingerprint(force_field)
+
+        with self._get_session() as db:
+            query = db.db.query(DBMoleculeRecord.id).filter(
+                DBMoleculeRecord.id.not_in(
+                    select(DBParameterLabelRun.parent_id).where(
+                        DBParameterLabelRun.fingerprint == fingerprint,
+                    ),
+                ),
+            )
+
+            if molecule_ids is not None:
+                query = query.filter(DBMoleculeRecord.id.in_(molecule_ids))
+
+            missing = [id for (id,) in query.order_by(DBMoleculeRecord.id)]
+
+        def write(results: list[tuple[int, dict[tuple[str, str], int] | None]]):
+            with self._get_session() as db:
+                for molecule_id, labels in results:
+                    db.db.add(
+                        DBParameterLabelRun(
+                            parent_id=molecule_id,
+                            fingerprint=fingerprint,
+                            success=labels is not None,
+                        ),
+                    )
+                    db.db.add_all(
+                        DBParameterLabel(
+                            parent_id=molecule_id,
+                            fingerprint=fingerprint,
+                            handler=handler,
+                            parameter_id=parameter_id,
+                            count=count,
+                        )
+                        for (handler, parameter_id), count in (labels or dict()).items()
+                    )
+
+        for results in self._map_molecules(
+            functools.partial(
+                _compute_molecule_labels,
+                self.database_path.as_posix(),
+                force_field,
+            ),
+            missing,
+            n_processes=n_processes,
+            executor=executor,
+        ):
+            _retry_if_locked(functools.partial(write, results))
+
+        return fingerprint
+
+    def get_parameter_labels(
+        self,
+        force_field: str,
+        molecule_ids: list[int] | None = None,
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> pandas.DataFrame:
+        """
+        Get the SMIRNOFF parameters a force field assigns to each molecule.
+
+        Molecules are labelled with `ForceField.label_molecules` once per version of the
+        force field, in parallel, and the labels are stored.
+
+        Parameters
+        ----------
+        force_field
+            The SMIRNOFF force field, by name or path.
+        molecule_ids
+            The molecules to get labels of, by default all of them.
+        n_processes
+            The number of processes to label molecules not yet labelled in.
+        executor
+            A `concurrent.futures.Executor`, or the name of one in `yammbs.executors`,
+            to label molecules in instead.
+
+        Returns
+        -------
+        labels
+            One row per molecule and parameter, with columns "molecule_id", "handler",
+            "parameter_id" and "count", the number of atom groups in the molecule the
+            parameter is applied to.
+        """
+        fingerprint = self._update_parameter_labels(
+            force_field,
+            molecule_ids=molecule_ids,
+            n_processes=n_processes,
+            executor=executor,
+        )
+
+        with self._get_session() as db:
+            labels = pandas.DataFrame(
+                db.db.query(
+                    DBParameterLabel.parent_id,
+                    DBParameterLabel.handler,
+                    DBParameterLabel.parameter_id,
+                    DBParameterLabel.count,
+                )
+                .filter_by(fingerprint=fingerprint)
+                .order_by(DBParameterLabel.parent_id, DBParameterLabel.id)
+                .all(),
+                columns=["molecule_id", "handler", "parameter_id", "count"],
+            )
+
+        if molecule_ids is not None:
+            labels = labels[labels["molecule_id"].isin(molecule_ids)]
+
+        return labels.reset_index(drop=True)
+
+    def get_parameter_metrics(
+        self,
+        force_field: str,
+        metrics: Iterable[str] = ("dde", "rmsd", "tfd", "icrmsd"),
+        molecule_ids: list[int] | None = None,
+        skip_check: bool = False,
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> pandas.DataFrame:
+        """
+        Summarize metrics by the SMIRNOFF parameters applied to each conformer's molecule,
+        to find the parameters associated with the largest errors.
+
+        Takes the same arguments as `iter_metrics`. Metrics are computed, or read from
+        the store, as by `get_metrics`, and labels as by `get_parameter_labels`.
+
+        Returns
+        -------
+        summary
+            One row per (handler, parameter id), with the numbers of molecules and
+            conformers the parameter is applied to and the mean, median and maximum of
+            each metric over those conformers. DDEs are summarized by absolute value.
+
+        Examples
+        --------
+        >>> summary = store.get_parameter_metrics("openff-2.1.0", metrics=["rmsd"])
+        >>> summary.sort_values(("rmsd", "mean"), ascending=False).head(10)
+        """
+        metrics = tuple(metrics)
+
+        values = self.get_metrics(
+            force_field=force_field,
+            metrics=metrics,
+            molecule_ids=molecule_ids,
+            skip_check=skip_check,
+            n_processes=n_processes,
+            executor=executor,
+        )
+
+        if "dde" in values:
+            values["dde"] = values["dde"].abs()
+
+        with self._get_session() as db:
+            parents = dict(
+                db.db.query(
+                    DBQMConformerRecord.qcarchive_id,
+                    DBQMConformerRecord.parent_id,
+                ),
+            )
+
+        values["molecule_id"] = values.index.map(parents)
+
+        labels = self.get_parameter_labels(
+            force_field,
+            molecule_ids=molecule_ids,
+            n_processes=n_processes,
+            executor=executor,
+        )
+
+        labelled = labels[["molecule_id", "handler", "parameter_id"]].merge(
+            values.reset_index(),
+            on="molecule_id",
+        )
+
+        columns = _get_metric_columns(metrics)
+
+        grouped = labelled.groupby(["handler", "parameter_id"], sort=True)
+
+        summary = grouped[columns].agg(["mean", "median", "max"])
+
+        summary.insert(0, ("n_conformers", ""), grouped["qcarchive_id"].nunique())
+        summary.insert(0, ("n_molecules", ""), grouped["molecule_id"].nunique())
+
+        return summary
+
+    def _update_descriptors(
+        self,
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> int:
+        """
+        Compute and store descriptors of molecules that do not have them yet, in this
+        process if `n_processes` is 1 and no `executor` is given, otherwise in workers.
+        Returns the number of molecules updated.
+        """
+        from yammbs._descriptors import _compute_molecule_descriptors
+
+        with self._get_session() as db:
+            missing = [
+                id
+                for (id,) in db.db.query(DBMoleculeRecord.id)
+                .filter(
+                    DBMoleculeRecord.id.not_in(select(DBMoleculeDescriptors.parent_id)),
+                )
+                .order_by(DBMoleculeRecord.id)
+            ]
+
+        for results in self._map_molecules(
+            functools.partial(
+                _compute_molecule_descriptors,
+                self.database_path.as_posix(),
+            ),
+            missing,
+            n_processes=n_processes,
+            executor=executor,
+        ):
+            self._store_descriptors(results)
+
+        return len(missing)
+
+    def _update_fingerprints(
+        self,
+        kinds: tuple[str, ...] = ("pattern", "morgan"),
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> int:
+        """
+        Compute and store fingerprints of each kind, substructure ("pattern") or
+        similarity ("morgan"), of molecules that do not have them yet, in this process
+        if `n_processes` is 1 and no `executor` is given, otherwise in workers. Returns
+        the number of molecules updated.
+        """
+        from yammbs._substructure import _compute_molecule_fingerprints
+
+        with self._get_session() as db:
+            done: dict[int, set[str]] = dict()
+
+            for molecule_id, kind in db.db.query(
+                DBMoleculeFingerprint.parent_id,
+                DBMoleculeFingerprint.kind,
+            ).filter(DBMoleculeFingerprint.kind.in_(kinds)):
+                done.setdefault(molecule_id, set()).add(kind)
+
+            missing = [
+                id
+                for (id,) in db.db.query(DBMoleculeRecord.id).order_by(
+                    DBMoleculeRecord.id,
+                )
+                if len(done.get(id, set())) < len(kinds)
+            ]
+
+        def write(results: list[tuple[int, str, bytes]]):
+            with self._get_session() as db:
+                db.db.add_all(
+                    DBMoleculeFingerprint(parent_id=molecule_id, kind=kind, bits=bits)
+                    for molecule_id, kind, bits in results
+                    if kind not in done.get(molecule_id, set())
+                )
+
+        for results in self._map_molecules(
+            functools.partial(
+                _compute_molecule_fingerprints,
+                self.database_path.as_posix(),
+                tuple(kinds),
+            ),
+            missing,
+            n_processes=n_processes,
+            executor=executor,
+        ):
+            _retry_if_locked(functools.partial(write, results))
+
+        return len(missing)
+
+    def _store_descriptors(self, results: list[tuple[int, dict[str, Any]]]):
+        from yammbs._descriptors import _DESCRIPTORS
+
+        def write():
+            with self._get_session() as db:
+                for molecule_id, descriptors in results:
+                    db.db.add(
+                        DBMoleculeDescriptors(
+                            parent_id=molecule_id,
+                            **{name: descriptors[name] for name in _DESCRIPTORS},
+                        ),
+                    )
+                    db.db.add_all(
+                        DBMoleculeElement(parent_id=molecule_id, element=element)
+                        for element in descriptors["elements"]
+                    )
+
+        if len(results) > 0:
+            _retry_if_locked(write)
+
+    def get_descriptors(
+        self,
+        molecule_ids: list[int] | None = None,
+    ) -> pandas.DataFrame:
+        """
+        Get descriptors of molecules, indexed by molecule id. Descriptors are computed
+        for molecules that do not have them yet, and stored.
+
+        Parameters
+        ----------
+        molecule_ids
+            The molecules to describe. All molecules if not given.
+
+        Returns
+        -------
+        descriptors
+            Numbers of atoms, heavy atoms, rotatable bonds and rings, the total formal
+            charge, the molecular weight [Da] and the elements of each molecule.
+        """
+        from yammbs._descriptors import _DESCRIPTORS
+
+        self._update_descriptors()
+
+        with self._get_session() as db:
+            query = db.db.query(
+                DBMoleculeDescriptors.parent_id,
+                *(getattr(DBMoleculeDescriptors, name) for name in _DESCRIPTORS),
+            )
+
+            elements = db.db.query(
+                DBMoleculeElement.parent_id,
+                DBMoleculeElement.element,
+            )
+
+            if molecule_ids is not None:
+                query = query.filter(DBMoleculeDescriptors.parent_id.in_(molecule_ids))
+                elements = elements.filter(
+                    DBMoleculeElement.parent_id.in_(molecule_ids),
+                )
+
+            dataframe = pandas.DataFrame(
+                query.all(),
+                columns=["molecule_id", *_DESCRIPTORS],
+            ).set_index("molecule_id")
+
+            symbols: dict[int, set[str]] = dict()
+
+            for molecule_id, element in elements:
+                symbols.setdefault(molecule_id, set()).add(element)
+
+        dataframe["elements"] = [
+            sorted(symbols.get(molecule_id, set())) for molecule_id in dataframe.index
+        ]
+
+        return dataframe.sort_index()
+
+    def filter_by_descriptors(
+        self,
+        elements: Iterable[str] | None = None,
+        **bounds: int | float | tuple[int | float | None, int | float | None],
+    ) -> list[int]:
+        """
+        Filter the store by stored molecule descriptors, as one indexed query.
+
+        Parameters
+        ----------
+        elements
+            If given, only molecules made entirely of these elements (symbols) are kept.
+        bounds
+            Values of, or inclusive (minimum, maximum) ranges of, any of "n_atoms",
+            "n_heavy_atoms", "n_rotatable_bonds", "n_rings", "formal_charge" and
+            "molecular_weight" [Da]. Either end of a range can be None.
+
+        Returns
+        -------
+        ids
+            A list of ids of molecules that match every condition.
+
+        Examples
+        --------
+        >>> store.filter_by_descriptors(n_heavy_atoms=(None, 20), formal_charge=0)
+        >>> store.filter_by_descriptors(elements=["C", "H", "O", "N"])
+        """
+        from yammbs._descriptors import _DESCRIPTORS
+
+        unknown = set(bounds) - set(_DESCRIPTORS)
+
+        if unknown:
+            raise ValueError(
+                f"Unknown descriptors {sorted(unknown)}, expected any of {_DESCRIPTORS}",
+            )
+
+        self._update_descriptors()
+
+        query = select(DBMoleculeDescriptors.parent_id)
+
+        for name, bound in bounds.items():
+            column = getattr(DBMoleculeDescriptors, name)
+
+            minimum, maximum = bound if isinstance(bound, tuple) else (bound, bound)
+
+            if minimum is not None:
+                query = query.where(column >= minimum)
+
+            if maximum is not None:
+                query = query.where(column <= maximum)
+
+        if elements is not None:
+            query = query.where(
+                DBMoleculeDescriptors.parent_id.not_in(
+                    select(DBMoleculeElement.parent_id).where(
+                        DBMoleculeElement.element.not_in(list(elements)),
+                    ),
+                ),
+            )
+
+        with self._get_session() as db:
+            return [
+                id
+                for (id,) in db.db.execute(
+                    query.order_by(DBMoleculeDescriptors.parent_id),
+                )
+            ]
+
+    def _update_functional_groups(
+        self,
+        classifier: str = "checkmol",
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> int:
+        """
+        Find and store the functional groups of molecules not yet analyzed by
+        `classifier`, in batches, in this process if `n_processes` is 1 and no
+        `executor` is given, otherwise in workers. Returns the number of molecules
+        analyzed.
+        """
+        from yammbs._functional_groups import (
+            _compute_molecule_checkmol_groups,
+            _compute_molecule_smarts_groups,
+        )
+
+        func = {
+            "checkmol": _compute_molecule_checkmol_groups,
+            "smarts": _compute_molecule_smarts_groups,
+        }[classifier]
+
+        with self._get_session() as db:
+            missing = [
+                id
+                for (id,) in db.db.query(DBMoleculeRecord.id)
+                .filter(
+                    DBMoleculeRecord.id.not_in(
+                        select(DBFunctionalGroupAnalysis.parent_id).where(
+                            DBFunctionalGroupAnalysis.classifier == classifier,
+                        ),
+                    ),
+                )
+                .order_by(DBMoleculeRecord.id)
+            ]
+
+        if classifier == "checkmol" and len(missing) > 0:
+            from yammbs.checkmol import _check_checkmol
+
+            _check_checkmol()
+
+        for results in self._map_molecules(
+            functools.partial(func, self.database_path.as_posix()),
+            missing,
+            n_processes=n_processes,
+            executor=executor,
+        ):
+            self._store_functional_groups(classifier, results)
+
+        return len(missing)
+
+    def _store_functional_groups(
+        self,
+        classifier: str,
+        results: list[tuple[int, dict[ChemicalEnvironment, int] | None]],
+    ):
+        def write():
+            with self._get_session() as db:
+                for molecule_id, groups in results:
+                    db.db.add(
+                        DBFunctionalGroupAnalysis(
+                            parent_id=molecule_id,
+                            classifier=classifier,
+                            success=groups is not None,
+                        ),
+                    )
+                    db.db.add_all(
+                        DBFunctionalGroup(
+                            parent_id=molecule_id,
+                            classifier=classifier,
+                            environment=environment.value,
+                            count=count,
+                        )
+                        for environment, count in (groups or dict()).items()
+                    )
+
+        if len(results) > 0:
+            _retry_if_locked(write)
+
+    def filter_by_functional_group(
+        self,
+        functional_group: ChemicalEnvironment,
+        classifier: str = "smarts",
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> list[int]:
+        """
+        Filter the store by the presence of certain chemical functional groups.
+
+        Each molecule is classified once, and the groups found are stored, so later
+        calls are a single indexed query.
+
+        Parameters
+        ----------
+        functional_group
+            A ChemicalEnvironment enum objects to filter by.
+        classifier
+            "smarts" to match SMARTS patterns of Checkmol's functional groups with
+            RDKit, in this process, or "checkmol" to run Checkmol.
+        n_processes
+            The number of processes to classify molecules not yet classified in.
+        executor
+            A `concurrent.futures.Executor`, or the name of one in `yammbs.executors`,
+            to classify molecules in instead.
+
+        Returns
+        -------
+        ids
+            A list of ids of molecules that contain the functional group.
+        """
+        if classifier not in ("smarts", "checkmol"):
+            raise ValueError(
+                f"Unknown classifier {classifier}, expected smarts or checkmol",
+            )
+
+        self._update_functional_groups(
+            classifier,
+            n_processes=n_processes,
+            executor=executor,
+        )
+
+        with self._get_session() as db:
+            return [
+                id
+                for (id,) in db.db.query(DBFunctionalGroup.parent_id)
+                .filter_by(classifier=classifier, environment=functional_group.value)
+                .order_by(DBFunctionalGroup.parent_id)
+            ]
+
+    def filter_by_checkmol(
+        self,
+        functional_group: ChemicalEnvironment,
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> list[int]:
+        """
+        Use Checkmol to filter the store by the presence of certain chemical functional groups.
+
+        Checkmol is run once per molecule, over batches of molecules, and the groups it
+        finds are stored, so later calls are a single indexed query. See
+        `filter_by_functional_group` to classify molecules without Checkmol.
+
+        Parameters
+        ----------
+        functional_group
+            A ChemicalEnvironment enum objects to filter by.
+        n_processes
+            The number of processes to run Checkmol in for molecules not yet analyzed.
+        executor
+            A `concurrent.futures.Executor`, or the name of one in `yammbs.executors`,
+            to run Checkmol in instead.
+
+        Returns
+        -------
+        ids
+            A list of ids of molecules that contain the functional group.
+        """
+        return self.filter_by_functional_group(
+            functional_group,
+            classifier="checkmol",
+            n_processes=n_processes,
+            executor=executor,
+        )
+
+    def _update_smirks_matches(
+        self,
+        smirks: list[str],
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ):
+        """
+        Match every molecule without stored results against the SMIRKS patterns, in
+        this process if `n_processes` is 1 and no `executor` is given, otherwise in
+        workers, and store the results.
+        """
+        from yammbs._substructure import (
+            _compile,
+            _compute_molecule_smirks_matches,
+            _get_fingerprints,
+            _screen,
+        )
+
+        # fail early, and in this process, on invalid patterns
+        for pattern in smirks:
+            _compile(pattern)
+
+        self._update_fingerprints(
+            kinds=("pattern",),
+            n_processes=n_processes,
+            executor=executor,
+        )
+
+        with self._get_session() as db:
+            done: dict[int, set[str]] = dict()
+
+            for molecule_id, pattern in db.db.query(
+                DBSmirksMatch.parent_id,
+                DBSmirksMatch.smirks,
+            ).filter(DBSmirksMatch.smirks.in_(smirks)):
+                done.setdefault(molecule_id, set()).add(pattern)
+
+            missing = [
+                id
+                for (id,) in db.db.query(DBMoleculeRecord.id).order_by(
+                    DBMoleculeRecord.id,
+                )
+                if len(done.get(id, set())) < len(smirks)
+            ]
+
+            fingerprints = _get_fingerprints(db.db)
+
+        def write(results: list[tuple[int, list[bool]]]):
+            with self._get_session() as db:
+                db.db.add_all(
+                    DBSmirksMatch(parent_id=molecule_id, smirks=pattern, match=match)
+                    for molecule_id, matches in results
+                    for pattern, match in zip(smirks, matches)
+                    if pattern not in done.get(molecule_id, set())
+                )
+
+        # molecules whose fingerprints rule out every pattern are not matched at all
+        screened = [id for id in missing if id in fingerprints]
+
+        if len(screened) > 0:
+            candidates = _screen(
+                numpy.array([fingerprints[id] for id in screened]),
+                smirks,
+            )
+
+            ruled_out = {
+                molecule_id
+                for molecule_id, candidate in zip(screened, candidates.any(axis=-1))
+                if not candidate
+            }
+
+            if len(ruled_out) > 0:
+                results = [(id, [False] * len(smirks)) for id in sorted(ruled_out)]
+
+                _retry_if_locked(functools.partial(write, results))
+
+            missing = [id for id in missing if id not in ruled_out]
+
+        for results in self._map_molecules(
+            functools.partial(
+                _compute_molecule_smirks_matches,
+                self.database_path.as_posix(),
+                tuple(smirks),
+            ),
+            missing,
+            n_processes=n_processes,
+            executor=executor,
+        ):
+            _retry_if_locked(functools.partial(write, results))
+
+    def filter_by_smirks_batch(
+        self,
+        smirks: Iterable[str],
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> dict[str, list[int]]:
+        """
+        Filter the store by each of several SMIRKS patterns.
+
+        Each pattern is parsed once and matched against all molecules at once, in
+        chunks of molecules that can run in parallel. Whether each molecule matches each
+        pattern is stored, so repeated queries are a single indexed query.
+
+        Parameters
+        ----------
+        smirks
+            The SMIRKS patterns to filter by.
+        n_processes
+            The number of processes to match molecules in.
+        executor
+            A `concurrent.futures.Executor`, or the name of one in `yammbs.executors`,
+            to match molecules in instead.
+
+        Returns
+        -------
+        ids
+            The ids of molecules that match each pattern, keyed by pattern.
+        """
+        smirks = list(dict.fromkeys(smirks))
+
+        self._update_smirks_matches(smirks, n_processes=n_processes, executor=executor)
+
+        matches: dict[str, list[int]] = {pattern: list() for pattern in smirks}
+
+        with self._get_session() as db:
+            for molecule_id, pattern in (
+                db.db.query(DBSmirksMatch.parent_id, DBSmirksMatch.smirks)
+                .filter(DBSmirksMatch.smirks.in_(smirks))
+                .filter_by(match=True)
+                .order_by(DBSmirksMatch.parent_id)
+            ):
+                matches[pattern].append(molecule_id)
+
+        return matches
+
+    def filter_by_smirks(
+        self,
+        smirks: str,
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> list[int]:
+        """
+        Filter the store by a SMIRKS pattern, as `filter_by_smirks_batch`.
+
+        Parameters
+        ----------
+        smirks
+            The SMIRKS pattern to filter by.
+        n_processes
+            The number of processes to match molecules in.
+        executor
+            A `concurrent.futures.Executor`, or the name of one in `yammbs.executors`,
+            to match molecules in instead.
+
+        Returns
+        -------
+        ids
+            A list of ids of molecules that match the pattern.
+        """
+        return self.filter_by_smirks_batch(
+            [smirks],
+            n_processes=n_processes,
+            executor=executor,
+        )[smirks]
+
+    def _get_universe(self) -> tuple[tuple[int, int], numpy.ndarray]:
+        """
+        Return the number of molecules and the largest molecule id, which change when
+        molecules are added, and a bitmap of all molecule ids.
+        """
+        with self._get_session() as db:
+            molecule_ids = numpy.array(
+                [id for (id,) in db.db.query(DBMoleculeRecord.id)],
+                dtype=int,
+            )
+
+        universe = numpy.zeros(molecule_ids.max(initial=-1) + 1, dtype=bool)
+        universe[molecule_ids] = True
+
+        return (len(molecule_ids), len(universe) - 1), universe
+
+    def _get_selection(
+        self,
+        kind: str,
+        key: str,
+        get_molecule_ids: Callable[[], Iterable[int]],
+    ) -> MoleculeSelection:
+        """
+        Return a selection from the inverted index, or make it with `get_molecule_ids`
+        and store it if there is none or molecules were added since it was made.
+        """
+        from yammbs.selection import _compress, _decompress
+
+        state, universe = self._get_universe()
+
+        if self._selections.get((kind, key), (None, None))[0] == state:
+            return MoleculeSelection(self._selections[(kind, key)][1], universe)
+
+        with self._get_session() as db:
+            row = db.db.query(DBSelectionIndex).filter_by(kind=kind, key=key).first()
+
+            if row is not None and (row.n_molecules, row.max_molecule_id) == state:
+                bits = _decompress(row.bitmap, len(universe))
+            else:
+                bits = None
+
+        if bits is None:
+            bits = MoleculeSelection.from_ids(get_molecule_ids(), universe).bits
+
+            def write():
+                with self._get_session() as db:
+                    db.db.query(DBSelectionIndex).filter_by(kind=kind, key=key).delete()
+                    db.db.add(
+                        DBSelectionIndex(
+                            kind=kind,
+                            key=key,
+                            n_molecules=state[0],
+                            max_molecule_id=state[1],
+                            bitmap=_compress(bits),
+                        ),
+                    )
+
+            _retry_if_locked(write)
+
+        self._selections[(kind, key)] = (state, bits)
+
+        return MoleculeSelection(bits, universe)
+
+    def select_functional_group(
+        self,
+        functional_group: ChemicalEnvironment,
+        classifier: str = "smarts",
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> MoleculeSelection:
+        """
+        Select molecules with a functional group, as `filter_by_functional_group`.
+
+        The selection is kept in an inverted index in the store, so later calls return
+        in milliseconds, and can be combined with other selections with `&`, `|`, `-`
+        and `~`.
+
+        Examples
+        --------
+        >>> amides = store.select_functional_group(ChemicalEnvironment.CarboxylicAcidAmide)
+        >>> flexible = store.select_descriptors(n_rotatable_bonds=(3, None))
+        >>> store.get_dde(force_field, molecule_ids=amides & flexible - store.select_smirks("[a]"))
+        """
+        return self._get_selection(
+            f"functional_group:{classifier}",
+            functional_group.value,
+            lambda: self.filter_by_functional_group(
+                functional_group,
+                classifier=classifier,
+                n_processes=n_processes,
+                executor=executor,
+            ),
+        )
+
+    def select_smirks(self, smirks: str) -> MoleculeSelection:
+        """
+        Select molecules matching a SMIRKS pattern, as `filter_by_smirks`.
+
+        The selection is kept in an inverted index in the store, so later calls return
+        in milliseconds, and can be combined with other selections with `&`, `|`, `-`
+        and `~`.
+        """
+        return self._get_selection(
+            "smirks",
+            smirks,
+            lambda: self.filter_by_smirks(smirks),
+        )
+
+    def select_descriptors(
+        self,
+        elements: Iterable[str] | None = None,
+        **bounds: int | float | tuple[int | float | None, int | float | None],
+    ) -> MoleculeSelection:
+        """
+        Select molecules by descriptors, as `filter_by_descriptors`, in a selection that
+        can be combined with others with `&`, `|`, `-` and `~`.
+        """
+        _, universe = self._get_universe()
+
+        return MoleculeSelection.from_ids(
+            self.filter_by_descriptors(elements=elements, **bounds),
+            universe,
+        )
+
+    def _get_similarity_index(
+        self,
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> "_SimilarityIndex":
+        """
+        Return the similarity index, loading it from stored fingerprints if there is
+        none or molecules were added since it was loaded.
+        """
+        from yammbs._similarity import _MORGAN, _SimilarityIndex
+        from yammbs._substructure import _get_fingerprints
+
+        state, _ = self._get_universe()
+
+        if self._similarity is None or self._similarity[0] != state:
+            self._update_fingerprints(
+                kinds=(_MORGAN,),
+                n_processes=n_processes,
+                executor=executor,
+            )
+
+            with self._get_session() as db:
+                fingerprints = _get_fingerprints(db.db, kind=_MORGAN)
+
+            self._similarity = (state, _SimilarityIndex.from_fingerprints(fingerprints))
+
+        return self._similarity[1]
+
+    def similar_molecules(
+        self,
+        molecule_id: int,
+        k: int = 10,
+        n_processes: int = 1,
+        executor: Executor | str | None = None,
+    ) -> pandas.DataFrame:
+        """
+        Find the molecules most similar to a molecule, by Tanimoto similarity of Morgan
+        fingerprints (radius 2, 2048 bits).
+
+        Fingerprints are computed once, the first time they are needed, and held in
+        memory bit-packed after the first search, so each search compares against every
+        molecule in milliseconds even for stores of 100k molecules.
+
+        Parameters
+        ----------
+        molecule_id
+            The molecule to find neighbours of.
+        k
+            The number of neighbours to return.
+        n_processes
+            The number of processes to compute fingerprints of molecules without them in.
+        executor
+            A `concurrent.futures.Executor`, or the name of one in `yammbs.executors`,
+            to compute fingerprints in instead.
+
+        Returns
+        -------
+        neighbours
+            The similarity of the `k` most similar molecules, not including the molecule
+            itself, indexed by molecule id, most similar first.
+
+        Examples
+        --------
+        >>> neighbours = store.similar_molecules(molecule_id, k=5)
+        >>> store.get_tfd(force_field="openff-2.1.0", molecule_ids=list(neighbours.index))
+        """
+        index = self._get_similarity_index(n_processes=n_processes, executor=executor)
+
+        if molecule_id not in index:
+            raise ValueError(f"Molecule {molecule_id} is not in the store")
+
+        molecule_ids, similarities = index.nearest(molecule_id, k)
+
+        return pandas.DataFrame(
+            {"similarity": similarities},
+            index=pandas.Index(molecule_ids, name="molecule_id"),
+        )
+
+
+@functools.lru_cache
+def _get_current_fingerprint(force_field: str) -> str | None:
+    """
+    Return the fingerprint of a force field (see `_get_force_field_fingerprint`), or
+    None if it cannot be built here, in which case all of its stored MM conformers and
+    metrics are used as they are.
+    """
+    from yammbs._minimize import _get_force_field_fingerprint
+
+    try:
+        return _get_force_field_fingerprint(force_field)
+    except Exception as error:
+        LOGGER.warning(
+            f"Could not fingerprint {force_field}, so its stored MM conformers and "
+            f"metrics are used as they are: {error}",
+        )
+        return None
+
+
+def _is_current_mm_conformer(force_field: str):
+    """Filter MM conformers of a force field to those of its current version."""
+    return _is_current(
+        DBMMConformerRecord.fingerprint,
+        _get_current_fingerprint(force_field),
+    )
+
+
+def _get_shard(inchi_key: str, n_shards: int) -> int:
+    """Deterministically assign a molecule to one of `n_shards` shards."""
+    return int(hashlib.sha1(inchi_key.encode()).hexdigest(), 16) % n_shards
+
 
 def smiles_to_inchi_key(smiles: str) -> str:
     from openff.toolkit import Molecule
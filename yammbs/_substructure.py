@@ -0,0 +1,203 @@
+"""Substructure matching of SMIRKS patterns over many molecules, with RDKit."""
+
+import functools
+from typing import TYPE_CHECKING
+
+import numpy
+from sqlalchemy.orm import Session
+
+from yammbs._db import DBMoleculeFingerprint
+
+if TYPE_CHECKING:
+    from rdkit import Chem
+
+# RDKit pattern fingerprints set, in the fingerprint of a molecule, every bit set in
+# the fingerprint of a pattern that matches it, so a missing bit proves no match
+_PATTERN = "pattern"
+_PATTERN_SIZE = 2048
+
+
+@functools.lru_cache(maxsize=4096)
+def _compile(smirks: str) -> "Chem.Mol":
+    """Parse a SMIRKS pattern once per process."""
+    from rdkit import Chem
+
+    pattern = Chem.MolFromSmarts(smirks)
+
+    if pattern is None:
+        raise ValueError(f"Could not parse SMIRKS pattern {smirks}")
+
+    return pattern
+
+
+def _to_rdkit(mapped_smiles: str) -> "Chem.Mol":
+    """
+    Make an RDKit molecule with explicit hydrogens and MDL aromaticity, which is what
+    `Molecule.chemical_environment_matches` matches against with the RDKit toolkit.
+    """
+    from rdkit import Chem
+
+    parameters = Chem.SmilesParserParams()
+    parameters.removeHs = False
+
+    rdmol = Chem.MolFromSmiles(mapped_smiles, parameters)
+
+    Chem.Kekulize(rdmol, clearAromaticFlags=True)
+    Chem.SetAromaticity(rdmol, Chem.AromaticityModel.AROMATICITY_MDL)
+
+    return rdmol
+
+
+def _get_pattern_fingerprint(rdmol: "Chem.Mol") -> numpy.ndarray:
+    from rdkit import Chem, DataStructs
+
+    bits = numpy.zeros(_PATTERN_SIZE, dtype=numpy.uint8)
+
+    DataStructs.ConvertToNumpyArray(Chem.PatternFingerprint(rdmol, _PATTERN_SIZE), bits)
+
+    return bits.astype(bool)
+
+
+@functools.lru_cache(maxsize=4096)
+def _get_query_fingerprint(smirks: str) -> numpy.ndarray:
+    return numpy.packbits(_get_pattern_fingerprint(_compile(smirks)))
+
+
+def _screen(fingerprints: numpy.ndarray, smirks: list[str]) -> numpy.ndarray:
+    """
+    Return which of the molecules, given by packed fingerprints of shape
+    (n_molecules, _PATTERN_SIZE // 8), may match each pattern, with shape
+    (n_molecules, n_patterns).
+    """
+    fingerprints = numpy.asarray(fingerprints, dtype=numpy.uint8).reshape(
+        -1,
+        _PATTERN_SIZE // 8,
+    )
+
+    candidates = numpy.empty((len(fingerprints), len(smirks)), dtype=bool)
+
+    for index, pattern in enumerate(smirks):
+        query = _get_query_fingerprint(pattern)
+
+        candidates[:, index] = numpy.all(fingerprints & query == query, axis=-1)
+
+    return candidates
+
+
+def _get_fingerprints(
+    session: Session,
+    molecule_ids: list[int] | None = None,
+    kind: str = _PATTERN,
+) -> dict[int, numpy.ndarray]:
+    """Read packed fingerprints of the given molecules, or of all molecules."""
+    query = session.query(
+        DBMoleculeFingerprint.parent_id,
+        DBMoleculeFingerprint.bits,
+    ).filter_by(kind=kind)
+
+    if molecule_ids is not None:
+        query = query.filter(DBMoleculeFingerprint.parent_id.in_(molecule_ids))
+
+    return {
+        molecule_id: numpy.frombuffer(bits, dtype=numpy.uint8)
+        for molecule_id, bits in query
+    }
+
+
+def _compute_molecule_fingerprints(
+    database_path: str,
+    kinds: tuple[str, ...],
+    molecule_ids: list[int],
+) -> list[tuple[int, str, bytes]]:
+    """
+    Compute fingerprints of each kind of the given molecules, returning (molecule id,
+    kind, packed bits) triples. Mapped SMILES are read here through a read-only
+    connection to the store.
+    """
+    from yammbs._analyze import _get_mapped_smiles
+    from yammbs._similarity import _MORGAN, _get_morgan_fingerprint
+
+    get_fingerprint = {
+        _PATTERN: _get_pattern_fingerprint,
+        _MORGAN: _get_morgan_fingerprint,
+    }
+
+    mapped_smiles = _get_mapped_smiles(database_path, molecule_ids)
+
+    results: list[tuple[int, str, bytes]] = list()
+
+    for molecule_id in molecule_ids:
+        rdmol = _to_rdkit(mapped_smiles[molecule_id])
+
+        results.extend(
+            (
+                molecule_id,
+                kind,
+                numpy.packbits(get_fingerprint[kind](rdmol)).tobytes(),
+            )
+            for kind in kinds
+        )
+
+    return results
+
+
+def _get_matches(
+    mapped_smiles: str,
+    smirks: tuple[str, ...],
+    candidates: numpy.ndarray | None = None,
+) -> list[bool]:
+    """
+    Return whether a molecule matches each of the SMIRKS patterns, only matching those
+    marked as `candidates`, if given, by fingerprint screening.
+    """
+    if candidates is None:
+        candidates = numpy.ones(len(smirks), dtype=bool)
+
+    if not candidates.any():
+        return [False] * len(smirks)
+
+    rdmol = _to_rdkit(mapped_smiles)
+
+    return [
+        (
+            rdmol.HasSubstructMatch(_compile(pattern), useChirality=True)
+            if candidate
+            else False
+        )
+        for pattern, candidate in zip(smirks, candidates)
+    ]
+
+
+def _compute_molecule_smirks_matches(
+    database_path: str,
+    smirks: tuple[str, ...],
+    molecule_ids: list[int],
+) -> list[tuple[int, list[bool]]]:
+    """
+    Match the given molecules against each SMIRKS pattern, returning (molecule id,
+    matches) pairs. Patterns are only matched against molecules whose stored
+    fingerprints do not rule them out. Mapped SMILES and fingerprints are read here
+    through a read-only connection to the store.
+    """
+    from yammbs._analyze import _get_mapped_smiles, _get_read_only_engine
+
+    mapped_smiles = _get_mapped_smiles(database_path, molecule_ids)
+
+    with Session(_get_read_only_engine(database_path)) as session:
+        fingerprints = _get_fingerprints(session, molecule_ids)
+
+    return [
+        (
+            molecule_id,
+            _get_matches(
+                mapped_smiles[molecule_id],
+                smirks,
+                (
+                    _screen(fingerprints[molecule_id][None], list(smirks))[0]
+                    if molecule_id in fingerprints
+                    else None
+                ),
+            ),
+        )
+        for molecule_id in molecule_ids
+    ]
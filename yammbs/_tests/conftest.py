@@ -93,6 +93,21 @@ def tiny_cache() -> CachedResultCollection:
     )
 
 
+@pytest.fixture
+def tinier_store(tiny_cache, tmp_path, request) -> MoleculeStore:
+    """
+    Return a store of the first few results of the "tiny" collection, four unless
+    another number is given by indirect parametrization.
+    """
+    tinier_cache = CachedResultCollection()
+    tinier_cache.inner = tiny_cache.inner[: getattr(request, "param", 4)]
+
+    return MoleculeStore.from_cached_result_collection(
+        tinier_cache,
+        database_name=(tmp_path / "tinier.sqlite").as_posix(),
+    )
+
+
 @pytest.fixture
 def diphenylvinylbenzene():
     """Return 1,2-diphenylvinylbenzene"""
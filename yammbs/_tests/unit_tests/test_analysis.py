@@ -1,8 +1,22 @@
+import numpy
 import pandas
 import pytest
 from openff.toolkit import Molecule
 
-from yammbs.analysis import get_internal_coordinate_rmsds, get_rmsd, get_tfd
+from yammbs.analysis import (
+    DDE,
+    ICRMSD,
+    DDECollection,
+    ICRMSDCollection,
+    _compute_metrics,
+    _get_geometric_internal_coordinate_rmsds,
+    _get_openeye_rmsd,
+    _get_rdkit_tfd,
+    get_internal_coordinate_rmsds,
+    get_rmsd,
+    get_rmsds,
+    get_tfd,
+)
 
 
 class TestAnalysis:
@@ -40,6 +54,45 @@ class TestAnalysis:
 
         assert last_first == pytest.approx(first_last)
 
+    def test_rmsd_symmetric_atoms(self):
+        isobutane = Molecule.from_smiles("CC(C)C")
+        isobutane.generate_conformers(n_conformers=1)
+
+        reference = isobutane.conformers[0].m_as("angstrom")
+
+        # swap the coordinates of two of the (equivalent) methyl carbons, which
+        # come first and third in the SMILES
+        target = reference.copy()
+        target[[0, 2]] = target[[2, 0]]
+
+        assert get_rmsd(isobutane, reference, target) == pytest.approx(0.0, abs=1e-6)
+
+    def test_batched_rmsds(self, ligand):
+        references = [ligand.conformers[0]] * 10
+        targets = ligand.conformers[:10]
+
+        assert get_rmsds(ligand, references, targets) == pytest.approx(
+            [get_rmsd(ligand, ligand.conformers[0], target) for target in targets],
+        )
+
+    def test_rmsd_matches_openeye(self, allicin, conformers, ligand):
+        oechem = pytest.importorskip("openeye.oechem")
+
+        if not oechem.OEChemIsLicensed():
+            pytest.skip("OpenEye is not licensed")
+
+        for molecule, conformers in [
+            (allicin, conformers),
+            (ligand, ligand.conformers),
+        ]:
+            coordinates = [conformer.m_as("angstrom") for conformer in conformers[:10]]
+
+            for target in coordinates[1:]:
+                assert get_rmsd(molecule, coordinates[0], target) == pytest.approx(
+                    _get_openeye_rmsd(molecule, coordinates[0], target),
+                    abs=1e-4,
+                )
+
     def test_tfd(self, allicin, conformers):
         # Passing the same conformers should return 0.0
         last_last = get_tfd(
@@ -74,6 +127,151 @@ class TestAnalysis:
 
         assert last_first == first_last
 
+    def test_tfd_matches_rdkit(self, allicin, conformers, ligand):
+        for molecule, conformers in [
+            (allicin, conformers),
+            (ligand, ligand.conformers),
+        ]:
+            coordinates = [conformer.m_as("angstrom") for conformer in conformers[:10]]
+
+            for target in coordinates[1:]:
+                assert get_tfd(molecule, coordinates[0], target) == pytest.approx(
+                    _get_rdkit_tfd(molecule, coordinates[0], target),
+                )
+
+    def test_tfd_no_torsions(self, water):
+        assert get_tfd(water, water.conformers[0], water.conformers[0]) == 0.0
+
+    def test_compute_metrics_failures(self, allicin, conformers, monkeypatch):
+        import yammbs._rmsd
+        import yammbs._tfd
+
+        reference, target = (conformer.m_as("angstrom") for conformer in conformers[:2])
+
+        with pytest.raises(ValueError, match="Unknown metric"):
+            _compute_metrics(allicin, reference, target, ["rmsd", "carrier-pigeon"])
+
+        def fail(*args, **kwargs):
+            raise ValueError("failed")
+
+        # as in the analyses, only TFD failures are tolerated
+        monkeypatch.setattr(yammbs._tfd, "_get_tfds", fail)
+
+        values = _compute_metrics(allicin, reference, target, ["rmsd", "tfd"])
+
+        assert values["rmsd"] == get_rmsd(allicin, reference, target)
+        assert numpy.isnan(values["tfd"])
+
+        monkeypatch.setattr(yammbs._rmsd, "_get_symmetric_rmsds", fail)
+
+        with pytest.raises(ValueError, match="failed"):
+            _compute_metrics(allicin, reference, target, ["rmsd"])
+
+
+class TestCollections:
+    def test_list_like(self):
+        ddes = DDECollection()
+
+        ddes.append(DDE(qcarchive_id=1, force_field="openff-2.1.0", difference=0.5))
+        ddes.extend(
+            DDE(qcarchive_id=id, force_field="openff-2.0.0", difference=-1.0)
+            for id in range(2, 40)
+        )
+
+        assert len(ddes) == 39
+        assert ddes[0] == DDE(
+            qcarchive_id=1,
+            force_field="openff-2.1.0",
+            difference=0.5,
+        )
+        assert ddes[-1].qcarchive_id == 39
+        assert ddes[-1].force_field == "openff-2.0.0"
+        assert [dde.qcarchive_id for dde in ddes[1:3]] == [2, 3]
+        assert isinstance(ddes[1:3], DDECollection)
+
+        assert ddes[5] in ddes
+        assert (
+            DDE(qcarchive_id=1, force_field="openff-2.0.0", difference=0.5) not in ddes
+        )
+
+        assert ddes == DDECollection(list(ddes))
+        assert ddes != ddes[:-1]
+
+        with pytest.raises(IndexError):
+            ddes[39]
+
+    def test_list_methods(self):
+        ddes = DDECollection.from_arrays([3, 1, 2], [0.3, 0.1, 0.2], "openff-2.1.0")
+        extra = DDE(qcarchive_id=4, force_field="openff-2.0.0", difference=0.4)
+
+        ddes.insert(0, extra)
+        assert [dde.qcarchive_id for dde in ddes] == [4, 3, 1, 2]
+
+        ddes.sort(key=lambda dde: dde.qcarchive_id)
+        assert [dde.qcarchive_id for dde in ddes] == [1, 2, 3, 4]
+        assert ddes[-1] == extra
+
+        ddes.remove(extra)
+        del ddes[0]
+        assert [dde.qcarchive_id for dde in ddes] == [2, 3]
+
+        ddes[0] = extra
+        assert ddes[0] == extra
+
+        combined = ddes + [extra]
+        assert isinstance(combined, DDECollection)
+        assert len(combined) == 3
+        assert len([extra] + ddes) == 3
+
+        assert ddes.pop().qcarchive_id == 3
+        assert len(ddes) == 1
+
+    def test_dataframe(self):
+        ddes = DDECollection.from_arrays(
+            [3, 1, 2],
+            [0.1, numpy.nan, -0.2],
+            "openff-2.1.0",
+        )
+
+        dataframe = ddes.to_dataframe()
+
+        assert list(dataframe.index) == [3, 1, 2]
+        assert list(dataframe.columns) == ["difference"]
+        assert numpy.isnan(ddes[1].difference)
+
+        # by default, the frame can be modified without changing the collection
+        dataframe.loc[3, "difference"] = 1.0
+
+        assert ddes[0].difference == pytest.approx(0.1)
+
+        view = ddes.to_dataframe(copy=False)
+
+        assert numpy.shares_memory(view["difference"].to_numpy(), ddes.values)
+
+        # the frame is not changed by results appended later
+        ddes.append(DDE(qcarchive_id=4, force_field="openff-2.1.0", difference=1.0))
+
+        assert len(view) == 3
+        assert len(ddes.to_dataframe()) == 4
+
+    def test_icrmsd_missing_types(self):
+        icrmsds = ICRMSDCollection(
+            [
+                ICRMSD(
+                    qcarchive_id=1,
+                    force_field="openff-2.1.0",
+                    icrmsd={"Bond": 0.1, "Angle": 0.2},
+                ),
+            ],
+        )
+
+        assert icrmsds[0].icrmsd == {"Bond": 0.1, "Angle": 0.2}
+
+        data = icrmsds.to_dataframe().loc[1]
+
+        assert data["Bond"] == pytest.approx(0.1)
+        assert data["Dihedral"] is pandas.NA
+
 
 class TestInternalCoordinateRMSD:
     def test_rmsds_between_conformers(self, ligand):
@@ -100,6 +298,27 @@ class TestInternalCoordinateRMSD:
             [rmsds[key] == 0.0 for key in ["Bond", "Angle", "Dihedral", "Improper"]],
         )
 
+    def test_matches_geometric(self, ligand):
+        pytest.importorskip("geometric")
+
+        for target in ligand.conformers[1:10]:
+            rmsds = get_internal_coordinate_rmsds(
+                molecule=ligand,
+                reference=ligand.conformers[0],
+                target=target,
+            )
+
+            expected = _get_geometric_internal_coordinate_rmsds(
+                molecule=ligand,
+                reference=ligand.conformers[0].m_as("angstrom"),
+                target=target.m_as("angstrom"),
+            )
+
+            assert rmsds.keys() == expected.keys()
+
+            for key, value in expected.items():
+                assert rmsds[key] == pytest.approx(value)
+
     def test_no_torsions(self, water):
         rmsds = get_internal_coordinate_rmsds(
             molecule=water,
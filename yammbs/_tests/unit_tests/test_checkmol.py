@@ -1,7 +1,12 @@
 import pytest
 from openff.toolkit import Molecule
 
-from yammbs.checkmol import ChemicalEnvironment, analyze_functional_groups
+from yammbs.checkmol import (
+    ChemicalEnvironment,
+    analyze_functional_groups,
+    analyze_functional_groups_batch,
+    classify_functional_groups,
+)
 
 
 @pytest.mark.parametrize(
@@ -24,3 +29,54 @@ def test_analyze_ethanol(mapped):
         ChemicalEnvironment.PrimaryAlcohol,
     ):
         assert group in groups
+
+
+def test_analyze_batch():
+    smiles = ["CCO", "O", "c1ccccc1", "CC(=O)N"]
+
+    assert analyze_functional_groups_batch(smiles) == [
+        analyze_functional_groups(pattern) for pattern in smiles
+    ]
+
+
+@pytest.mark.parametrize(
+    "smiles",
+    [
+        "CCO",
+        "O",
+        "c1ccccc1",
+        "c1ccccc1Cl",
+        # amides and lactams
+        "CC(=O)N",
+        "CC(=O)NC",
+        "CC(=O)N(C)C",
+        "O=C1CCCN1",
+        # esters and lactones
+        "CC(=O)OC",
+        "O=C1CCCO1",
+        # amines
+        "CN",
+        "CNC",
+        "CN(C)C",
+        "Nc1ccccc1",
+        "CNc1ccccc1",
+        # nitro compounds
+        "C[N+](=O)[O-]",
+        "[O-][N+](=O)c1ccccc1",
+        # heterocycles
+        "c1ccncc1",
+        "c1ccoc1",
+        "C1CCOC1",
+        "c1ccc2[nH]ccc2c1",
+    ],
+)
+def test_classify_matches_checkmol(smiles):
+    assert classify_functional_groups(smiles) == analyze_functional_groups(smiles)
+
+
+def test_classify_matches_checkmol_on_store(small_store):
+    smiles = small_store.get_smiles()
+
+    assert [
+        classify_functional_groups(pattern) for pattern in smiles
+    ] == analyze_functional_groups_batch(smiles)
@@ -0,0 +1,119 @@
+import math
+import operator
+import os
+
+import pytest
+
+from yammbs.executors import FileQueueExecutor, SerialExecutor, _ExecutorPool
+
+
+def test_serial_executor():
+    executor = SerialExecutor()
+
+    assert executor.submit(operator.mul, 3, 4).result() == 12
+
+    with pytest.raises(ValueError):
+        executor.submit(math.sqrt, -1).result()
+
+
+def test_file_queue_executor():
+    with FileQueueExecutor(n_workers=2) as executor:
+        assert list(executor.map(operator.mul, range(10), range(10))) == [
+            x * x for x in range(10)
+        ]
+
+        with pytest.raises(ValueError):
+            executor.submit(math.sqrt, -1).result()
+
+        directory = executor.directory
+
+    # temporary queue directories are cleaned up
+    assert not os.path.exists(directory)
+
+
+def test_file_queue_executor_external_workers(tmp_path):
+    import threading
+
+    from yammbs.executors import _work
+
+    executor = FileQueueExecutor(directory=tmp_path)
+
+    future = executor.submit(operator.mul, 6, 7)
+
+    # as a worker started by a batch scheduler would
+    worker = threading.Thread(target=_work, args=(tmp_path.as_posix(), 0.01))
+    worker.start()
+
+    assert future.result(timeout=10) == 42
+
+    executor.shutdown()
+
+    (tmp_path / "STOP").touch()
+    worker.join()
+
+
+def test_file_queue_executor_unreadable_result(tmp_path):
+    executor = FileQueueExecutor(directory=tmp_path, poll_interval=0.01)
+
+    future = executor.submit(operator.mul, 6, 7)
+    (task_id,) = executor._futures
+
+    (tmp_path / "results" / f"{task_id}.pkl").write_bytes(b"not a pickle")
+
+    with pytest.raises(RuntimeError, match="Could not read result"):
+        future.result(timeout=10)
+
+    # the collector keeps running
+    other = executor.submit(operator.mul, 2, 3)
+    (task_id,) = executor._futures
+
+    (tmp_path / "results" / f"{task_id}.pkl").write_bytes(b"")
+
+    with pytest.raises(RuntimeError, match="Could not read result"):
+        other.result(timeout=10)
+
+    executor.shutdown()
+
+
+def test_file_queue_executor_requeues_stale_claims(tmp_path):
+    import threading
+
+    from yammbs.executors import _work
+
+    executor = FileQueueExecutor(
+        directory=tmp_path,
+        poll_interval=0.01,
+        claim_timeout=0.5,
+    )
+
+    future = executor.submit(operator.mul, 6, 7)
+    (task,) = os.listdir(tmp_path / "tasks")
+
+    # as claimed by a worker that was then killed
+    claimed = tmp_path / "claimed" / f"{task}.12345"
+    os.rename(tmp_path / "tasks" / task, claimed)
+    os.utime(claimed, (0, 0))
+
+    worker = threading.Thread(target=_work, args=(tmp_path.as_posix(), 0.01))
+    worker.start()
+
+    assert future.result(timeout=10) == 42
+    assert os.listdir(tmp_path / "claimed") == []
+
+    executor.shutdown()
+
+    (tmp_path / "STOP").touch()
+    worker.join()
+
+
+@pytest.mark.parametrize("executor", ["serial", "threads", "subprocess"])
+def test_executor_pool(executor):
+    with _ExecutorPool(executor, n_processes=2) as pool:
+        assert sorted(
+            pool.imap_unordered(math.sqrt, (x * x for x in range(10))),
+        ) == [float(x) for x in range(10)]
+
+
+def test_unknown_executor():
+    with pytest.raises(ValueError, match="Unknown executor"):
+        _ExecutorPool("carrier-pigeon", n_processes=2)
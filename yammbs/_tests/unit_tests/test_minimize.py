@@ -1,4 +1,6 @@
+import os
 import platform
+import shutil
 
 import numpy
 import pytest
@@ -69,6 +71,8 @@ def test_minimization_basic(perturbed_input):
     final = result.coordinates[0] - result.coordinates[1]
     assert 1.5 < numpy.linalg.norm(final) < 1.6
 
+    assert result.elapsed > 0.0
+
 
 def test_same_force_field_same_results():
     energy1 = _run_openmm(basic_input("openff-1.0.0")).energy
@@ -192,3 +196,214 @@ def test_partially_minimized(tiny_cache, tmp_path, guess_n_processes):
     tinier_store.optimize_mm(force_field="openff-2.0.0", n_processes=guess_n_processes)
 
     assert get_n_results(tinier_store) == (12, 12)
+
+
+def test_limit_threads(monkeypatch):
+    from yammbs._tuning import _limit_threads
+
+    monkeypatch.setenv("OMP_NUM_THREADS", "8")
+    monkeypatch.delenv("OPENMM_CPU_THREADS", raising=False)
+
+    with _limit_threads(1):
+        assert os.environ["OMP_NUM_THREADS"] == "1"
+        assert os.environ["OPENMM_CPU_THREADS"] == "1"
+
+    assert os.environ["OMP_NUM_THREADS"] == "8"
+    assert "OPENMM_CPU_THREADS" not in os.environ
+
+
+def test_auto_n_processes_reuses_calibration(tinier_store, monkeypatch):
+    import yammbs._tuning
+
+    store = tinier_store
+
+    store.optimize_mm(force_field="openff-1.0.0", n_processes="auto")
+
+    n_minimized = sum(
+        len(store.get_mm_conformers_by_molecule_id(id, force_field="openff-1.0.0"))
+        for id in store.get_molecule_ids()
+    )
+
+    assert n_minimized == 4
+
+    def do_not_calibrate(*args, **kwargs):
+        raise AssertionError("Calibration should have been reused")
+
+    monkeypatch.setattr(yammbs._tuning, "_calibrate", do_not_calibrate)
+
+    store.optimize_mm(force_field="openff-2.0.0", n_processes="auto")
+
+    # a configuration calibrated without a budget may not fit a smaller one
+    budgets = list()
+
+    def calibrate(inputs, memory_budget, n_cpus):
+        budgets.append(memory_budget)
+
+        return yammbs._tuning.TuningResult(
+            n_processes=1,
+            n_threads=1,
+            chunksize=1,
+            throughput=1.0,
+        )
+
+    monkeypatch.setattr(yammbs._tuning, "_calibrate", calibrate)
+
+    store.optimize_mm(
+        force_field="openff-2.1.0",
+        n_processes="auto",
+        memory_budget=2**30,
+    )
+
+    assert budgets == [2**30]
+
+
+def test_shared_memory_transport_matches_pickle(tinier_store, tmp_path):
+    stores = [
+        tinier_store,
+        MoleculeStore(
+            shutil.copy(tinier_store.database_path, tmp_path / "shared.sqlite"),
+        ),
+    ]
+
+    stores[0].optimize_mm(force_field="openff-1.0.0", n_processes=2)
+    stores[1].optimize_mm(
+        force_field="openff-1.0.0",
+        n_processes=2,
+        shared_memory=True,
+    )
+
+    for molecule_id in stores[0].get_molecule_ids():
+        expected, actual = (
+            store.get_mm_conformer_records_by_molecule_id(
+                molecule_id,
+                force_field="openff-1.0.0",
+            )
+            for store in stores
+        )
+
+        assert len(expected) == len(actual) > 0
+
+        for a, b in zip(expected, actual):
+            assert a.qcarchive_id == b.qcarchive_id
+            assert a.energy == pytest.approx(b.energy)
+            numpy.testing.assert_allclose(a.coordinates, b.coordinates)
+
+
+@pytest.mark.parametrize("tinier_store", [6], indirect=True)
+def test_shard_and_merge(tinier_store, tmp_path):
+    store = tinier_store
+
+    shard_paths = [tmp_path / f"shard-{index}.sqlite" for index in range(2)]
+
+    for index, shard_path in enumerate(shard_paths):
+        store.optimize_mm(
+            force_field="openff-1.0.0",
+            n_processes=1,
+            shard_index=index,
+            n_shards=2,
+            output=shard_path,
+        )
+
+    # nothing written to the main store until merging
+    assert store._get_pending_qm_conformers("openff-1.0.0") != []
+
+    assert store.merge(shard_paths) == 6
+    assert store._get_pending_qm_conformers("openff-1.0.0") == []
+
+    # merging is idempotent
+    assert store.merge(shard_paths) == 0
+
+    # a mistyped path is an error, not an empty shard
+    with pytest.raises(FileNotFoundError, match="shard-2.sqlite"):
+        store.merge([tmp_path / "shard-2.sqlite"])
+
+    assert not (tmp_path / "shard-2.sqlite").exists()
+
+
+@pytest.mark.parametrize("tinier_store", [6], indirect=True)
+def test_leased_minimization(tinier_store):
+    from yammbs._db import DBWorkLease
+
+    store = tinier_store
+
+    (first_id, _), *_ = store._get_pending_qm_conformers("openff-1.0.0")
+
+    # a lease abandoned by a process that died long ago
+    with store._get_session() as db:
+        db.db.add(
+            DBWorkLease(
+                qm_conformer_id=first_id,
+                force_field="openff-1.0.0",
+                owner="dead",
+                expires=0.0,
+            ),
+        )
+
+    store.optimize_mm(force_field="openff-1.0.0", n_processes=1, lease_size=2)
+
+    assert store._get_pending_qm_conformers("openff-1.0.0") == []
+
+    with store._get_session() as db:
+        assert db.db.query(DBWorkLease).count() == 0
+
+
+@pytest.mark.parametrize("executor", ["serial", "threads", "subprocess"])
+def test_executors(tinier_store, executor):
+    store = tinier_store
+
+    store.optimize_mm(force_field="openff-1.0.0", n_processes=2, executor=executor)
+
+    assert store._get_pending_qm_conformers("openff-1.0.0") == []
+
+    with pytest.raises(ValueError, match="executor"):
+        store.optimize_mm(
+            force_field="openff-2.0.0",
+            executor=executor,
+            shared_memory=True,
+        )
+
+
+def test_fused_metrics_match_separate_analysis(tinier_store, tmp_path):
+    fused = tinier_store
+    separate = MoleculeStore(
+        shutil.copy(tinier_store.database_path, tmp_path / "separate.sqlite"),
+    )
+
+    fused.optimize_mm(
+        force_field="openff-1.0.0",
+        n_processes=1,
+        metrics=["rmsd", "tfd", "icrmsd"],
+    )
+    separate.optimize_mm(force_field="openff-1.0.0", n_processes=1)
+
+    assert len(fused._get_stored_metrics("openff-1.0.0", ["rmsd"])) == 4
+    assert separate._get_stored_metrics("openff-1.0.0", ["rmsd"]) == dict()
+
+    for method in ("get_rmsd", "get_tfd", "get_internal_coordinate_rmsd"):
+        numpy.testing.assert_allclose(
+            getattr(fused, method)("openff-1.0.0").to_dataframe().astype(float),
+            getattr(separate, method)("openff-1.0.0").to_dataframe().astype(float),
+            atol=1e-6,
+        )
+
+    with pytest.raises(ValueError, match="Unknown metric"):
+        fused.optimize_mm(force_field="openff-2.0.0", metrics=["dde"])
+
+
+def test_invalid_shard(small_store):
+    with pytest.raises(ValueError, match="together"):
+        small_store.optimize_mm(force_field="openff-1.0.0", shard_index=0)
+
+    with pytest.raises(ValueError, match="shard_index"):
+        small_store.optimize_mm(
+            force_field="openff-1.0.0",
+            shard_index=2,
+            n_shards=2,
+        )
+
+    with pytest.raises(ValueError, match="lease_size"):
+        small_store.optimize_mm(
+            force_field="openff-1.0.0",
+            lease_size=10,
+            output="other.sqlite",
+        )
@@ -2,7 +2,7 @@ import numpy
 from openff.toolkit import Molecule
 from openff.units import unit
 
-from yammbs._molecule import _to_geometric_molecule
+from yammbs._molecule import _MoleculeCache, _to_geometric_molecule
 
 
 def test_to_geometric_molecule():
@@ -18,3 +18,26 @@ def test_to_geometric_molecule():
         molecule.conformers[0].m_as(unit.angstrom),
         geometric_molecule.Data["xyzs"][0],
     )
+
+
+def test_molecule_cache_is_bounded():
+    cache = _MoleculeCache(max_size=2)
+
+    ethanol, methane, water = (
+        Molecule.from_smiles(smiles).to_smiles(mapped=True)
+        for smiles in ("CCO", "C", "O")
+    )
+
+    molecule = cache.get(ethanol)
+
+    assert cache.get(ethanol) is molecule
+    assert molecule.to_smiles(mapped=True) == ethanol
+
+    cache.get(methane)
+    cache.get(ethanol)
+    cache.get(water)
+
+    # methane was the least recently used
+    assert len(cache) == 2
+    assert cache.get(ethanol) is molecule
+    assert list(cache._molecules) == [water, ethanol]
@@ -0,0 +1,84 @@
+import os
+import time
+
+import pytest
+
+from yammbs._pool import _get_rss, _RecyclingPool
+
+
+def _square_with_pid(x: int) -> tuple[int, int]:
+    return x * x, os.getpid()
+
+
+def _raise_on_three(x: int) -> int:
+    if x == 3:
+        raise ValueError("three")
+
+    return x
+
+
+def _grow_on_zero(x: int) -> bytes:
+    if x == 0:
+        hog = b"x" * 2**29  # noqa: F841
+        time.sleep(30)
+
+    # large enough to be sent in several writes
+    return bytes(2**20)
+
+
+def _die_once(path: str) -> str:
+    if not os.path.exists(path):
+        open(path, "w").close()
+        os._exit(1)
+
+    return path
+
+
+def test_get_rss():
+    if not os.path.exists("/proc/self/statm"):
+        pytest.skip("RSS is only read from /proc")
+
+    assert _get_rss() > 0
+    assert _get_rss(os.getpid()) > 0
+
+
+def test_all_results_returned():
+    results = list(_RecyclingPool(2).imap_unordered(_square_with_pid, range(20)))
+
+    assert sorted(square for square, _ in results) == [x * x for x in range(20)]
+
+
+def test_workers_recycled():
+    results = list(
+        _RecyclingPool(2, max_tasks_per_child=2).imap_unordered(
+            _square_with_pid,
+            range(20),
+        ),
+    )
+
+    # each worker handles at most two tasks
+    assert len({pid for _, pid in results}) >= 10
+
+
+def test_errors_propagate():
+    with pytest.raises(ValueError, match="three"):
+        list(_RecyclingPool(2).imap_unordered(_raise_on_three, range(10)))
+
+
+def test_task_requeued_after_worker_dies(tmp_path):
+    path = (tmp_path / "died").as_posix()
+
+    assert list(_RecyclingPool(1).imap_unordered(_die_once, [path])) == [path]
+
+
+def test_worker_over_hard_rss_terminated():
+    if not os.path.exists("/proc/self/statm"):
+        pytest.skip("RSS is only read from /proc")
+
+    # workers forked from this process start at about its size
+    pool = _RecyclingPool(2, hard_rss=_get_rss() + 2**28, max_retries=0)
+
+    results = list(pool.imap_unordered(_grow_on_zero, range(20)))
+
+    # the task that grew is dropped, and the other workers' results are intact
+    assert results == [bytes(2**20)] * 19
@@ -0,0 +1,62 @@
+import pytest
+
+from yammbs._scheduling import (
+    _calibrate_costs,
+    _estimate_cost,
+    _guided_chunks,
+    _sort_by_cost,
+)
+
+
+def test_larger_flexible_molecules_cost_more():
+    assert _estimate_cost(n_atoms=40, n_rotatable_bonds=0) > _estimate_cost(
+        n_atoms=10,
+        n_rotatable_bonds=0,
+    )
+    assert _estimate_cost(n_atoms=40, n_rotatable_bonds=6) > _estimate_cost(
+        n_atoms=40,
+        n_rotatable_bonds=0,
+    )
+
+
+def test_calibrate_costs_prefers_timings():
+    costs = _calibrate_costs(
+        estimates={"a": 100.0, "b": 200.0, "c": 400.0},
+        timings={"a": 1.0, "b": 2.0},
+    )
+
+    assert costs["a"] == 1.0
+    assert costs["b"] == 2.0
+    assert costs["c"] == pytest.approx(4.0)
+
+
+def test_sort_by_cost_is_stable():
+    assert _sort_by_cost(["a", "b", "c", "d"], [1.0, 3.0, 1.0, 2.0]) == [
+        "b",
+        "d",
+        "a",
+        "c",
+    ]
+
+
+@pytest.mark.parametrize("n_processes", [1, 4, 16])
+def test_guided_chunks_shrink(n_processes):
+    tasks = list(range(1000))
+
+    chunks = list(_guided_chunks(tasks, n_processes, max_chunksize=32))
+
+    assert [task for chunk in chunks for task in chunk] == tasks
+    assert max(len(chunk) for chunk in chunks) <= 32
+    assert len(chunks[-1]) == 1
+
+    sizes = [len(chunk) for chunk in chunks]
+    assert sizes == sorted(sizes, reverse=True)
+
+
+def test_guided_chunks_lazy():
+    chunks = list(
+        _guided_chunks((task for task in range(100)), n_processes=2, n_tasks=100),
+    )
+
+    assert [task for chunk in chunks for task in chunk] == list(range(100))
+    assert len(chunks[-1]) == 1
@@ -0,0 +1,31 @@
+import numpy
+
+from yammbs.selection import MoleculeSelection, _compress, _decompress
+
+
+def test_selection_algebra():
+    universe = numpy.ones(8, dtype=bool)
+    universe[0] = False
+
+    first = MoleculeSelection.from_ids([1, 2, 3], universe)
+    second = MoleculeSelection.from_ids([3, 4], universe)
+
+    assert first == [1, 2, 3]
+    assert first & second == [3]
+    assert first | second == [1, 2, 3, 4]
+    assert first - second == [1, 2]
+    assert ~first == [4, 5, 6, 7]
+
+    # plain lists of ids are combined too
+    assert [2, 5] & first == [2]
+    assert first - [1] == [2, 3]
+
+    assert 3 in first
+    assert 4 not in first
+    assert 100 not in first
+
+
+def test_bitmap_round_trip():
+    bits = numpy.random.default_rng(0).random(1001) > 0.9
+
+    assert numpy.array_equal(_decompress(_compress(bits), len(bits)), bits)
@@ -3,12 +3,20 @@ import random
 import tempfile
 
 import numpy
+import pandas
 import pytest
 from openff.qcsubmit.results import OptimizationResultCollection
 from openff.toolkit import Molecule
 from openff.utilities import get_data_file_path, temporary_cd
 
 from yammbs import MoleculeStore
+from yammbs._db import (
+    DBMoleculeDescriptors,
+    DBMoleculeFingerprint,
+    DBParameterLabelRun,
+    DBSelectionIndex,
+    DBSmirksMatch,
+)
 from yammbs.checkmol import ChemicalEnvironment
 from yammbs.exceptions import DatabaseExistsError
 from yammbs.models import MMConformerRecord, QMConformerRecord
@@ -37,6 +45,13 @@ def test_from_cached_collection(small_cache):
         # Ensure a new object can be created from the same database
         assert len(MoleculeStore(db)) == len(store)
 
+        # descriptors and fingerprints are computed when first needed
+        with store._get_session() as session:
+            assert session.db.query(DBMoleculeDescriptors).count() == 0
+            assert session.db.query(DBMoleculeFingerprint).count() == 0
+
+        assert len(store.get_descriptors()) == len(store)
+
 
 def test_do_not_overwrite(small_collection):
     with tempfile.NamedTemporaryFile(suffix=".sqlite") as file:
@@ -221,6 +236,80 @@ def test_filter_by_checkmol(small_store, environment, expected_len, func):
         assert value in all_values
 
 
+def test_filter_by_checkmol_is_stored(small_store):
+    aromatic = small_store.filter_by_checkmol(ChemicalEnvironment.Aromatic)
+
+    # every molecule was analyzed once, and later queries do not run checkmol
+    assert small_store._update_functional_groups("checkmol") == 0
+    assert small_store.filter_by_checkmol(ChemicalEnvironment.Aromatic) == aromatic
+
+
+def test_select(small_store):
+    alkenes = small_store.select_functional_group(ChemicalEnvironment.Alkene)
+    aromatics = small_store.select_smirks("[#6:1]:[#6:2]")
+    small = small_store.select_descriptors(n_heavy_atoms=(None, 8))
+
+    assert alkenes == small_store.filter_by_functional_group(ChemicalEnvironment.Alkene)
+    assert aromatics == small_store.filter_by_smirks("[#6:1]:[#6:2]")
+
+    selection = (alkenes | aromatics) & ~small
+    expected = (set(alkenes) | set(aromatics)) - set(small)
+
+    assert selection == sorted(expected)
+
+    # selections are stored, and read back by other instances
+    other = MoleculeStore(small_store.database_path)
+
+    assert other.select_smirks("[#6:1]:[#6:2]") == aromatics
+
+    with other._get_session() as db:
+        assert db.db.query(DBSelectionIndex).filter_by(kind="smirks").count() == 1
+
+    all_ddes = small_store.get_dde(force_field="openff-2.1.0")
+    ddes = small_store.get_dde(force_field="openff-2.1.0", molecule_ids=selection)
+
+    assert 0 < len(ddes) < len(all_ddes)
+
+    for dde in ddes:
+        assert dde in all_ddes
+
+
+@pytest.mark.parametrize(
+    "func",
+    [
+        ("get_dde"),
+        ("get_rmsd"),
+        ("get_internal_coordinate_rmsd"),
+        ("get_tfd"),
+    ],
+)
+def test_empty_selection(small_store, func):
+    empty = small_store.select_smirks("[#8:1]")
+
+    assert empty == []
+
+    # an empty selection is not the same as no selection
+    assert len(getattr(small_store, func)("openff-2.1.0", molecule_ids=empty)) == 0
+    assert len(small_store.get_metrics("openff-2.1.0", molecule_ids=empty)) == 0
+
+
+@pytest.mark.parametrize(
+    "environment",
+    [
+        ChemicalEnvironment.Alkane,
+        ChemicalEnvironment.Alkene,
+        ChemicalEnvironment.Alkyne,
+        ChemicalEnvironment.Aromatic,
+        ChemicalEnvironment.Alcohol,
+    ],
+)
+def test_filter_by_functional_group(small_store, environment):
+    assert small_store.filter_by_functional_group(
+        environment,
+        classifier="smarts",
+    ) == small_store.filter_by_checkmol(environment)
+
+
 @pytest.mark.parametrize(
     "func",
     [
@@ -252,3 +341,496 @@ def test_filter_by_smirks(small_store, smirks, expected_len, func):
 
     for value in filtered_values:
         assert value in all_values
+
+
+def test_filter_by_smirks_batch(small_store):
+    smirks = ["[#6:1]=[#6:2]", "[#6:1]:[#6:2]", "[#6:1]~[#7:2]"]
+
+    matches = small_store.filter_by_smirks_batch(smirks, n_processes=2)
+
+    assert [len(matches[pattern]) for pattern in smirks] == [8, 24, 0]
+
+    # results are stored for every molecule and pattern, and reused
+    with small_store._get_session() as db:
+        assert db.db.query(DBSmirksMatch).count() == 3 * len(
+            small_store.get_molecule_ids(),
+        )
+
+    assert small_store.filter_by_smirks("[#6:1]:[#6:2]") == matches["[#6:1]:[#6:2]"]
+
+    with small_store._get_session() as db:
+        assert db.db.query(DBSmirksMatch).count() == 3 * len(
+            small_store.get_molecule_ids(),
+        )
+
+    with pytest.raises(ValueError, match="Could not parse"):
+        small_store.filter_by_smirks("[#6:1]=(")
+
+
+def test_filter_by_smirks_screens_fingerprints(small_store, monkeypatch):
+    import yammbs._substructure
+
+    assert small_store._update_fingerprints() == len(small_store.get_molecule_ids())
+    assert small_store._update_fingerprints() == 0
+
+    def fail(*args, **kwargs):
+        raise AssertionError("molecules were matched")
+
+    monkeypatch.setattr(yammbs._substructure, "_compute_molecule_smirks_matches", fail)
+
+    # fingerprints of these hydrocarbons prove none of them has oxygen
+    assert small_store.filter_by_smirks_batch(["[#8:1]", "[#6:1]~[#8:2]"]) == {
+        "[#8:1]": [],
+        "[#6:1]~[#8:2]": [],
+    }
+
+
+def test_similar_molecules(small_store):
+    from rdkit import DataStructs
+    from rdkit.Chem import rdFingerprintGenerator
+
+    neighbours = small_store.similar_molecules(1, k=5)
+
+    assert len(neighbours) == 5
+    assert 1 not in neighbours.index
+    assert neighbours["similarity"].is_monotonic_decreasing
+
+    generator = rdFingerprintGenerator.GetMorganGenerator(radius=2, fpSize=2048)
+
+    fingerprints = {
+        molecule_id: generator.GetFingerprint(
+            Molecule.from_mapped_smiles(
+                small_store.get_smiles_by_molecule_id(molecule_id),
+            ).to_rdkit(),
+        )
+        for molecule_id in small_store.get_molecule_ids()
+    }
+
+    expected = sorted(
+        DataStructs.TanimotoSimilarity(fingerprints[1], fingerprints[molecule_id])
+        for molecule_id in fingerprints
+        if molecule_id != 1
+    )[::-1][:5]
+
+    numpy.testing.assert_allclose(neighbours["similarity"], expected)
+
+    # all other molecules are returned if there are fewer than k
+    assert len(small_store.similar_molecules(1, k=100)) == len(fingerprints) - 1
+
+    with pytest.raises(ValueError, match="not in the store"):
+        small_store.similar_molecules(1000)
+
+
+@pytest.mark.parametrize(
+    "func",
+    [
+        ("get_rmsd"),
+        ("get_internal_coordinate_rmsd"),
+        ("get_tfd"),
+    ],
+)
+@pytest.mark.parametrize("executor", [None, "threads", "subprocess"])
+def test_parallel_analysis_matches_serial(small_store, func, executor):
+    serial = getattr(small_store, func)(force_field="openff-2.1.0")
+
+    parallel = getattr(small_store, func)(
+        force_field="openff-2.1.0",
+        n_processes=2,
+        executor=executor,
+    )
+
+    assert parallel == serial
+
+
+def test_get_metrics_matches_separate_analyses(small_store):
+    metrics = small_store.get_metrics(force_field="openff-2.1.0")
+
+    assert [*metrics.columns] == [
+        "dde",
+        "rmsd",
+        "tfd",
+        "icrmsd_bond",
+        "icrmsd_angle",
+        "icrmsd_dihedral",
+        "icrmsd_improper",
+    ]
+
+    for column, collection in [
+        ("dde", small_store.get_dde("openff-2.1.0")),
+        ("rmsd", small_store.get_rmsd("openff-2.1.0")),
+        ("tfd", small_store.get_tfd("openff-2.1.0")),
+    ]:
+        expected = collection.to_dataframe()[
+            column if column != "dde" else "difference"
+        ]
+
+        numpy.testing.assert_allclose(
+            metrics.loc[expected.index, column],
+            expected,
+        )
+
+    icrmsd = small_store.get_internal_coordinate_rmsd("openff-2.1.0").to_dataframe()
+
+    numpy.testing.assert_allclose(
+        metrics.loc[icrmsd.index, "icrmsd_bond"],
+        icrmsd["Bond"],
+    )
+
+
+@pytest.mark.parametrize("metric", ["rmsd", "tfd", "icrmsd"])
+def test_metrics_pair_conformers_by_qcarchive_id(small_store, metric):
+    from yammbs._analyze import _compute_molecule_metrics
+    from yammbs._db import DBMMConformerRecord
+
+    database_path = small_store.database_path.as_posix()
+
+    def compute() -> dict:
+        return {
+            qcarchive_id: value
+            for _, qcarchive_id, value in _compute_molecule_metrics(
+                database_path,
+                "openff-2.1.0",
+                None,
+                metric,
+                [40],
+            )
+        }
+
+    expected = compute()
+    first = min(expected)
+
+    # as if the minimization of the first conformer had failed
+    with small_store._get_session() as db:
+        db.db.query(DBMMConformerRecord).filter_by(
+            qcarchive_id=first,
+            force_field="openff-2.1.0",
+        ).delete()
+
+    values = compute()
+
+    assert set(values) == set(expected) - {first}
+
+    for qcarchive_id, value in values.items():
+        assert value == pytest.approx(expected[qcarchive_id])
+
+
+def test_iter_metrics_is_incremental(small_store, monkeypatch):
+    import yammbs._analyze
+
+    compute = yammbs._analyze._compute_metric_rows
+    computed = list()
+
+    def record(*args, **kwargs):
+        computed.append(args[-1])
+
+        return compute(*args, **kwargs)
+
+    monkeypatch.setattr(yammbs._analyze, "_compute_metric_rows", record)
+
+    metrics = ["dde", "rmsd", "tfd"]
+
+    rows = small_store.iter_metrics(force_field="openff-2.1.0", metrics=metrics)
+
+    first = next(rows)
+
+    assert set(first) == {"qcarchive_id", *metrics}
+
+    # yielded before the later molecules were computed
+    assert first["qcarchive_id"] in {
+        qcarchive_id
+        for molecule_id in computed[0]
+        for qcarchive_id in small_store.get_qcarchive_ids_by_molecule_id(molecule_id)
+    }
+    assert sum(len(molecule_ids) for molecule_ids in computed) < len(
+        small_store.get_molecule_ids(),
+    )
+
+    dataframe = (
+        pandas.DataFrame.from_records([first, *rows])
+        .set_index("qcarchive_id")
+        .sort_index()
+    )
+
+    assert sorted(
+        molecule_id for molecule_ids in computed for molecule_id in molecule_ids
+    ) == sorted(small_store.get_molecule_ids())
+
+    pandas.testing.assert_frame_equal(
+        dataframe,
+        small_store.get_metrics(force_field="openff-2.1.0", metrics=metrics),
+    )
+
+
+def test_get_metrics_unknown_metric(small_store):
+    with pytest.raises(ValueError, match="Unknown metric"):
+        small_store.get_metrics(force_field="openff-2.1.0", metrics=["energy"])
+
+
+def test_metrics_are_cached(small_store, monkeypatch):
+    import yammbs._analyze
+    from yammbs._db import DBMetricRecord, DBMMConformerRecord
+
+    first = small_store.get_rmsd(force_field="openff-2.1.0")
+
+    assert len(small_store._get_stored_metrics("openff-2.1.0", ["rmsd"])) == len(
+        first,
+    )
+
+    def fail(*args, **kwargs):
+        raise AssertionError("stored metrics should be reused")
+
+    monkeypatch.setattr(yammbs._analyze, "_compute_molecule_metrics", fail)
+
+    assert small_store.get_rmsd(force_field="openff-2.1.0") == first
+
+    monkeypatch.undo()
+
+    def count(table) -> int:
+        with small_store._get_session() as db:
+            return db.db.query(table).filter_by(force_field="openff-2.1.0").count()
+
+    n_conformers, n_metrics = count(DBMMConformerRecord), count(DBMetricRecord)
+
+    # as if the MM conformers and metrics were computed with an earlier version of the
+    # force field, which are then neither used nor deleted
+    with small_store._get_session() as db:
+        for table in (DBMMConformerRecord, DBMetricRecord):
+            db.db.query(table).filter_by(force_field="openff-2.1.0").update(
+                {"fingerprint": "stale"},
+            )
+
+    assert small_store._get_stored_metrics("openff-2.1.0", ["rmsd"]) == dict()
+    assert small_store.get_mm_conformer_records_by_molecule_id(1, "openff-2.1.0") == []
+    assert len(small_store._get_pending_qm_conformers("openff-2.1.0")) > 0
+
+    assert len(small_store.get_rmsd("openff-2.1.0", skip_check=True)) == 0
+    assert len(small_store.get_dde("openff-2.1.0", skip_check=True)) == 0
+
+    assert count(DBMMConformerRecord) == n_conformers
+    assert count(DBMetricRecord) == n_metrics
+    assert (
+        len(small_store.get_mm_conformer_records_by_molecule_id(1, "openff-2.0.0")) > 0
+    )
+
+
+def test_failed_metrics_are_not_retried(small_store, monkeypatch):
+    import yammbs._tfd
+
+    get_tfds = yammbs._tfd._get_tfds
+
+    calls = list()
+
+    def fail_first(molecule, *args):
+        calls.append(molecule)
+
+        if len(calls) == 1:
+            raise ValueError("no torsions")
+
+        return get_tfds(molecule, *args)
+
+    monkeypatch.setattr(yammbs._tfd, "_get_tfds", fail_first)
+
+    tfds = small_store.get_tfd(force_field="openff-2.1.0", skip_check=True)
+
+    # the molecule that failed is left out, and stored so that it is not tried again
+    assert len(tfds) < len(small_store.get_rmsd("openff-2.1.0", skip_check=True))
+
+    n_calls = len(calls)
+
+    assert small_store.get_tfd(force_field="openff-2.1.0", skip_check=True) == tfds
+    assert len(calls) == n_calls
+
+    metrics = small_store.get_metrics("openff-2.1.0", metrics=["tfd"], skip_check=True)
+
+    assert len(calls) == n_calls
+    assert metrics["tfd"].isna().sum() == len(metrics) - len(tfds)
+
+
+def test_partially_stored_metrics_are_not_duplicated(small_store):
+    from yammbs._db import DBMetricRecord
+
+    rmsds = small_store.get_rmsd(force_field="openff-2.1.0")
+
+    def count() -> int:
+        with small_store._get_session() as db:
+            return (
+                db.db.query(DBMetricRecord)
+                .filter_by(force_field="openff-2.1.0", name="rmsd")
+                .count()
+            )
+
+    assert count() == len(rmsds)
+
+    # forget one conformer of a molecule, so that the whole molecule is recomputed
+    qcarchive_id = small_store.get_qcarchive_ids_by_molecule_id(40)[0]
+
+    with small_store._get_session() as db:
+        db.db.query(DBMetricRecord).filter_by(
+            qcarchive_id=qcarchive_id,
+            force_field="openff-2.1.0",
+            name="rmsd",
+        ).delete()
+
+    assert small_store.get_rmsd(force_field="openff-2.1.0") == rmsds
+    assert count() == len(rmsds)
+
+
+def test_parameter_labels_of_selection(small_store):
+    molecule_ids = small_store.get_molecule_ids()[:3]
+
+    labels = small_store.get_parameter_labels(
+        force_field="openff-2.1.0",
+        molecule_ids=molecule_ids,
+    )
+
+    assert set(labels["molecule_id"]) == set(molecule_ids)
+
+    # only the selected molecules are labelled
+    with small_store._get_session() as db:
+        labelled = {id for (id,) in db.db.query(DBParameterLabelRun.parent_id)}
+
+    assert labelled == set(molecule_ids)
+
+    assert len(small_store.get_parameter_labels("openff-2.1.0", molecule_ids=[])) == 0
+
+
+def test_parameter_metrics(small_store, monkeypatch):
+    import yammbs._labels
+
+    labels = small_store.get_parameter_labels(force_field="openff-2.1.0")
+
+    assert set(labels["molecule_id"]) == set(small_store.get_molecule_ids())
+    assert "Bonds" in set(labels["handler"])
+
+    def fail(*args, **kwargs):
+        raise AssertionError("stored labels should be reused")
+
+    # labels are stored once per version of the force field
+    monkeypatch.setattr(yammbs._labels, "_compute_molecule_labels", fail)
+
+    assert len(small_store.get_parameter_labels(force_field="openff-2.1.0")) == len(
+        labels,
+    )
+
+    summary = small_store.get_parameter_metrics(
+        force_field="openff-2.1.0",
+        metrics=["dde", "rmsd"],
+    )
+
+    assert summary[("n_molecules", "")].max() <= len(small_store.get_molecule_ids())
+
+    handler, parameter_id = labels.iloc[0][["handler", "parameter_id"]]
+
+    molecule_ids = labels.loc[
+        (labels["handler"] == handler) & (labels["parameter_id"] == parameter_id),
+        "molecule_id",
+    ]
+
+    qcarchive_ids = [
+        record.qcarchive_id
+        for molecule_id in molecule_ids
+        for record in small_store.get_qm_conformer_records_by_molecule_id(molecule_id)
+    ]
+
+    rmsd = small_store.get_rmsd(force_field="openff-2.1.0").to_dataframe()["rmsd"]
+
+    assert summary.loc[(handler, parameter_id), ("rmsd", "mean")] == pytest.approx(
+        numpy.mean([rmsd[qcarchive_id] for qcarchive_id in qcarchive_ids]),
+    )
+    assert (summary[("dde", "max")] >= 0).all()
+
+
+def test_molecule_cache(small_store):
+    from yammbs import _analyze
+
+    _analyze._MOLECULES.clear()
+
+    store = MoleculeStore(small_store.database_path, molecule_cache_size=2)
+
+    store.get_rmsd(force_field="openff-2.1.0", skip_check=True)
+
+    # keyed by mapped SMILES, so that a store rebuilt at the same path cannot be
+    # served another store's molecules
+    assert len(_analyze._MOLECULES) == 2
+    assert set(_analyze._MOLECULES._molecules) <= {
+        store.get_smiles_by_molecule_id(id) for id in store.get_molecule_ids()
+    }
+
+    MoleculeStore(small_store.database_path, molecule_cache_size=0).get_tfd(
+        force_field="openff-2.1.0",
+        skip_check=True,
+    )
+
+    assert len(_analyze._MOLECULES) == 0
+
+
+def test_descriptors(small_store):
+    molecule_ids = small_store.get_molecule_ids()
+
+    descriptors = small_store.get_descriptors()
+
+    assert descriptors.index.tolist() == molecule_ids
+    assert small_store._update_descriptors() == 0
+
+    for molecule_id, row in descriptors.iterrows():
+        molecule = Molecule.from_mapped_smiles(
+            small_store.get_smiles_by_molecule_id(molecule_id),
+            allow_undefined_stereo=True,
+        )
+
+        assert row["n_atoms"] == molecule.n_atoms
+        assert row["n_heavy_atoms"] == sum(
+            atom.atomic_number > 1 for atom in molecule.atoms
+        )
+        assert row["elements"] == ["C", "H"]
+
+
+def test_filter_by_descriptors(small_store):
+    molecule_ids = small_store.get_molecule_ids()
+    descriptors = small_store.get_descriptors()
+
+    # this store only has hydrocarbons
+    assert small_store.filter_by_descriptors(elements=["C", "H"]) == molecule_ids
+    assert small_store.filter_by_descriptors(elements=["C", "H", "O"]) == molecule_ids
+    assert small_store.filter_by_descriptors(elements=["C"]) == []
+
+    small = descriptors["n_heavy_atoms"] <= 6
+
+    assert small_store.filter_by_descriptors(n_heavy_atoms=(None, 6)) == sorted(
+        descriptors.index[small],
+    )
+
+    heavy_rings = (descriptors["n_rings"] == 1) & (
+        descriptors["molecular_weight"] >= 50
+    )
+
+    assert small_store.filter_by_descriptors(
+        n_rings=1,
+        molecular_weight=(50, None),
+    ) == sorted(descriptors.index[heavy_rings])
+
+    with pytest.raises(ValueError, match="Unknown descriptors"):
+        small_store.filter_by_descriptors(n_carbons=3)
+
+
+def test_pending_qm_conformers(small_store):
+    assert len(small_store._get_pending_qm_conformers("openff-2.1.0")) == 0
+
+    pending = small_store._get_pending_qm_conformers("openff-3.0.0")
+
+    assert len(pending) == sum(
+        len(small_store.get_qcarchive_ids_by_molecule_id(molecule_id))
+        for molecule_id in small_store.get_molecule_ids()
+    )
+
+    rows = list(small_store._iter_qm_conformers(pending, page_size=7))
+
+    assert [inchi_key for inchi_key, _ in rows] == [
+        inchi_key for _, inchi_key in pending
+    ]
+
+    for inchi_key, row in rows:
+        numpy.testing.assert_allclose(
+            row["coordinates"],
+            small_store.get_qm_conformer_by_qcarchive_id(row["qcarchive_id"]),
+        )
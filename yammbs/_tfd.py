@@ -0,0 +1,169 @@
+"""Native torsion fingerprint deviation (TFD), matching RDKit's TorsionFingerprints."""
+
+from typing import NamedTuple
+
+import numpy
+from openff.toolkit import Molecule
+
+from yammbs._internal_coordinates import _get_dihedrals
+from yammbs._rmsd import _get_graph_key
+
+# Torsion lists and weights of at most this many molecular graphs are kept per process
+_MAX_CACHED = 4096
+
+
+class _Torsions(NamedTuple):
+    """Torsions of a molecule, as found by `TorsionFingerprints.CalculateTorsionLists`."""
+
+    # (n_torsions, n_alternatives, 4) atoms of each symmetry-equivalent quartet of each
+    # non-ring torsion, padded by repeating the first
+    quartets: numpy.ndarray
+    # (n_rings, ring size, 4) atoms of each quartet around each ring, padded, and a
+    # mask of the quartets that are not padding
+    rings: numpy.ndarray
+    ring_mask: numpy.ndarray
+    # normalizations and weights of non-ring torsions, then of rings
+    max_deviations: numpy.ndarray
+    weights: numpy.ndarray
+
+
+_TORSIONS: dict[tuple, _Torsions] = dict()
+
+
+def _find_torsions(molecule: Molecule) -> _Torsions:
+    from rdkit.Chem import TorsionFingerprints
+
+    rdmol = molecule.to_rdkit()
+
+    torsions, rings = TorsionFingerprints.CalculateTorsionLists(rdmol)
+
+    if len(torsions) + len(rings) == 0:
+        # weights are not defined, and RDKit fails to find a central bond
+        weights = list()
+    else:
+        weights = TorsionFingerprints.CalculateTorsionWeights(rdmol)
+
+    if len(weights) != len(torsions) + len(rings):
+        raise ValueError("List of torsions angles and weights must have the same size.")
+
+    n_alternatives = max([len(quartets) for quartets, _ in torsions], default=1)
+    ring_size = max([len(quartets) for quartets, _ in rings], default=1)
+
+    return _Torsions(
+        quartets=numpy.array(
+            [
+                [*quartets, *[quartets[0]] * (n_alternatives - len(quartets))]
+                for quartets, _ in torsions
+            ],
+            dtype=int,
+        ).reshape(-1, n_alternatives, 4),
+        rings=numpy.array(
+            [
+                [*quartets, *[quartets[0]] * (ring_size - len(quartets))]
+                for quartets, _ in rings
+            ],
+            dtype=int,
+        ).reshape(-1, ring_size, 4),
+        ring_mask=numpy.array(
+            [numpy.arange(ring_size) < len(quartets) for quartets, _ in rings],
+            dtype=bool,
+        ).reshape(-1, ring_size),
+        max_deviations=numpy.array(
+            [max_deviation for _, max_deviation in [*torsions, *rings]],
+            dtype=float,
+        ),
+        weights=numpy.array(weights, dtype=float),
+    )
+
+
+def _get_torsions(molecule: Molecule) -> _Torsions:
+    """Return the torsions of a molecule, found once per molecular graph."""
+    key = _get_graph_key(molecule)
+
+    if key not in _TORSIONS:
+        if len(_TORSIONS) >= _MAX_CACHED:
+            _TORSIONS.pop(next(iter(_TORSIONS)))
+
+        _TORSIONS[key] = _find_torsions(molecule)
+
+    return _TORSIONS[key]
+
+
+def _get_torsion_angles(
+    torsions: _Torsions,
+    coordinates: numpy.ndarray,
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Return the angles [deg] of each alternative of each non-ring torsion, between 0 and 360,
+    and the mean absolute torsion around each ring, as RDKit's
+    `CalculateTorsionAngles`.
+    """
+    n_conformers = len(coordinates)
+
+    angles = numpy.degrees(
+        _get_dihedrals(coordinates, *torsions.quartets.reshape(-1, 4).T),
+    ).reshape(n_conformers, *torsions.quartets.shape[:2])
+
+    angles = numpy.where(angles < 0.0, angles + 360.0, angles)
+
+    ring_angles = numpy.abs(
+        numpy.degrees(
+            _get_dihedrals(coordinates, *torsions.rings.reshape(-1, 4).T),
+        ).reshape(n_conformers, *torsions.rings.shape[:2]),
+    )
+
+    ring_angles = numpy.sum(
+        numpy.where(torsions.ring_mask, ring_angles, 0.0),
+        axis=-1,
+    ) / torsions.ring_mask.sum(axis=-1)
+
+    return angles, ring_angles
+
+
+def _get_tfds(
+    molecule: Molecule,
+    references: numpy.ndarray,
+    targets: numpy.ndarray,
+) -> numpy.ndarray:
+    """
+    Return the TFD between each pair of conformers of shape (n_pairs, n_atoms, 3), as
+    `TorsionFingerprints.GetTFDBetweenMolecules` with its default arguments.
+
+    Torsions and their weights are found with RDKit once per molecular graph and
+    cached; angles and deviations are evaluated for all pairs at once. Molecules
+    without torsions, for which RDKit cannot weight torsions, have a TFD of zero.
+    """
+    references = numpy.asarray(references, dtype=float)
+    targets = numpy.asarray(targets, dtype=float)
+
+    torsions = _get_torsions(molecule)
+
+    if len(torsions.weights) == 0:
+        return numpy.zeros(len(targets))
+
+    reference_angles, reference_rings = _get_torsion_angles(torsions, references)
+    target_angles, target_rings = _get_torsion_angles(torsions, targets)
+
+    # smallest difference, in either direction, between any alternatives of a torsion
+    differences = numpy.abs(
+        reference_angles[..., :, None] - target_angles[..., None, :],
+    )
+    differences = numpy.minimum(differences, 360.0 - differences)
+
+    ring_differences = numpy.abs(reference_rings - target_rings)
+    ring_differences = numpy.minimum(ring_differences, 360.0 - ring_differences)
+
+    deviations = numpy.minimum(
+        numpy.concatenate(
+            [differences.min(axis=(-2, -1)), ring_differences],
+            axis=-1,
+        ),
+        180.0,
+    )
+
+    tfds = numpy.sum(deviations / torsions.max_deviations * torsions.weights, axis=-1)
+
+    if torsions.weights.sum() != 0:
+        tfds /= torsions.weights.sum()
+
+    return tfds
@@ -0,0 +1,162 @@
+"""Shared-memory transport of coordinates to and from minimization workers."""
+
+import time
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any
+
+import numpy
+
+from yammbs._minimize import MinimizationResult, _minimize
+
+# Per-worker views of the shared blocks, set by `_attach_shared_coordinates`
+_WORKER_STATE: dict[str, Any] = dict()
+
+
+class _SharedCoordinates:
+    """
+    Coordinates of every task packed into one shared memory block, with results written
+    back into a second block.
+
+    The input block holds all conformers as one (n_total_atoms, 3) float64 array. The
+    output block holds the minimized coordinates in the same layout, followed by one
+    energy and one wall time per task. Workers attach to both blocks once and are then
+    sent only task indices.
+    """
+
+    def __init__(
+        self,
+        rows: list[tuple[str, dict]],
+        force_field: str,
+    ):
+        self.force_field = force_field
+
+        self.inchi_keys = [inchi_key for inchi_key, _ in rows]
+        self.qcarchive_ids = [str(row["qcarchive_id"]) for _, row in rows]
+        self.mapped_smiles = [row["mapped_smiles"] for _, row in rows]
+
+        n_atoms = numpy.array([len(row["coordinates"]) for _, row in rows], dtype=int)
+
+        self.offsets = numpy.concatenate([[0], numpy.cumsum(n_atoms)])
+
+        n_total_atoms, n_tasks = int(self.offsets[-1]), len(rows)
+
+        self._input = SharedMemory(create=True, size=max(1, 8 * 3 * n_total_atoms))
+        self._output = SharedMemory(
+            create=True,
+            size=max(1, 8 * (3 * n_total_atoms + 2 * n_tasks)),
+        )
+
+        coordinates, _, _, _ = _views(self._input, self._output, self.offsets)
+
+        for index, (_, row) in enumerate(rows):
+            coordinates[self.offsets[index] : self.offsets[index + 1]] = row[
+                "coordinates"
+            ]
+
+    @property
+    def initargs(self) -> tuple:
+        return (
+            self._input.name,
+            self._output.name,
+            self.offsets,
+            self.mapped_smiles,
+            self.force_field,
+        )
+
+    def result(self, index: int) -> MinimizationResult:
+        """Build the result of a finished task from the output block."""
+        _, minimized, energies, elapsed = _views(
+            self._input,
+            self._output,
+            self.offsets,
+        )
+
+        # construct skips validation; the fields come straight from typed arrays
+        return MinimizationResult.construct(
+            inchi_key=self.inchi_keys[index],
+            qcarchive_id=self.qcarchive_ids[index],
+            force_field=self.force_field,
+            mapped_smiles=self.mapped_smiles[index],
+            coordinates=minimized[self.offsets[index] : self.offsets[index + 1]].copy(),
+            energy=float(energies[index]),
+            elapsed=float(elapsed[index]),
+        )
+
+    def close(self):
+        for block in (self._input, self._output):
+            block.close()
+            block.unlink()
+
+
+def _views(
+    input_block: SharedMemory,
+    output_block: SharedMemory,
+    offsets: numpy.ndarray,
+) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    n_total_atoms, n_tasks = int(offsets[-1]), len(offsets) - 1
+
+    coordinates = numpy.ndarray(
+        (n_total_atoms, 3),
+        dtype=numpy.float64,
+        buffer=input_block.buf,
+    )
+    minimized = numpy.ndarray(
+        (n_total_atoms, 3),
+        dtype=numpy.float64,
+        buffer=output_block.buf,
+    )
+    energies = numpy.ndarray(
+        (n_tasks,),
+        dtype=numpy.float64,
+        buffer=output_block.buf,
+        offset=8 * 3 * n_total_atoms,
+    )
+    elapsed = numpy.ndarray(
+        (n_tasks,),
+        dtype=numpy.float64,
+        buffer=output_block.buf,
+        offset=8 * (3 * n_total_atoms + n_tasks),
+    )
+
+    return coordinates, minimized, energies, elapsed
+
+
+def _attach_shared_coordinates(
+    input_name: str,
+    output_name: str,
+    offsets: numpy.ndarray,
+    mapped_smiles: list[str],
+    force_field: str,
+):
+    """Pool initializer that attaches a worker to the shared blocks."""
+    input_block = SharedMemory(name=input_name)
+    output_block = SharedMemory(name=output_name)
+
+    _WORKER_STATE.update(
+        blocks=(input_block, output_block),
+        views=_views(input_block, output_block, offsets),
+        offsets=offsets,
+        mapped_smiles=mapped_smiles,
+        force_field=force_field,
+    )
+
+
+def _run_openmm_shared(indices: list[int]) -> list[int]:
+    """Minimize the tasks at `indices`, writing results into the output block."""
+    coordinates, minimized, energies, elapsed = _WORKER_STATE["views"]
+    offsets = _WORKER_STATE["offsets"]
+
+    for index in indices:
+        start = time.perf_counter()
+
+        atoms = slice(offsets[index], offsets[index + 1])
+
+        minimized[atoms], energies[index] = _minimize(
+            mapped_smiles=_WORKER_STATE["mapped_smiles"][index],
+            force_field_name=_WORKER_STATE["force_field"],
+            positions=coordinates[atoms],
+        )
+
+        elapsed[index] = time.perf_counter() - start
+
+    return indices
@@ -0,0 +1,180 @@
+"""Calibration of process count, threads per process and chunk size for minimizations."""
+
+import logging
+import os
+import platform
+import time
+from contextlib import contextmanager
+from multiprocessing import Pool
+from typing import Iterator, NamedTuple, Optional
+
+from yammbs._minimize import MinimizationInput, _run_openmm_chunk
+
+LOGGER = logging.getLogger(__name__)
+
+_THREAD_VARIABLES = (
+    "OPENMM_CPU_THREADS",
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+)
+
+
+class TuningResult(NamedTuple):
+    """The configuration with the highest measured minimization throughput."""
+
+    n_processes: int
+    n_threads: int
+    chunksize: int
+    throughput: float
+
+
+def _get_host() -> str:
+    return platform.node()
+
+
+def _get_n_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _get_total_memory() -> int:
+    """Return the physical memory of this machine in bytes, or 0 if unknown."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def _get_peak_rss() -> int:
+    """Return the peak resident set size of this process in bytes, or 0 if unknown."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+@contextmanager
+def _limit_threads(n_threads: Optional[int]) -> Iterator[None]:
+    """
+    Limit the number of threads OpenMM and numerical libraries use in worker processes.
+
+    Environment variables are set in this process while the pool is created so that
+    they are inherited by workers, and are restored afterwards.
+    """
+    if n_threads is None:
+        yield
+        return
+
+    original = {key: os.environ.get(key) for key in _THREAD_VARIABLES}
+
+    try:
+        for key in _THREAD_VARIABLES:
+            os.environ[key] = str(n_threads)
+        yield
+    finally:
+        for key, value in original.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def _calibration_task(inputs: list[MinimizationInput]) -> int:
+    _run_openmm_chunk(inputs)
+
+    return _get_peak_rss()
+
+
+def _measure(
+    inputs: list[MinimizationInput],
+    n_processes: int,
+    n_threads: int,
+) -> tuple[float, int]:
+    """Return the throughput (conformers per second) and peak worker RSS (bytes)."""
+    with _limit_threads(n_threads):
+        with Pool(processes=n_processes) as pool:
+            start = time.perf_counter()
+
+            peak_rss = max(
+                pool.imap_unordered(
+                    _calibration_task,
+                    [[input] for input in inputs],
+                ),
+            )
+
+            elapsed = time.perf_counter() - start
+
+    return len(inputs) / elapsed, peak_rss
+
+
+def _calibrate(
+    inputs: list[MinimizationInput],
+    memory_budget: Optional[int] = None,
+    n_cpus: Optional[int] = None,
+) -> TuningResult:
+    """
+    Run a short benchmark of `inputs` and return the fastest configuration.
+
+    The number of processes is doubled until throughput stops improving, no CPUs are
+    left, or the measured memory per worker would exceed `memory_budget` (bytes,
+    defaults to 80% of physical memory). The best process count is then retried with
+    two threads per process in case the force field benefits from threading. The chunk
+    size is chosen so that each chunk takes roughly one second.
+    """
+    n_cpus = n_cpus or _get_n_cpus()
+
+    if memory_budget is None:
+        memory_budget = int(0.8 * _get_total_memory())
+
+    # Warm up caches (force field parsing, toolkit setup) in this process so that forked
+    # workers inherit them and they are not timed; this process's own peak RSS is then a
+    # conservative first estimate of the memory each worker needs
+    peak_rss = _calibration_task(inputs[:1])
+
+    best = TuningResult(n_processes=1, n_threads=1, chunksize=1, throughput=0.0)
+
+    n_processes = 1
+
+    while n_processes <= n_cpus:
+        if n_processes > 1 and memory_budget and peak_rss * n_processes > memory_budget:
+            LOGGER.info(
+                f"Not trying {n_processes} processes; each worker uses "
+                f"{peak_rss / 2**20:.0f} MiB and the budget is "
+                f"{memory_budget / 2**20:.0f} MiB",
+            )
+            break
+
+        throughput, rss = _measure(inputs, n_processes=n_processes, n_threads=1)
+        peak_rss = max(peak_rss, rss)
+
+        LOGGER.info(f"{n_processes} processes: {throughput:.2f} conformers/s")
+
+        if throughput < 1.05 * best.throughput:
+            break
+
+        best = best._replace(n_processes=n_processes, throughput=throughput)
+
+        n_processes *= 2
+
+    if 2 * best.n_processes <= n_cpus:
+        throughput, _ = _measure(inputs, n_processes=best.n_processes, n_threads=2)
+
+        LOGGER.info(
+            f"{best.n_processes} processes with 2 threads: "
+            f"{throughput:.2f} conformers/s",
+        )
+
+        if throughput > 1.05 * best.throughput:
+            best = best._replace(n_threads=2, throughput=throughput)
+
+    per_task = best.n_processes / best.throughput
+
+    return best._replace(chunksize=max(1, min(64, round(1.0 / per_task))))
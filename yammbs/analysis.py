@@ -1,3 +1,8 @@
+import abc
+import logging
+from collections.abc import MutableSequence
+from typing import ClassVar, Iterable
+
 import numpy
 import pandas
 from openff.toolkit import Molecule
@@ -6,6 +11,320 @@ from openff.units import Quantity, unit
 from yammbs._base.array import Array
 from yammbs._base.base import ImmutableModel
 
+LOGGER = logging.getLogger(__name__)
+
+# Bump a version when its implementation changes results, so that values stored with
+# MM conformers are recomputed rather than reused
+_METRIC_VERSIONS = {
+    "rmsd": 2,
+    "tfd": 2,
+    "icrmsd": 2,
+}
+
+_ICRMSD_NAMES = {
+    "Bond": "icrmsd_bond",
+    "Angle": "icrmsd_angle",
+    "Dihedral": "icrmsd_dihedral",
+    "Improper": "icrmsd_improper",
+}
+
+
+class _MetricCollection(MutableSequence, abc.ABC):
+    """
+    A list-like collection of results, one per QM conformer, stored as columns: the
+    QCArchive ids, codes of the force fields, and the values, in arrays that grow as
+    results are appended. Results are only made into models when accessed, without
+    validation, so each takes a few bytes rather than a Python object.
+
+    Collections support the methods of `list`, but are not `list` instances.
+    """
+
+    _model: ClassVar[type[ImmutableModel]]
+    _columns: ClassVar[tuple[str, ...]]
+
+    def __init__(self, results: Iterable[ImmutableModel] = ()):
+        self._qcarchive_ids = numpy.empty(0, dtype=numpy.int64)
+        self._force_field_codes = numpy.empty(0, dtype=numpy.int32)
+        self._values = numpy.empty((0, len(self._columns)), dtype=numpy.float64)
+        self._force_fields: list[str] = list()
+        self._size = 0
+
+        self.extend(results)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        qcarchive_ids: Iterable[int],
+        values: Iterable,
+        force_field: str,
+    ):
+        """
+        Make a collection of results from one force field from a column of QCArchive
+        ids and a column of values, or one column per value for multi-valued results,
+        without making models of each.
+        """
+        qcarchive_ids = numpy.array(qcarchive_ids, dtype=numpy.int64).reshape(-1)
+
+        collection = cls()
+
+        collection._force_fields = [force_field]
+        collection._set_columns(
+            qcarchive_ids,
+            numpy.zeros(len(qcarchive_ids), dtype=numpy.int32),
+            numpy.array(values, dtype=numpy.float64).reshape(
+                len(qcarchive_ids),
+                len(cls._columns),
+            ),
+        )
+
+        return collection
+
+    def _set_columns(
+        self,
+        qcarchive_ids: numpy.ndarray,
+        force_field_codes: numpy.ndarray,
+        values: numpy.ndarray,
+    ):
+        """Replace the contents of the collection, taking ownership of the arrays."""
+        self._qcarchive_ids = qcarchive_ids
+        self._force_field_codes = force_field_codes
+        self._values = values
+        self._size = len(qcarchive_ids)
+
+    def _get_columns(self) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        return (
+            self._qcarchive_ids[: self._size],
+            self._force_field_codes[: self._size],
+            self._values[: self._size],
+        )
+
+    @staticmethod
+    @abc.abstractmethod
+    def _get_row(result: ImmutableModel) -> tuple[float, ...]:
+        """Return the values of a result, one per column."""
+
+    @classmethod
+    @abc.abstractmethod
+    def _get_result(
+        cls,
+        qcarchive_id: int,
+        force_field: str,
+        row: numpy.ndarray,
+    ) -> ImmutableModel:
+        """Make a result from its QCArchive ID, force field and row of values."""
+
+    def _get_code(self, force_field: str) -> int:
+        if force_field not in self._force_fields:
+            self._force_fields.append(force_field)
+
+        return self._force_fields.index(force_field)
+
+    def _reserve(self, n_results: int):
+        """Grow the arrays, geometrically, to hold `n_results` more results."""
+        size = self._size + n_results
+
+        if size <= len(self._qcarchive_ids):
+            return
+
+        capacity = max(size, 2 * len(self._qcarchive_ids), 16)
+
+        for name in ("_qcarchive_ids", "_force_field_codes", "_values"):
+            array = getattr(self, name)
+            grown = numpy.empty((capacity, *array.shape[1:]), dtype=array.dtype)
+            grown[: self._size] = array[: self._size]
+
+            setattr(self, name, grown)
+
+    def append(self, result: ImmutableModel):
+        self.extend([result])
+
+    def insert(self, index: int, result: ImmutableModel):
+        index = min(max(index + self._size if index < 0 else index, 0), self._size)
+
+        qcarchive_ids, codes, values = self._get_columns()
+
+        self._set_columns(
+            numpy.insert(qcarchive_ids, index, result.qcarchive_id),
+            numpy.insert(codes, index, self._get_code(result.force_field)),
+            numpy.insert(values, index, self._get_row(result), axis=0),
+        )
+
+    def extend(self, results: Iterable[ImmutableModel]):
+        results = list(results)
+
+        self._reserve(len(results))
+
+        for index, result in enumerate(results, start=self._size):
+            self._qcarchive_ids[index] = result.qcarchive_id
+            self._force_field_codes[index] = self._get_code(result.force_field)
+            self._values[index] = self._get_row(result)
+
+        self._size += len(results)
+
+    def _get_column(self, name: str) -> numpy.ndarray:
+        """Return a read-only view of the filled part of a column."""
+        column = getattr(self, name)[: self._size].view()
+        column.flags.writeable = False
+
+        return column
+
+    @property
+    def qcarchive_ids(self) -> numpy.ndarray:
+        return self._get_column("_qcarchive_ids")
+
+    @property
+    def force_fields(self) -> numpy.ndarray:
+        return numpy.array(self._force_fields, dtype=object)[
+            self._get_column("_force_field_codes")
+        ]
+
+    @property
+    def values(self) -> numpy.ndarray:
+        return self._get_column("_values")
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            collection = type(self)()
+
+            collection._force_fields = list(self._force_fields)
+            collection._set_columns(
+                *(column[index].copy() for column in self._get_columns()),
+            )
+
+            return collection
+
+        index = range(self._size)[index]
+
+        return self._get_result(
+            int(self._qcarchive_ids[index]),
+            self._force_fields[self._force_field_codes[index]],
+            self._values[index],
+        )
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            results = list(self)
+            results[index] = list(value)
+
+            self._size = 0
+            self.extend(results)
+
+            return
+
+        index = range(self._size)[index]
+
+        self._qcarchive_ids[index] = value.qcarchive_id
+        self._force_field_codes[index] = self._get_code(value.force_field)
+        self._values[index] = self._get_row(value)
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice):
+            index = range(self._size)[index]
+
+        self._set_columns(
+            *(numpy.delete(column, index, axis=0) for column in self._get_columns()),
+        )
+
+    def __add__(self, other):
+        if not isinstance(other, (_MetricCollection, list)):
+            return NotImplemented
+
+        collection = self[:]
+        collection.extend(other)
+
+        return collection
+
+    def __radd__(self, other):
+        if not isinstance(other, list):
+            return NotImplemented
+
+        return type(self)([*other, *self])
+
+    def copy(self):
+        return self[:]
+
+    def sort(self, *, key=None, reverse: bool = False):
+        """Sort in place, as `list.sort`, with `key` called on each result."""
+        keys = list(self) if key is None else [key(result) for result in self]
+
+        order = sorted(range(self._size), key=keys.__getitem__, reverse=reverse)
+
+        self._set_columns(*(column[order] for column in self._get_columns()))
+
+    def reverse(self):
+        self._set_columns(*(column[::-1].copy() for column in self._get_columns()))
+
+    def __contains__(self, result) -> bool:
+        if not isinstance(result, self._model):
+            return False
+
+        if result.force_field not in self._force_fields:
+            return False
+
+        code = self._force_fields.index(result.force_field)
+        row = numpy.array(self._get_row(result), dtype=numpy.float64)
+
+        same_values = numpy.isclose(
+            self.values,
+            row,
+            rtol=0.0,
+            atol=0.0,
+            equal_nan=True,
+        )
+
+        matches = numpy.logical_and.reduce(
+            [
+                self.qcarchive_ids == result.qcarchive_id,
+                self._get_column("_force_field_codes") == code,
+                same_values.all(axis=-1),
+            ],
+        )
+
+        return bool(matches.any())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, _MetricCollection):
+            if type(self) is not type(other):
+                return False
+
+            return all(
+                [
+                    numpy.array_equal(self.qcarchive_ids, other.qcarchive_ids),
+                    numpy.array_equal(self.force_fields, other.force_fields),
+                    numpy.array_equal(self.values, other.values, equal_nan=True),
+                ],
+            )
+
+        if isinstance(other, list):
+            return list(self) == other
+
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)})"
+
+    def to_dataframe(self, copy: bool = True) -> pandas.DataFrame:
+        """
+        Return the results as a data frame indexed by QCArchive id.
+
+        With `copy=False`, the frame shares memory with the collection instead, and is
+        read-only where it does.
+        """
+        values = self.values
+
+        return pandas.DataFrame(
+            values.copy() if copy else values,
+            index=pandas.Index(self.qcarchive_ids, copy=copy),
+            columns=list(self._columns),
+            copy=False,
+        )
+
+    def to_csv(self, path: str):
+        self.to_dataframe(copy=False).to_csv(path)
+
 
 class DDE(ImmutableModel):
     qcarchive_id: int
@@ -13,16 +332,21 @@ class DDE(ImmutableModel):
     difference: float
 
 
-class DDECollection(list):
-    def to_dataframe(self) -> pandas.DataFrame:
-        return pandas.DataFrame(
-            [dde.difference for dde in self],
-            index=pandas.Index([dde.qcarchive_id for dde in self]),
-            columns=["difference"],
-        )
+class DDECollection(_MetricCollection):
+    _model = DDE
+    _columns = ("difference",)
 
-    def to_csv(self, path: str):
-        self.to_dataframe().to_csv(path)
+    @staticmethod
+    def _get_row(dde: DDE) -> tuple[float, ...]:
+        return (dde.difference,)
+
+    @classmethod
+    def _get_result(cls, qcarchive_id, force_field, row) -> DDE:
+        return DDE.construct(
+            qcarchive_id=qcarchive_id,
+            force_field=force_field,
+            difference=float(row[0]),
+        )
 
 
 class RMSD(ImmutableModel):
@@ -31,16 +355,21 @@ class RMSD(ImmutableModel):
     rmsd: float
 
 
-class RMSDCollection(list):
-    def to_dataframe(self) -> pandas.DataFrame:
-        return pandas.DataFrame(
-            [rmsd.rmsd for rmsd in self],
-            index=pandas.Index([rmsd.qcarchive_id for rmsd in self]),
-            columns=["rmsd"],
-        )
+class RMSDCollection(_MetricCollection):
+    _model = RMSD
+    _columns = ("rmsd",)
 
-    def to_csv(self, path: str):
-        self.to_dataframe().to_csv(path)
+    @staticmethod
+    def _get_row(rmsd: RMSD) -> tuple[float, ...]:
+        return (rmsd.rmsd,)
+
+    @classmethod
+    def _get_result(cls, qcarchive_id, force_field, row) -> RMSD:
+        return RMSD.construct(
+            qcarchive_id=qcarchive_id,
+            force_field=force_field,
+            rmsd=float(row[0]),
+        )
 
 
 class ICRMSD(ImmutableModel):
@@ -49,24 +378,51 @@ class ICRMSD(ImmutableModel):
     icrmsd: dict[str, float]
 
 
-class ICRMSDCollection(list):
-    def to_dataframe(self) -> pandas.DataFrame:
-        return pandas.DataFrame(
-            [
-                (
-                    icrmsd.icrmsd["Bond"],
-                    icrmsd.icrmsd["Angle"],
-                    icrmsd.icrmsd.get("Dihedral", pandas.NA),
-                    icrmsd.icrmsd.get("Improper", pandas.NA),
-                )
-                for icrmsd in self
-            ],
-            index=pandas.Index([rmsd.qcarchive_id for rmsd in self]),
-            columns=["Bond", "Angle", "Dihedral", "Improper"],
+class ICRMSDCollection(_MetricCollection):
+    """
+    Internal coordinate RMSDs, stored with NaN for types of internal coordinates a
+    molecule does not have.
+    """
+
+    _model = ICRMSD
+    _columns = ("Bond", "Angle", "Dihedral", "Improper")
+
+    @staticmethod
+    def _get_row(icrmsd: ICRMSD) -> tuple[float, ...]:
+        return tuple(
+            icrmsd.icrmsd.get(name, numpy.nan) for name in ICRMSDCollection._columns
         )
 
-    def to_csv(self, path: str):
-        self.to_dataframe().to_csv(path)
+    @classmethod
+    def _get_result(cls, qcarchive_id, force_field, row) -> ICRMSD:
+        return ICRMSD.construct(
+            qcarchive_id=qcarchive_id,
+            force_field=force_field,
+            icrmsd={
+                name: float(value)
+                for name, value in zip(cls._columns, row)
+                if not numpy.isnan(value)
+            },
+        )
+
+    def to_dataframe(self, copy: bool = True) -> pandas.DataFrame:
+        """
+        Return the results as a data frame indexed by QCArchive id, with types of
+        internal coordinates a molecule does not have missing (`pandas.NA`).
+
+        With `copy=False`, the frame shares memory with the collection instead, and is
+        read-only where it does.
+        """
+        values = self.values.copy() if copy else self.values
+
+        return pandas.DataFrame(
+            {
+                name: pandas.arrays.FloatingArray(column, numpy.isnan(column))
+                for name, column in zip(self._columns, values.T)
+            },
+            index=pandas.Index(self.qcarchive_ids, copy=copy),
+            copy=False,
+        )
 
 
 class TFD(ImmutableModel):
@@ -75,16 +431,21 @@ class TFD(ImmutableModel):
     tfd: float
 
 
-class TFDCollection(list):
-    def to_dataframe(self) -> pandas.DataFrame:
-        return pandas.DataFrame(
-            [tfd.tfd for tfd in self],
-            index=pandas.Index([tfd.qcarchive_id for tfd in self]),
-            columns=["tfd"],
-        )
+class TFDCollection(_MetricCollection):
+    _model = TFD
+    _columns = ("tfd",)
 
-    def to_csv(self, path: str):
-        self.to_dataframe().to_csv(path)
+    @staticmethod
+    def _get_row(tfd: TFD) -> tuple[float, ...]:
+        return (tfd.tfd,)
+
+    @classmethod
+    def _get_result(cls, qcarchive_id, force_field, row) -> TFD:
+        return TFD.construct(
+            qcarchive_id=qcarchive_id,
+            force_field=force_field,
+            tfd=float(row[0]),
+        )
 
 
 def get_rmsd(
@@ -92,7 +453,49 @@ def get_rmsd(
     reference: Array,
     target: Array,
 ) -> float:
-    """Compute the RMSD between two sets of coordinates."""
+    """
+    Compute the heavy atom RMSD between two sets of coordinates after optimal
+    superposition, minimized over symmetry-equivalent atom mappings.
+
+    This matches `oechem.OERMSD` with automorphisms, heavy atoms only and overlay, but
+    runs in NumPy with automorphisms cached per molecular graph.
+    """
+    return get_rmsds(molecule, [reference], [target])[0]
+
+
+def get_rmsds(
+    molecule: Molecule,
+    references: Iterable[Array],
+    targets: Iterable[Array],
+) -> list[float]:
+    """Compute the RMSDs, as in `get_rmsd`, between many pairs of conformers of one molecule."""
+    from yammbs._rmsd import _get_symmetric_rmsds
+
+    references = [
+        reference.m_as(unit.angstrom) if isinstance(reference, Quantity) else reference
+        for reference in references
+    ]
+    targets = [
+        target.m_as(unit.angstrom) if isinstance(target, Quantity) else target
+        for target in targets
+    ]
+
+    if len(references) == 0:
+        return list()
+
+    return _get_symmetric_rmsds(
+        molecule,
+        numpy.array(references),
+        numpy.array(targets),
+    ).tolist()
+
+
+def _get_openeye_rmsd(
+    molecule: Molecule,
+    reference: Array,
+    target: Array,
+) -> float:
+    """Compute the RMSD between two sets of coordinates with OpenEye, for comparison."""
     from openeye import oechem
     from openff.units import Quantity, unit
 
@@ -124,7 +527,35 @@ def get_internal_coordinate_rmsds(
     target: Array,
     _types: tuple[str] = ("Bond", "Angle", "Dihedral", "Improper"),
 ) -> dict[str, float]:
-    """Get internal coordinate RMSDs for one conformer of one molecule."""
+    """
+    Get internal coordinate RMSDs for one conformer of one molecule.
+
+    Internal coordinates are chosen as geomeTRIC chooses its primitive internal
+    coordinates, from the molecule's bonds, and evaluated with vectorized NumPy.
+    """
+    from yammbs._internal_coordinates import _get_internal_coordinate_rmsds
+
+    if isinstance(reference, Quantity):
+        reference = reference.m_as(unit.angstrom)
+
+    if isinstance(target, Quantity):
+        target = target.m_as(unit.angstrom)
+
+    return _get_internal_coordinate_rmsds(
+        molecule,
+        numpy.asarray(reference)[None],
+        numpy.asarray(target)[None],
+        _types,
+    )[0]
+
+
+def _get_geometric_internal_coordinate_rmsds(
+    molecule: Molecule,
+    reference: Array,
+    target: Array,
+    _types: tuple[str] = ("Bond", "Angle", "Dihedral", "Improper"),
+) -> dict[str, float]:
+    """Get internal coordinate RMSDs with geomeTRIC, for comparison."""
     from geometric.internal import (
         Angle,
         Dihedral,
@@ -211,6 +642,37 @@ def get_tfd(
     reference: Array,
     target: Array,
 ) -> float:
+    """
+    Compute the torsion fingerprint deviation (TFD) between two sets of coordinates.
+
+    This matches `TorsionFingerprints.GetTFDBetweenMolecules`, but torsions and their
+    weights are found once per molecular graph and angles are evaluated with NumPy.
+    Molecules without torsions have a TFD of zero.
+    """
+    from yammbs._tfd import _get_tfds
+
+    if isinstance(reference, Quantity):
+        reference = reference.m_as(unit.angstrom)
+
+    if isinstance(target, Quantity):
+        target = target.m_as(unit.angstrom)
+
+    return float(
+        _get_tfds(
+            molecule,
+            numpy.asarray(reference)[None],
+            numpy.asarray(target)[None],
+        )[0],
+    )
+
+
+def _get_rdkit_tfd(
+    molecule: Molecule,
+    reference: Array,
+    target: Array,
+) -> float:
+    """Compute the TFD between two sets of coordinates with RDKit, for comparison."""
+
     def _rdmol(
         molecule: Molecule,
         conformer: Array,
@@ -254,3 +716,64 @@ def get_tfd(
         _rdmol(molecule, reference),
         _rdmol(molecule, target),
     )
+
+
+def _get_metric_columns(metrics: Iterable[str]) -> list[str]:
+    """Return the names of the values each metric ("dde" or a geometric metric) gives."""
+    return [
+        name
+        for metric in metrics
+        for name in (_ICRMSD_NAMES.values() if metric == "icrmsd" else [metric])
+    ]
+
+
+def _get_metric_version(name: str) -> int:
+    """Return the implementation version of a metric, including flattened IC RMSDs."""
+    return _METRIC_VERSIONS["icrmsd" if name in _ICRMSD_NAMES.values() else name]
+
+
+def _compute_metrics(
+    molecule: Molecule,
+    reference: Array,
+    target: Array,
+    metrics: Iterable[str],
+) -> dict[str, float]:
+    """
+    Compute the named metrics (see `_METRIC_VERSIONS`) between a QM conformer and its
+    minimized MM conformer, both in Angstrom.
+
+    Internal coordinate RMSDs are flattened into one value per coordinate type, named
+    as in `_ICRMSD_NAMES`. As in the analyses, a TFD that cannot be computed is logged
+    and NaN, and other failures are raised.
+    """
+    metrics = tuple(metrics)
+
+    for metric in metrics:
+        if metric not in _METRIC_VERSIONS:
+            raise ValueError(f"Unknown metric {metric}")
+
+    values: dict[str, float] = dict()
+
+    for metric in metrics:
+        if metric == "rmsd":
+            values["rmsd"] = get_rmsd(molecule, reference, target)
+        elif metric == "tfd":
+            try:
+                values["tfd"] = get_tfd(molecule, reference, target)
+            except Exception as error:
+                LOGGER.warning(
+                    f"Computing TFD of {molecule.to_smiles()} failed with {error}",
+                )
+
+                values["tfd"] = numpy.nan
+        else:
+            values.update(
+                (_ICRMSD_NAMES[_type], value)
+                for _type, value in get_internal_coordinate_rmsds(
+                    molecule,
+                    reference,
+                    target,
+                ).items()
+            )
+
+    return values
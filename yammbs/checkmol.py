@@ -470,20 +470,15 @@ def analyze_functional_groups(smiles):
     import subprocess
     import tempfile
 
-    from openff.toolkit.topology import Molecule
+    special_case = _get_special_case(smiles)
 
-    if smiles == "O" or smiles == "[H]O[H]":
-        return {ChemicalEnvironment.Aqueous: 1}
-    if smiles == "N":
-        return {ChemicalEnvironment.Amine: 1}
+    if special_case is not None:
+        return special_case
 
     # Make sure the checkmol utility has been installed separately.
     _check_checkmol()
 
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore", category=AtomMappingWarning)
-
-        openff_molecule = Molecule.from_smiles(smiles, allow_undefined_stereo=True)
+    openff_molecule = _from_smiles(smiles)
 
     # Save the smile pattern out as an SDF file, ready to use as input to checkmol.
     with tempfile.NamedTemporaryFile(suffix=".sdf") as file:
@@ -501,12 +496,131 @@ def analyze_functional_groups(smiles):
 
     if result is None:
         return None
-    elif len(result) == 0:
+
+    return _parse_checkmol_output(result)
+
+
+def analyze_functional_groups_batch(smiles):
+    """Employs one checkmol process to determine which chemical moieties
+    are encoded by each of several smiles patterns.
+
+    The molecules are written to one multi-record SDF file, and checkmol's
+    output is split at the record separators (``$$$$``) it prints between
+    molecules. If the output cannot be attributed to the molecules this way,
+    each molecule is instead analyzed by ``analyze_functional_groups``.
+
+    Parameters
+    ----------
+    smiles: list of str
+        The smiles patterns to examine.
+
+    Returns
+    -------
+    list of (dict of ChemicalEnvironment and int, optional)
+        The groups found in each molecule, in the same order as `smiles`, as
+        returned by ``analyze_functional_groups``.
+    """
+    import re
+    import subprocess
+    import tempfile
+
+    results = [_get_special_case(pattern) for pattern in smiles]
+
+    pending = [index for index, result in enumerate(results) if result is None]
+
+    if len(pending) == 0:
+        return results
+
+    _check_checkmol()
+
+    with tempfile.NamedTemporaryFile(suffix=".sdf", mode="w+") as file:
+        for index in pending:
+            _from_smiles(smiles[index]).to_file(file, "SDF")
+
+        file.flush()
+
+        try:
+            output = subprocess.check_output(
+                ["checkmol", "-p", file.name],
+                stderr=subprocess.STDOUT,
+            ).decode()
+
+        except subprocess.CalledProcessError:
+            output = None
+
+    if len(pending) == 1:
+        records = [output]
+    elif output is not None and "$$$$" in output:
+        records = re.split(r"^\$\$\$\$[ \t]*$", output, flags=re.MULTILINE)
+
+        if len(records) == len(pending) + 1 and len(records[-1].strip()) == 0:
+            records = records[:-1]
+    else:
+        records = list()
+
+    if len(records) != len(pending):
+        return [analyze_functional_groups(pattern) for pattern in smiles]
+
+    for index, record in zip(pending, records):
+        results[index] = None if record is None else _parse_checkmol_output(record)
+
+    return results
+
+
+def classify_functional_groups(smiles):
+    """Determine which chemical moieties are encoded by a given smiles pattern
+    with SMARTS patterns of checkmol's functional groups, without checkmol.
+
+    All patterns are compiled once per process and matched with RDKit, so no
+    process is started per molecule. Groups are reported as by checkmol, along
+    with the more general groups that contain them.
+
+    Parameters
+    ----------
+    smiles: str
+        The smiles pattern to examine.
+
+    Returns
+    -------
+    dict of ChemicalEnvironment and int, optional
+        A dictionary where each key corresponds to a functional group, and
+        each value if the number of instances of that moiety. If the smiles
+        pattern cannot be parsed, returns None.
+    """
+    from yammbs._functional_groups import _classify_smiles
+
+    return _classify_smiles([smiles])[0]
+
+
+def _get_special_case(smiles):
+    """Return the groups of molecules checkmol is not run on, if `smiles` is one."""
+    if smiles == "O" or smiles == "[H]O[H]":
+        return {ChemicalEnvironment.Aqueous: 1}
+    if smiles == "N":
+        return {ChemicalEnvironment.Amine: 1}
+
+    return None
+
+
+def _from_smiles(smiles):
+    from openff.toolkit.topology import Molecule
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=AtomMappingWarning)
+
+        return Molecule.from_smiles(smiles, allow_undefined_stereo=True)
+
+
+def _parse_checkmol_output(result):
+    """Parse the output of ``checkmol -p`` for one molecule."""
+    lines = [line for line in result.splitlines() if len(line.strip()) > 0]
+
+    if len(lines) == 0:
         return {ChemicalEnvironment.Alkane: 1}
 
     groups = {}
 
-    for group in result.splitlines():
+    for group in lines:
         group_code, group_count, _ = group.split(":")
 
         group_environment = checkmol_code_to_environment(group_code[1:])
@@ -0,0 +1,416 @@
+"""
+Executors that minimizations and analyses can be dispatched through.
+
+Anything implementing `concurrent.futures.Executor` can be passed as `executor` to
+`MoleculeStore.optimize_mm` and the `MoleculeStore.get_*` analyses, as can one of these
+names:
+
+- "serial": run every task in this process, for debugging
+- "threads": a `concurrent.futures.ThreadPoolExecutor`
+- "fork", "spawn" or "forkserver": a `concurrent.futures.ProcessPoolExecutor` using
+  that start method
+- "subprocess": a `FileQueueExecutor` over a temporary directory with local workers
+"""
+
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+
+from yammbs._types import Pathlike
+
+LOGGER = logging.getLogger(__name__)
+
+_STOP = "STOP"
+
+
+class SerialExecutor(Executor):
+    """Run each task in this process as soon as it is submitted."""
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future: Future = Future()
+
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+
+        return future
+
+
+class FileQueueExecutor(Executor):
+    """
+    Exchange pickled tasks and results with workers through files in a directory.
+
+    Workers are started with `python -m yammbs.executors DIRECTORY`, either by this
+    executor (`n_workers` of them, on this machine) or by a batch scheduler on any
+    machine that shares the filesystem. Each task is claimed by exactly one worker
+    through an atomic rename. Workers are fresh interpreters that import only the
+    functions they are sent, so scripts using this executor do not need an
+    `if __name__ == "__main__"` guard or `multiprocessing.freeze_support()`.
+
+    Parameters
+    ----------
+    directory
+        The queue directory. A temporary directory, removed on shutdown, is used if not
+        given.
+    n_workers
+        The number of workers to start on this machine.
+    poll_interval
+        How often [s] workers look for tasks and this executor looks for results.
+    claim_timeout
+        How long [s] a claimed task may go without its worker refreshing the claim
+        before it is put back in the queue for another worker, as when its worker was
+        killed. Workers refresh claims every poll interval. None never re-queues tasks.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Pathlike] = None,
+        n_workers: int = 0,
+        poll_interval: float = 0.2,
+        claim_timeout: Optional[float] = 60.0,
+    ):
+        self._owns_directory = directory is None
+
+        self.directory = (
+            tempfile.mkdtemp(prefix="yammbs-queue-")
+            if directory is None
+            else os.fspath(directory)
+        )
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+
+        for subdirectory in ("tasks", "claimed", "results"):
+            os.makedirs(os.path.join(self.directory, subdirectory), exist_ok=True)
+
+        self._futures: dict[str, Future] = dict()
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._shutdown = False
+
+        self._workers = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "yammbs.executors",
+                    self.directory,
+                    str(poll_interval),
+                ],
+            )
+            for _ in range(n_workers)
+        ]
+
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit tasks after shutdown")
+
+            # zero-padded so that workers take tasks in submission order
+            task_id = f"{self._counter:012d}-{uuid.uuid4().hex[:8]}"
+            self._counter += 1
+
+            future: Future = Future()
+            self._futures[task_id] = future
+
+        _write_atomically(
+            os.path.join(self.directory, "tasks", f"{task_id}.pkl"),
+            (fn, args, kwargs),
+        )
+
+        return future
+
+    def _collect(self):
+        results = os.path.join(self.directory, "results")
+
+        while True:
+            with self._lock:
+                if self._shutdown and not self._futures:
+                    return
+
+            for name in sorted(os.listdir(results)):
+                if not name.endswith(".pkl"):
+                    continue
+
+                path = os.path.join(results, name)
+
+                try:
+                    with open(path, "rb") as file:
+                        succeeded, payload = pickle.load(file)
+                except Exception as error:
+                    succeeded, payload = False, RuntimeError(
+                        f"Could not read result of {name}: {error}",
+                    )
+
+                os.remove(path)
+
+                with self._lock:
+                    future = self._futures.pop(name[: -len(".pkl")], None)
+
+                if future is None:
+                    continue
+
+                if succeeded:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(payload)
+
+            if self.claim_timeout is not None:
+                self._requeue_stale_claims()
+
+            if self._workers and all(
+                worker.poll() is not None for worker in self._workers
+            ):
+                self._fail_pending(RuntimeError("all local workers exited"))
+
+            time.sleep(self.poll_interval)
+
+    def _requeue_stale_claims(self):
+        """Put tasks whose workers stopped refreshing their claims back in the queue."""
+        claimed = os.path.join(self.directory, "claimed")
+
+        for name in os.listdir(claimed):
+            path = os.path.join(claimed, name)
+
+            try:
+                age = time.time() - os.path.getmtime(path)
+            except FileNotFoundError:
+                # finished meanwhile
+                continue
+
+            if age < self.claim_timeout:
+                continue
+
+            # claims are named {task_id}.pkl.{worker pid}
+            task = name.rsplit(".", 1)[0]
+
+            LOGGER.warning(
+                f"Re-queueing task {task}, whose worker has not refreshed its claim "
+                f"in {age:.0f} s",
+            )
+
+            try:
+                os.rename(path, os.path.join(self.directory, "tasks", task))
+            except FileNotFoundError:
+                continue
+
+    def _fail_pending(self, error: Exception):
+        with self._lock:
+            futures, self._futures = self._futures, dict()
+
+        for future in futures.values():
+            future.set_exception(error)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            self._shutdown = True
+
+            if cancel_futures:
+                for future in self._futures.values():
+                    future.cancel()
+
+                self._futures = {
+                    task_id: future
+                    for task_id, future in self._futures.items()
+                    if not future.cancelled()
+                }
+
+        if wait:
+            self._collector.join()
+
+        if self._workers:
+            open(os.path.join(self.directory, _STOP), "w").close()
+
+            for worker in self._workers:
+                worker.wait()
+
+        if wait and self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _write_atomically(path: str, obj: Any):
+    """Pickle `obj` to `path` so that readers never see a partly written file."""
+    with open(f"{path}.tmp", "wb") as file:
+        pickle.dump(obj, file)
+
+    os.replace(f"{path}.tmp", path)
+
+
+def _refresh_claim(path: str, interval: float, stop: threading.Event):
+    """Refresh the modification time of a claimed task until `stop` is set."""
+    while not stop.wait(interval):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+
+
+def _work(directory: str, poll_interval: float = 0.2):
+    """Run tasks from a `FileQueueExecutor` directory until it is stopped."""
+    tasks = os.path.join(directory, "tasks")
+
+    while not os.path.exists(os.path.join(directory, _STOP)):
+        names = sorted(name for name in os.listdir(tasks) if name.endswith(".pkl"))
+
+        if not names:
+            time.sleep(poll_interval)
+            continue
+
+        for name in names:
+            claimed = os.path.join(directory, "claimed", f"{name}.{os.getpid()}")
+
+            try:
+                os.rename(os.path.join(tasks, name), claimed)
+            except FileNotFoundError:
+                # taken by another worker
+                continue
+
+            # the modification time of the claim shows the executor this worker is alive
+            os.utime(claimed)
+
+            stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=_refresh_claim,
+                args=(claimed, poll_interval, stop),
+                daemon=True,
+            )
+            heartbeat.start()
+
+            try:
+                with open(claimed, "rb") as file:
+                    fn, args, kwargs = pickle.load(file)
+
+                result = (True, fn(*args, **kwargs))
+            except Exception as error:
+                result = (False, error)
+            finally:
+                stop.set()
+                heartbeat.join()
+
+            path = os.path.join(directory, "results", name)
+
+            try:
+                _write_atomically(path, result)
+            except Exception as error:
+                _write_atomically(
+                    path,
+                    (
+                        False,
+                        RuntimeError(f"Could not return result of {name}: {error}"),
+                    ),
+                )
+
+            try:
+                os.remove(claimed)
+            except FileNotFoundError:
+                # re-queued by the executor while this worker was slow to refresh it
+                pass
+
+            # look for newer tasks, and for the stop file, between tasks
+            break
+
+
+def _get_executor(executor: Union[Executor, str], n_processes: int) -> Executor:
+    if isinstance(executor, Executor):
+        return executor
+
+    if executor == "serial":
+        return SerialExecutor()
+
+    if executor == "threads":
+        return ThreadPoolExecutor(max_workers=n_processes)
+
+    if executor in ("fork", "spawn", "forkserver"):
+        return ProcessPoolExecutor(
+            max_workers=n_processes,
+            mp_context=multiprocessing.get_context(executor),
+        )
+
+    if executor == "subprocess":
+        return FileQueueExecutor(n_workers=n_processes)
+
+    raise ValueError(f"Unknown executor {executor!r}")
+
+
+def _default_executor() -> Optional[str]:
+    """
+    Return "subprocess" where `multiprocessing` does not fork by default, and None (use
+    a `multiprocessing.Pool`) where it does.
+
+    Pools that spawn workers re-import the calling script in each of them, which then
+    needs a `__main__` guard and `freeze_support()`; fresh interpreters do not.
+    """
+    if multiprocessing.get_start_method() == "fork":
+        return None
+
+    return "subprocess"
+
+
+class _ExecutorPool:
+    """
+    Adapt an executor to the subset of the `multiprocessing.Pool` interface used for
+    minimizations.
+
+    At most `max_in_flight` tasks are submitted at once, so that `iterable` is consumed
+    lazily. Executors created here from a name are shut down on exit; executors passed
+    in are left running for the caller to reuse.
+    """
+
+    def __init__(
+        self,
+        executor: Union[Executor, str],
+        n_processes: int,
+        max_in_flight: Optional[int] = None,
+    ):
+        self._owned = not isinstance(executor, Executor)
+        self.executor = _get_executor(executor, n_processes)
+        self.max_in_flight = max_in_flight or 2 * max(1, n_processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self._owned:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def imap_unordered(self, func: Callable, iterable: Iterable) -> Iterator:
+        pending: set[Future] = set()
+
+        for argument in iterable:
+            pending.add(self.executor.submit(func, argument))
+
+            if len(pending) < self.max_in_flight:
+                continue
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            yield from (future.result() for future in done)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            yield from (future.result() for future in done)
+
+
+if __name__ == "__main__":
+    _work(sys.argv[1], *map(float, sys.argv[2:3]))
@@ -0,0 +1,99 @@
+"""Selections of molecules in a store, combined with set algebra over bitmaps."""
+
+import zlib
+from typing import Iterable, Union
+
+import numpy
+
+
+class MoleculeSelection(list):
+    """
+    A sorted list of molecule ids, backed by a bitmap indexed by molecule id.
+
+    Selections can be passed as `molecule_ids` to any analysis, and combined with
+    `&` (and), `|` (or), `-` (and not) and `~` (not), where "not" is relative to all
+    molecules in the store the selection was made from. Plain lists of ids can be
+    combined with selections too. Membership tests are constant time.
+    """
+
+    def __init__(self, bits: numpy.ndarray, universe: numpy.ndarray):
+        self.bits = numpy.asarray(bits, dtype=bool)
+        self.universe = numpy.asarray(universe, dtype=bool)
+
+        super().__init__(numpy.flatnonzero(self.bits).tolist())
+
+    @classmethod
+    def from_ids(
+        cls,
+        molecule_ids: Iterable[int],
+        universe: numpy.ndarray,
+    ) -> "MoleculeSelection":
+        molecule_ids = numpy.fromiter(molecule_ids, dtype=int)
+
+        bits = numpy.zeros(
+            max(len(universe), molecule_ids.max(initial=-1) + 1),
+            dtype=bool,
+        )
+        bits[molecule_ids] = True
+
+        return cls(bits, universe)
+
+    def _coerce(
+        self,
+        other: Union["MoleculeSelection", Iterable[int]],
+    ) -> "MoleculeSelection":
+        if isinstance(other, MoleculeSelection):
+            return other
+
+        return MoleculeSelection.from_ids(other, self.universe)
+
+    @staticmethod
+    def _align(*arrays: numpy.ndarray) -> list[numpy.ndarray]:
+        size = max(len(array) for array in arrays)
+
+        return [numpy.pad(array, (0, size - len(array))) for array in arrays]
+
+    def __and__(self, other) -> "MoleculeSelection":
+        other = self._coerce(other)
+        bits, other_bits, universe = self._align(self.bits, other.bits, self.universe)
+
+        return MoleculeSelection(bits & other_bits, universe)
+
+    def __or__(self, other) -> "MoleculeSelection":
+        other = self._coerce(other)
+        bits, other_bits, universe = self._align(self.bits, other.bits, self.universe)
+
+        return MoleculeSelection(bits | other_bits, universe)
+
+    def __sub__(self, other) -> "MoleculeSelection":
+        other = self._coerce(other)
+        bits, other_bits, universe = self._align(self.bits, other.bits, self.universe)
+
+        return MoleculeSelection(bits & ~other_bits, universe)
+
+    def __invert__(self) -> "MoleculeSelection":
+        bits, universe = self._align(self.bits, self.universe)
+
+        return MoleculeSelection(universe & ~bits, universe)
+
+    __rand__ = __and__
+    __ror__ = __or__
+
+    def __rsub__(self, other) -> "MoleculeSelection":
+        return self._coerce(other) - self
+
+    def __contains__(self, molecule_id) -> bool:
+        return 0 <= molecule_id < len(self.bits) and bool(self.bits[molecule_id])
+
+    def __repr__(self) -> str:
+        return f"MoleculeSelection({list(self)})"
+
+
+def _compress(bits: numpy.ndarray) -> bytes:
+    return zlib.compress(numpy.packbits(bits).tobytes())
+
+
+def _decompress(data: bytes, size: int) -> numpy.ndarray:
+    packed = numpy.frombuffer(zlib.decompress(data), dtype=numpy.uint8)
+
+    return numpy.unpackbits(packed, count=size).astype(bool)